@@ -0,0 +1,93 @@
+"""
+Scaling test of the BVH tree construction and nearest neighbor,
+k nearest neighbor and radius queries on the CPU, compared with
+scipy's cKDTree.
+
+Usage:
+
+    python bvh_cpu_speed_test_example.py [max_log10_n] [numthreads]
+
+The default is to go up to 1e7 points. Going to 1e8 points
+(max_log10_n = 8) requires about 20 GB of memory.
+"""
+import sys
+import paicos as pa
+import numpy as np
+from time import perf_counter
+from scipy.spatial import cKDTree
+from paicos.trees.bvh_cpu import BinaryTree
+
+max_log10_n = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+if len(sys.argv) > 2:
+    pa.numthreads(int(sys.argv[2]))
+
+print(f'Using {pa.settings.numthreads} threads')
+
+rng = np.random.default_rng(seed=42)
+
+# Compile the numba functions before timing
+tree = BinaryTree(rng.random((1000, 3)), 0.01 * np.ones(1000))
+tree.nearest_neighbor(rng.random((10, 3)))
+tree.query_knn(rng.random((10, 3)), 4)
+tree.query_ball(rng.random((10, 3)), 0.1)
+
+n_queries = 10**6
+
+for log10_n in range(5, max_log10_n + 1):
+    n = 10**log10_n
+    pos = rng.random((n, 3))
+    # Typical cell size for uniformly distributed points
+    sizes = 2 * np.ones(n) / n**(1 / 3)
+
+    tic = perf_counter()
+    tree = BinaryTree(pos, sizes)
+    toc = perf_counter()
+    time_construction = toc - tic
+
+    query_points = rng.random((n_queries, 3))
+    tic = perf_counter()
+    tree.nearest_neighbor(query_points, workers=pa.settings.numthreads)
+    toc = perf_counter()
+    time_query = toc - tic
+
+    tic = perf_counter()
+    kd_tree = cKDTree(pos)
+    toc = perf_counter()
+    time_construction_kd = toc - tic
+
+    tic = perf_counter()
+    kd_tree.query(query_points, workers=pa.settings.numthreads)
+    toc = perf_counter()
+    time_query_kd = toc - tic
+
+    # 32 nearest neighbors and radius queries (with about 32 neighbors)
+    # for 1e5 query points
+    k = 32
+    r = (3 * k / (4 * np.pi * n))**(1 / 3)
+    query_points = query_points[:10**5]
+
+    tic = perf_counter()
+    tree.query_knn(query_points, k, workers=pa.settings.numthreads)
+    toc = perf_counter()
+    time_knn = toc - tic
+
+    tic = perf_counter()
+    kd_tree.query(query_points, k, workers=pa.settings.numthreads)
+    toc = perf_counter()
+    time_knn_kd = toc - tic
+
+    tic = perf_counter()
+    tree.query_ball(query_points, r, workers=pa.settings.numthreads)
+    toc = perf_counter()
+    time_ball = toc - tic
+
+    tic = perf_counter()
+    kd_tree.query_ball_point(query_points, r, workers=pa.settings.numthreads)
+    toc = perf_counter()
+    time_ball_kd = toc - tic
+
+    print(f'n = 1e{log10_n} (time in seconds, cKDTree in parenthesis):')
+    print(f'\tconstruction: {time_construction:.2f} ({time_construction_kd:.2f})')
+    print(f'\t1e6 nearest neighbor queries: {time_query:.2f} ({time_query_kd:.2f})')
+    print(f'\t1e5 {k}-nearest neighbor queries: {time_knn:.2f} ({time_knn_kd:.2f})')
+    print(f'\t1e5 radius queries: {time_ball:.2f} ({time_ball_kd:.2f})')
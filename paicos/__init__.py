@@ -29,24 +29,32 @@ from .util import root_dir
 # HDF5 file readers
 from .readers.arepo_snap import Snapshot
 from .readers.arepo_catalog import Catalog
-from .readers.paicos_readers import PaicosReader, ImageReader, Histogram2DReader
+from .readers.paicos_readers import PaicosReader, ImageReader, Histogram2DReader, HistogramNDReader
 from .readers.generic_snap import GenericSnapshot
 
 
 # HDF5 file writers
 from .writers.paicos_writer import PaicosWriter, PaicosTimeSeriesWriter
 from .writers.arepo_image import ImageWriter, ArepoImage
+from .writers.image_pyramid import ImagePyramid
 
 # Image creators
 from .image_creators.image_creator import ImageCreator
 from .image_creators.projector import Projector
 from .image_creators.nested_projector import NestedProjector
+from .image_creators.multi_view_projector import MultiViewProjector
+from .image_creators.batch_projector import BatchProjector
 from .image_creators.tree_projector import TreeProjector
 from .image_creators.slicer import Slicer
+from .image_creators.cpu_ray_projector import CpuRayProjector
+from .image_creators.cpu_volume_renderer import CpuVolumeRenderer, TransferFunction
+from .image_creators.movie_renderer import MovieRenderer
 
 # Histograms
 from .histograms.histogram import Histogram
 from .histograms.histogram2D import Histogram2D
+from .histograms.histogramND import HistogramND
+from .histograms.accumulators import HistogramAccumulator, Histogram2DAccumulator
 
 # Derived variables
 from .derived_variables import derived_variables
@@ -2,6 +2,8 @@ from cython.parallel import prange
 cimport openmp
 import numpy as np
 cimport numpy as np
+from libc.stdlib cimport calloc, realloc, free
+from libc.string cimport memcpy
 
 ctypedef fused real_t:
     float
@@ -381,3 +383,163 @@ def get_radial_range_plus_thin_layer(real_t [:, :] pos, real_t xc, real_t yc,
     tmp = np.zeros(Np, dtype=np.bool_)
     tmp[:] = index[:]
     return tmp
+
+
+# Selection functions which return compacted (int64) indices instead of
+# a boolean mask. The points are split into one contiguous chunk per
+# thread. Each thread appends the indices of its selected points to a
+# (growing) buffer, the buffer sizes are turned into offsets (a prefix
+# sum), and the buffers are then copied into the output array in parallel.
+# The indices are therefore sorted, i.e. identical to np.flatnonzero of
+# the boolean mask, and no array with the length of pos is created.
+
+cdef inline bint _in_box(double x, double y, double z,
+                         double sidelength_x, double sidelength_y,
+                         double sidelength_z) nogil:
+    return ((x < sidelength_x/2.0) and (x > -sidelength_x/2.0)
+            and (y < sidelength_y/2.0) and (y > -sidelength_y/2.0)
+            and (z > -sidelength_z/2.0) and (z < sidelength_z/2.0))
+
+
+cdef inline bint _in_shell(double x, double y, double z,
+                           double r2_min, double r2_max) nogil:
+    cdef double r2 = x*x + y*y + z*z
+    return (r2 < r2_max) and (r2 > r2_min)
+
+
+cdef inline bint _in_region(double xp, double yp, double zp, double* params,
+                            int region_type) nogil:
+    """
+    Check if the point (xp, yp, zp) is inside the region described by params =
+
+    region_type 0 (box): (xc, yc, zc, sidelength_x, sidelength_y, sidelength_z)
+
+    region_type 1 (rotated box): as for the box followed by the unit vectors
+        (unit_vector_x, unit_vector_y, unit_vector_z)
+
+    region_type 2 (spherical shell): (xc, yc, zc, r_min**2, r_max**2)
+    """
+    cdef double x = xp - params[0]
+    cdef double y = yp - params[1]
+    cdef double z = zp - params[2]
+    cdef double x_dot_ex, x_dot_ey, x_dot_ez
+
+    if region_type == 0:
+        return _in_box(x, y, z, params[3], params[4], params[5])
+    elif region_type == 1:
+        x_dot_ex = x * params[6] + y * params[7] + z * params[8]
+        x_dot_ey = x * params[9] + y * params[10] + z * params[11]
+        x_dot_ez = x * params[12] + y * params[13] + z * params[14]
+        return _in_box(x_dot_ex, x_dot_ey, x_dot_ez,
+                       params[3], params[4], params[5])
+    else:
+        return _in_shell(x, y, z, params[3], params[4])
+
+
+cdef inline int _append(np.int64_t** buf, long* size, long* cap,
+                        long value) nogil:
+    """
+    Append a value to a buffer, doubling its capacity when it is full.
+    Returns 1 if memory could not be allocated.
+    """
+    cdef np.int64_t* new_buf
+    if size[0] == cap[0]:
+        new_buf = <np.int64_t*> realloc(buf[0], 2 * (cap[0] + 512) * sizeof(np.int64_t))
+        if new_buf == NULL:
+            return 1
+        buf[0] = new_buf
+        cap[0] = 2 * (cap[0] + 512)
+    buf[0][size[0]] = value
+    size[0] += 1
+    return 0
+
+
+def get_ids_in_regions(real_t[:, :] pos, double[:, ::1] params, int region_type,
+                       int numthreads):
+    """
+    This is a cython implementation of a selection function, which finds the
+    indices of the points inside K regions in a single pass over the points.
+
+    Users should not use this low-level function but instead use e.g.
+    paicos.util.get_ids_of_cubic_region or paicos.util.get_ids_of_cubic_regions
+
+    Parameters:
+        pos (array, (N,3)): positions
+        params (array, (K, n_params)): the parameters of each region,
+                                       see _in_region
+        region_type (int): 0 for boxes, 1 for rotated boxes and
+                           2 for spherical shells
+        numthreads (int): number of openmp threads to use
+
+    Returns:
+        offsets (array, (K + 1)): the indices of the points in region k are
+                                  ids[offsets[k]:offsets[k + 1]]
+        ids (int64 array): the (sorted) indices of the points in each region
+    """
+
+    cdef long Np = pos.shape[0]
+    cdef int K = params.shape[0]
+    cdef int nchunks = numthreads
+    cdef long chunk_size = (Np + nchunks - 1) // nchunks
+    cdef long ip, ip_start, ip_end, total
+    cdef int ichunk, k, ibuf
+    cdef int failed = 0
+
+    # One buffer for each region and chunk of points
+    cdef int nbuf = nchunks * K
+    cdef np.int64_t** bufs = <np.int64_t**> calloc(nbuf, sizeof(np.int64_t*))
+    cdef long* sizes = <long*> calloc(nbuf, sizeof(long))
+    cdef long* caps = <long*> calloc(nbuf, sizeof(long))
+    cdef long[:] buf_offsets = np.zeros(nbuf, dtype=np.int_)
+    cdef np.int64_t[:] ids
+
+    if bufs == NULL or sizes == NULL or caps == NULL:
+        free(bufs)
+        free(sizes)
+        free(caps)
+        raise MemoryError()
+
+    openmp.omp_set_num_threads(numthreads)
+
+    try:
+        # Find the indices
+        for ichunk in prange(nchunks, nogil=True, schedule='static', chunksize=1):
+            ip_start = ichunk * chunk_size
+            ip_end = min(ip_start + chunk_size, Np)
+            for ip in range(ip_start, ip_end):
+                for k in range(K):
+                    if _in_region(pos[ip, 0], pos[ip, 1], pos[ip, 2], &params[k, 0],
+                                  region_type):
+                        ibuf = k * nchunks + ichunk
+                        failed += _append(&bufs[ibuf], &sizes[ibuf], &caps[ibuf], ip)
+
+        if failed:
+            raise MemoryError()
+
+        # Prefix sum (ordered by region and then by chunk)
+        offsets = np.zeros(K + 1, dtype=np.int64)
+        total = 0
+        for k in range(K):
+            offsets[k] = total
+            for ichunk in range(nchunks):
+                ibuf = k * nchunks + ichunk
+                buf_offsets[ibuf] = total
+                total += sizes[ibuf]
+        offsets[K] = total
+
+        ids = np.empty(total, dtype=np.int64)
+
+        # Copy the buffers into the output array
+        if total > 0:
+            for ibuf in prange(nbuf, nogil=True, schedule='static', chunksize=1):
+                if sizes[ibuf] > 0:
+                    memcpy(&ids[buf_offsets[ibuf]], bufs[ibuf],
+                           sizes[ibuf] * sizeof(np.int64_t))
+    finally:
+        for ibuf in range(nbuf):
+            free(bufs[ibuf])
+        free(bufs)
+        free(sizes)
+        free(caps)
+
+    return offsets, np.asarray(ids)
@@ -1,6 +1,7 @@
 import numpy as np
 cimport numpy as np
 from libc.math cimport log10
+from libc.stdlib cimport malloc, free
 
 from cython.parallel import prange, parallel
 cimport openmp
@@ -13,15 +14,34 @@ ctypedef fused real_t:
     np.float64_t
 
 
+# Bin indices, int32 from the digitize functions in this module
+# or int64 from np.digitize
+ctypedef fused index_t:
+    np.int32_t
+    np.int64_t
+
+
 def get_hist_from_weights_and_idigit(int num_bins, real_t[:] weights,
-                                     long[:] i_digit):
+                                     index_t[:] i_digit, int numthreads=1):
     """
     This is a cython helper function for calculating 1D histograms.
+
+    Parameters:
+
+        num_bins (int): The number of bin edges.
+
+        weights (array): The weights of the data.
+
+        i_digit (int32 or int64 array): The bin indices, as returned by
+                                        digitize_uniform (int32) or
+                                        np.digitize (int64).
     """
 
+    assert numthreads == 1, 'use get_hist_from_weights_and_idigit_omp for more than one thread'
+
     cdef int Np = weights.shape[0]
 
-    cdef real_t[:] hist = np.zeros(num_bins+1, dtype=np.float64)
+    cdef double[:] hist = np.zeros(num_bins+1, dtype=np.float64)
 
     cdef int ip, ib
     for ip in range(Np):
@@ -34,6 +54,521 @@ def get_hist_from_weights_and_idigit(int num_bins, real_t[:] weights,
     return tmp
 
 
+def get_hist_from_weights_and_idigit_omp(int num_bins, real_t[:] weights,
+                                         index_t[:] i_digit, int numthreads=1):
+    """
+    This is a cython helper function for calculating 1D histograms using
+    openmp. Each thread adds up the weights in its own histogram, and the
+    histograms of the threads are added up in the end.
+
+    Parameters:
+
+        num_bins (int): The number of bin edges.
+
+        weights (array): The weights of the data.
+
+        i_digit (int32 or int64 array): The bin indices, as returned by
+                                        digitize_uniform (int32) or
+                                        np.digitize (int64).
+
+        numthreads (int): The number of threads.
+    """
+
+    cdef int Np = weights.shape[0]
+
+    cdef double[:, ::1] tmp_hist = np.zeros((numthreads, num_bins+1),
+                                            dtype=np.float64)
+
+    cdef int ip, ib, threadnum
+
+    with nogil, parallel(num_threads=numthreads):
+        threadnum = openmp.omp_get_thread_num()
+        for ip in prange(Np, schedule='static'):
+            ib = i_digit[ip]
+            tmp_hist[threadnum, ib] = tmp_hist[threadnum, ib] + weights[ip]
+
+    # Add up contributions from each thread
+    hist = np.sum(np.asarray(tmp_hist), axis=0)
+
+    return hist[1:num_bins]
+
+
+cdef double** _get_weight_pointers(list weights, int Np) except NULL:
+    """
+    Pointers to the data of a list of contiguous float64 arrays (which
+    must be kept alive by the caller) with length Np.
+    The pointers are freed by the caller.
+    """
+    cdef int nw = len(weights)
+    cdef double[::1] weight
+    cdef int iw
+    for iw in range(nw):
+        if weights[iw].shape[0] != Np:
+            raise RuntimeError('The arrays must have the same length as the data')
+    cdef double** pointers = <double**> malloc(max(nw, 1) * sizeof(double*))
+    for iw in range(nw):
+        weight = weights[iw]
+        pointers[iw] = &weight[0]
+    return pointers
+
+
+def get_hists_from_weights_and_idigit(int num_bins, list weights,
+                                      index_t[:] i_digit, int numthreads=1):
+    """
+    This is a cython helper function for calculating several 1D histograms
+    (with the same binning but different weights) in a single pass.
+
+    Parameters:
+
+        num_bins (int): The number of bin edges.
+
+        weights (list): The weights of the data, a list of contiguous
+                        float64 arrays (one for each histogram).
+
+        i_digit (int32 or int64 array): The bin indices, as returned by
+                                        digitize_uniform (int32) or
+                                        np.digitize (int64).
+
+    Returns:
+
+        hists (array): The histograms, with shape
+                       (number of histograms, num_bins - 1).
+    """
+
+    assert numthreads == 1, 'use get_hists_from_weights_and_idigit_omp for more than one thread'
+
+    cdef int Np = i_digit.shape[0]
+    cdef int nw = len(weights)
+
+    cdef double[:, ::1] hist = np.zeros((num_bins+1, nw), dtype=np.float64)
+
+    cdef double** w = _get_weight_pointers(weights, Np)
+
+    cdef int ip, ib, iw
+    for ip in range(Np):
+        ib = i_digit[ip]
+        for iw in range(nw):
+            hist[ib, iw] = hist[ib, iw] + w[iw][ip]
+
+    free(w)
+
+    # Return a numpy array instead of a view
+    return np.array(np.asarray(hist)[1:num_bins].T)
+
+
+def get_hists_from_weights_and_idigit_omp(int num_bins, list weights,
+                                          index_t[:] i_digit, int numthreads=1):
+    """
+    This is a cython helper function for calculating several 1D histograms
+    in a single pass using openmp, see get_hists_from_weights_and_idigit.
+    """
+
+    cdef int Np = i_digit.shape[0]
+    cdef int nw = len(weights)
+
+    cdef double[:, :, ::1] tmp_hist = np.zeros((numthreads, num_bins+1, nw),
+                                               dtype=np.float64)
+
+    cdef double** w = _get_weight_pointers(weights, Np)
+
+    cdef int ip, ib, iw, threadnum
+
+    with nogil, parallel(num_threads=numthreads):
+        threadnum = openmp.omp_get_thread_num()
+        for ip in prange(Np, schedule='static'):
+            ib = i_digit[ip]
+            for iw in range(nw):
+                tmp_hist[threadnum, ib, iw] = tmp_hist[threadnum, ib, iw] + w[iw][ip]
+
+    free(w)
+
+    # Add up contributions from each thread
+    hist = np.sum(np.asarray(tmp_hist), axis=0)
+
+    return np.array(hist[1:num_bins].T)
+
+
+def get_hists_from_weights_and_idigit_tiled_omp(int num_bins, list weights,
+                                                index_t[:] i_digit, int numthreads=1):
+    """
+    This is a cython helper function for calculating several 1D histograms
+    in a single pass using openmp, without a histogram for each thread.
+
+    The bins are split into contiguous tiles, one for each thread, and each
+    thread only adds up the weights of the data in its own tile. The memory
+    use is therefore that of a single histogram (independent of the number
+    of threads) at the cost of each thread reading all the bin indices,
+    which is useful for histograms with many bins (e.g. HistogramND).
+    See get_hists_from_weights_and_idigit for the parameters.
+    """
+
+    cdef int Np = i_digit.shape[0]
+    cdef int nw = len(weights)
+
+    cdef double[:, ::1] hist = np.zeros((num_bins+1, nw), dtype=np.float64)
+
+    cdef double** w = _get_weight_pointers(weights, Np)
+
+    cdef int tile_size = (num_bins + numthreads) // numthreads
+    cdef int ip, ib, iw, itile, ib_start, ib_end
+
+    with nogil:
+        for itile in prange(numthreads, num_threads=numthreads, schedule='static',
+                            chunksize=1):
+            ib_start = itile * tile_size
+            ib_end = ib_start + tile_size
+            for ip in range(Np):
+                ib = i_digit[ip]
+                if (ib >= ib_start) and (ib < ib_end):
+                    for iw in range(nw):
+                        hist[ib, iw] = hist[ib, iw] + w[iw][ip]
+
+    free(w)
+
+    return np.array(np.asarray(hist)[1:num_bins].T)
+
+
+def digitize_2d(real_t [:] xvec, real_t [:] yvec,
+                double lower_x, double upper_x, int nbins_x,
+                double lower_y, double upper_y, int nbins_y,
+                bint logspace,
+                int numthreads=1):
+    """
+    This is a cython helper function which finds the (flattened) 2D bin
+    indices of the data for evenly spaced bin edges (in log10 if logspace).
+
+    The index is ix*nbins_y + iy + 1 for data inside bin (ix, iy) and 0 for
+    data outside the histogram. The 2D histograms for given weights can
+    then be found with get_hist_from_weights_and_idigit, using
+    nbins_x*nbins_y + 1 as the number of bin edges.
+
+    Returns:
+
+        i_digit (int32 array): The flattened bin indices.
+    """
+
+    assert numthreads == 1, 'use digitize_2d_omp for more than one thread'
+
+    cdef int Np = xvec.shape[0]
+
+    cdef int[:] i_digit = np.empty(Np, dtype=np.int32)
+
+    cdef int ip
+    cdef double dx, dy, log10lower_x = 0, log10lower_y = 0
+
+    if logspace:
+        log10lower_x = log10(lower_x)
+        log10lower_y = log10(lower_y)
+        dx = nbins_x/(log10(upper_x) - log10lower_x)
+        dy = nbins_y/(log10(upper_y) - log10lower_y)
+    else:
+        dx = nbins_x/(upper_x-lower_x)
+        dy = nbins_y/(upper_y-lower_y)
+
+    for ip in range(Np):
+        i_digit[ip] = _flat_bin_index_2d(xvec[ip], yvec[ip], lower_x, upper_x, nbins_x,
+                                         lower_y, upper_y, nbins_y, log10lower_x,
+                                         log10lower_y, dx, dy, logspace) + 1
+
+    return np.asarray(i_digit)
+
+
+def digitize_2d_omp(real_t [:] xvec, real_t [:] yvec,
+                    double lower_x, double upper_x, int nbins_x,
+                    double lower_y, double upper_y, int nbins_y,
+                    bint logspace,
+                    int numthreads=1):
+    """
+    This is a cython helper function which finds the (flattened) 2D bin
+    indices of the data using openmp, see digitize_2d.
+    """
+
+    cdef int Np = xvec.shape[0]
+
+    cdef int[:] i_digit = np.empty(Np, dtype=np.int32)
+
+    cdef int ip
+    cdef double dx, dy, log10lower_x = 0, log10lower_y = 0
+
+    if logspace:
+        log10lower_x = log10(lower_x)
+        log10lower_y = log10(lower_y)
+        dx = nbins_x/(log10(upper_x) - log10lower_x)
+        dy = nbins_y/(log10(upper_y) - log10lower_y)
+    else:
+        dx = nbins_x/(upper_x-lower_x)
+        dy = nbins_y/(upper_y-lower_y)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            i_digit[ip] = _flat_bin_index_2d(xvec[ip], yvec[ip], lower_x, upper_x,
+                                             nbins_x, lower_y, upper_y, nbins_y,
+                                             log10lower_x, log10lower_y, dx, dy,
+                                             logspace) + 1
+
+    return np.asarray(i_digit)
+
+
+cdef inline int _flat_bin_index_2d(double x, double y,
+                                   double lower_x, double upper_x, int nbins_x,
+                                   double lower_y, double upper_y, int nbins_y,
+                                   double log10lower_x, double log10lower_y,
+                                   double dx, double dy,
+                                   bint logspace) noexcept nogil:
+    """
+    The index ix*nbins_y + iy of the 2D bin containing (x, y),
+    or -1 if (x, y) is outside the histogram.
+    """
+    cdef int ix, iy
+    if (x > lower_x) and (x < upper_x) and (y > lower_y) and (y < upper_y):
+        if logspace:
+            ix = <int> ((log10(x) - log10lower_x)*dx)
+            iy = <int> ((log10(y) - log10lower_y)*dy)
+        else:
+            ix = <int> ((x - lower_x)*dx)
+            iy = <int> ((y - lower_y)*dy)
+        if (ix >= 0) and (ix < nbins_x) and (iy >= 0) and (iy < nbins_y):
+            return ix*nbins_y + iy
+    return -1
+
+
+def digitize_nd(list data, double[:] lower, double[:] upper, int[:] nbins,
+                int[:] logspace, int numthreads=1):
+    """
+    This is a cython helper function which finds the (flattened) N-dimensional
+    bin indices of the data for evenly spaced bin edges along each
+    dimension (in log10 for the dimensions with logspace).
+
+    Parameters:
+
+        data (list): The data, a list of contiguous float64 arrays
+                     (one for each dimension).
+
+        lower, upper (arrays): The lower and upper edges along each dimension.
+
+        nbins (int32 array): The number of bins along each dimension.
+
+        logspace (int32 array): Whether the bins are evenly spaced in log10
+                                along each dimension.
+
+    The index is the row-major (C-order) flattened index of the bin plus
+    one for data inside the histogram and 0 for data outside, i.e., the
+    same convention as digitize_2d (and the same indices for 2 dimensions).
+
+    Returns:
+
+        i_digit (int32 array): The flattened bin indices.
+    """
+
+    assert numthreads == 1, 'use digitize_nd_omp for more than one thread'
+
+    cdef int ndim = len(data)
+    cdef int Np = data[0].shape[0]
+
+    cdef double[:] offset = np.zeros(ndim, dtype=np.float64)
+    cdef double[:] inv_dx = np.zeros(ndim, dtype=np.float64)
+    _get_nd_binning(lower, upper, nbins, logspace, offset, inv_dx)
+
+    cdef int[:] i_digit = np.empty(Np, dtype=np.int32)
+
+    cdef double** x = _get_weight_pointers(data, Np)
+
+    cdef int ip
+    for ip in range(Np):
+        i_digit[ip] = _flat_bin_index_nd(x, ip, ndim, lower, upper, nbins,
+                                         logspace, offset, inv_dx) + 1
+
+    free(x)
+
+    return np.asarray(i_digit)
+
+
+def digitize_nd_omp(list data, double[:] lower, double[:] upper, int[:] nbins,
+                    int[:] logspace, int numthreads=1):
+    """
+    This is a cython helper function which finds the (flattened) N-dimensional
+    bin indices of the data using openmp, see digitize_nd.
+    """
+
+    cdef int ndim = len(data)
+    cdef int Np = data[0].shape[0]
+
+    cdef double[:] offset = np.zeros(ndim, dtype=np.float64)
+    cdef double[:] inv_dx = np.zeros(ndim, dtype=np.float64)
+    _get_nd_binning(lower, upper, nbins, logspace, offset, inv_dx)
+
+    cdef int[:] i_digit = np.empty(Np, dtype=np.int32)
+
+    cdef double** x = _get_weight_pointers(data, Np)
+
+    cdef int ip
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            i_digit[ip] = _flat_bin_index_nd(x, ip, ndim, lower, upper, nbins,
+                                             logspace, offset, inv_dx) + 1
+
+    free(x)
+
+    return np.asarray(i_digit)
+
+
+cdef _get_nd_binning(double[:] lower, double[:] upper, int[:] nbins,
+                     int[:] logspace, double[:] offset, double[:] inv_dx):
+    """
+    The offsets and inverse bin widths (in log10 for logspace) along
+    each dimension.
+    """
+    cdef int ndim = offset.shape[0]
+    assert lower.shape[0] == ndim and upper.shape[0] == ndim
+    assert nbins.shape[0] == ndim and logspace.shape[0] == ndim
+
+    cdef int idim
+    for idim in range(ndim):
+        assert lower[idim] < upper[idim], 'min and max values swapped!'
+        if logspace[idim]:
+            assert lower[idim] > 0
+            offset[idim] = log10(lower[idim])
+            inv_dx[idim] = nbins[idim]/(log10(upper[idim]) - offset[idim])
+        else:
+            offset[idim] = lower[idim]
+            inv_dx[idim] = nbins[idim]/(upper[idim] - lower[idim])
+
+
+cdef inline int _flat_bin_index_nd(double** x, int ip, int ndim,
+                                   double[:] lower, double[:] upper, int[:] nbins,
+                                   int[:] logspace, double[:] offset,
+                                   double[:] inv_dx) noexcept nogil:
+    """
+    The row-major flattened index of the N-dimensional bin containing
+    data point ip, or -1 if it is outside the histogram.
+    """
+    cdef int idim, ib
+    cdef int index = 0
+    cdef double xi
+    for idim in range(ndim):
+        xi = x[idim][ip]
+        if not ((xi > lower[idim]) and (xi < upper[idim])):
+            return -1
+        if logspace[idim]:
+            ib = <int> ((log10(xi) - offset[idim])*inv_dx[idim])
+        else:
+            ib = <int> ((xi - offset[idim])*inv_dx[idim])
+        if (ib < 0) or (ib >= nbins[idim]):
+            return -1
+        index = index*nbins[idim] + ib
+    return index
+
+
+def digitize_uniform(real_t[:] xvec, double[:] edges, bint logspace,
+                     int numthreads=1):
+    """
+    This is a cython helper function which finds the bin indices of the
+    data for evenly spaced bin edges (evenly spaced in log10 if logspace),
+    using a closed-form expression instead of a binary search.
+
+    The result is identical to np.digitize(xvec, edges), i.e., the index
+    ib satisfies edges[ib-1] <= x < edges[ib], with 0 for values below the
+    first edge and len(edges) for values above the last edge (and nan).
+
+    Parameters:
+
+        xvec (array): The data.
+
+        edges (array): The bin edges.
+
+        logspace (bool): Whether the bin edges are evenly spaced in log10.
+
+    Returns:
+
+        i_digit (int32 array): The bin indices.
+    """
+
+    assert numthreads == 1, 'use digitize_uniform_omp for more than one thread'
+
+    cdef int Np = xvec.shape[0]
+    cdef int nbins = edges.shape[0] - 1
+
+    cdef int[:] i_digit = np.empty(Np, dtype=np.int32)
+
+    cdef int ip
+    cdef double lower, inv_dx
+
+    lower, inv_dx = _get_uniform_binning(edges, logspace)
+
+    for ip in range(Np):
+        i_digit[ip] = _digitize_uniform(xvec[ip], edges, nbins, lower, inv_dx,
+                                        logspace)
+
+    return np.asarray(i_digit)
+
+
+def digitize_uniform_omp(real_t[:] xvec, double[:] edges, bint logspace,
+                         int numthreads=1):
+    """
+    This is a cython helper function which finds the bin indices of the
+    data for evenly spaced bin edges using openmp, see digitize_uniform.
+    """
+
+    cdef int Np = xvec.shape[0]
+    cdef int nbins = edges.shape[0] - 1
+
+    cdef int[:] i_digit = np.empty(Np, dtype=np.int32)
+
+    cdef int ip
+    cdef double lower, inv_dx
+
+    lower, inv_dx = _get_uniform_binning(edges, logspace)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            i_digit[ip] = _digitize_uniform(xvec[ip], edges, nbins, lower, inv_dx,
+                                            logspace)
+
+    return np.asarray(i_digit)
+
+
+cdef _get_uniform_binning(double[:] edges, bint logspace):
+    """
+    The lower edge and the inverse bin width (in log10 if logspace).
+    """
+    cdef int nbins = edges.shape[0] - 1
+    if logspace:
+        return log10(edges[0]), nbins/(log10(edges[nbins]) - log10(edges[0]))
+    return edges[0], nbins/(edges[nbins] - edges[0])
+
+
+cdef inline int _digitize_uniform(double x, double[:] edges, int nbins,
+                                  double lower, double inv_dx,
+                                  bint logspace) noexcept nogil:
+    """
+    The bin index of a single value, see digitize_uniform.
+    """
+    cdef int ib
+    if x >= edges[0]:
+        if x < edges[nbins]:
+            if logspace:
+                ib = <int> ((log10(x) - lower)*inv_dx) + 1
+            else:
+                ib = <int> ((x - lower)*inv_dx) + 1
+            if ib > nbins:
+                ib = nbins
+
+            # Correct for round-off such that edges[ib-1] <= x < edges[ib]
+            if x < edges[ib-1]:
+                ib = ib - 1
+            elif x >= edges[ib]:
+                ib = ib + 1
+        else:
+            ib = nbins + 1
+    elif x < edges[0]:
+        ib = 0
+    else:
+        # nan
+        ib = nbins + 1
+    return ib
+
+
 def get_hist2d_from_weights(real_t [:] xvec, real_t [:] yvec,
                             real_t [:] weights,
                             real_t lower_x, real_t upper_x, int nbins_x,
@@ -69,6 +604,8 @@ def get_hist2d_from_weights(real_t [:] xvec, real_t [:] yvec,
     for ip in range(Np):
         x = xvec[ip]
         y = yvec[ip]
+        ix = -1
+        iy = -1
         if (x > lower_x) and (x < upper_x) and (y > lower_y) and (y < upper_y):
             if logspace:
                 ix = <int> ((log10(x) - log10lower_x)*dx)
@@ -130,6 +667,8 @@ def get_hist2d_from_weights_omp(real_t [:] xvec, real_t [:] yvec,
 
             x = xvec[ip]
             y = yvec[ip]
+            ix = -1
+            iy = -1
             if (x > lower_x) and (x < upper_x) and (y > lower_y) and (y < upper_y):
                 if logspace:
                     ix = <int> ((log10(x) - log10lower_x)*dx)
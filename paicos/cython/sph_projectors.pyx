@@ -500,3 +500,1568 @@ def project_oriented_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec, r
     tmp = np.zeros((nx, ny), dtype=np.float64)
     tmp[:, :] = projection[:, :]
     return tmp
+
+
+def project_oriented_images(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec, real_t[:] variable,
+                            real_t[:] hvec, int nx,
+                            real_t xc, real_t yc, real_t zc,
+                            real_t sidelength_x, real_t sidelength_y,
+                            real_t sidelength_z,
+                            real_t boxsize,
+                            real_t[:, :] unit_vectors_x,
+                            real_t[:, :] unit_vectors_y,
+                            real_t[:, :] unit_vectors_z,
+                            int numthreads=1):
+
+    """
+    Same as project_oriented_image but for several orientations (views) at
+    once, given by the rows of the unit_vectors arrays. The particles are
+    looped over once, and each particle is deposited onto the images of the
+    views for which it is inside the (rotated) region with
+    sidelengths (sidelength_x, sidelength_y, sidelength_z).
+
+    Returns an array with shape (nviews, nx, ny).
+    """
+
+    assert numthreads == 1, 'use project_oriented_images_omp for more than one thread'
+
+    # Number of particles and views
+    cdef int Np = xvec.shape[0]
+    cdef int nviews = unit_vectors_x.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+
+    # Create projection array
+    cdef real_t[:, :, :] projection = np.zeros((nviews, nx, ny), dtype=np.float64)
+
+    # Loop integers and other variables
+    cdef int ip, iv, ix, iy, ih
+    cdef int ipx, ipy
+    cdef int ix_min, ix_max
+    cdef int iy_min, iy_max
+    cdef real_t dx, dy, r2, h, h2, weight
+    cdef real_t x, y, z, norm
+    cdef real_t cen_x, cen_y, cen_z
+
+    assert sidelength_x/nx == sidelength_y/ny
+
+    for ip in range(Np):
+        # Centered coordinates
+        cen_x = xvec[ip] - xc
+        cen_y = yvec[ip] - yc
+        cen_z = zvec[ip] - zc
+
+        # Smoothing length in units of the pixel size
+        h = hvec[ip]*nx/sidelength_x
+
+        if h < 1.:
+            h = 1.
+
+        # Smoothing length as integer
+        ih = <int> h + 1
+
+        # Square of smoothing length
+        h2 = h*h
+
+        for iv in range(nviews):
+            # Projection of coordinate along the unit vectors of this view
+            x = cen_x * unit_vectors_x[iv, 0] + cen_y * unit_vectors_x[iv, 1] \
+                + cen_z * unit_vectors_x[iv, 2]
+            y = cen_x * unit_vectors_y[iv, 0] + cen_y * unit_vectors_y[iv, 1] \
+                + cen_z * unit_vectors_y[iv, 2]
+            z = cen_x * unit_vectors_z[iv, 0] + cen_y * unit_vectors_z[iv, 1] \
+                + cen_z * unit_vectors_z[iv, 2]
+
+            # Only include particles inside the region (as in get_rotated_cube)
+            if not ((x < sidelength_x/2.0) and (x > -sidelength_x/2.0)
+                    and (y < sidelength_y/2.0) and (y > -sidelength_y/2.0)
+                    and (z < sidelength_z/2.0) and (z > -sidelength_z/2.0)):
+                continue
+
+            # Transform these so that they are in the range [0, sidelength]
+            x = x + sidelength_x/2.0
+            y = y + sidelength_y/2.0
+
+            # Position of particle in units of sidelength (0, sidelength)
+            x = x*nx/sidelength_x
+            y = y*ny/sidelength_y
+
+            # Index of closest grid point
+            ipx = <int> x
+            ipy = <int> y
+
+            # Find minimum and maximum integers
+            ix_min = ipx - ih
+            iy_min = ipy - ih
+            ix_max = ipx + ih
+            iy_max = ipy + ih
+
+            norm = 0.0
+            for ix in range(ix_min, ix_max):
+                for iy in range(iy_min, iy_max):
+                    dx = x - 0.5 - <real_t> ix
+                    dy = y - 0.5 - <real_t> iy
+                    r2 = dx*dx + dy*dy
+
+                    weight = 1.0 - r2/h2
+                    if weight > 0.0:
+                        norm += weight
+
+            # Find minimum and maximum integers
+            ix_min = max(0, ipx - ih)
+            iy_min = max(0, ipy - ih)
+            ix_max = min(nx, ipx + ih)
+            iy_max = min(ny, ipy + ih)
+
+            for ix in range(ix_min, ix_max):
+                for iy in range(iy_min, iy_max):
+                    dx = x - 0.5 - <real_t> ix
+                    dy = y - 0.5 - <real_t> iy
+                    r2 = dx*dx + dy*dy
+
+                    weight = 1.0 - r2/h2
+                    if weight > 0.0:
+                        projection[iv, ix, iy] += weight*variable[ip]/norm
+
+    # Fix to avoid returning a memory-view
+    tmp = np.zeros((nviews, nx, ny), dtype=np.float64)
+    tmp[:, :, :] = projection[:, :, :]
+    return tmp
+
+
+def project_oriented_images_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                real_t[:] variable,
+                                real_t[:] hvec, int nx,
+                                real_t xc, real_t yc, real_t zc,
+                                real_t sidelength_x, real_t sidelength_y,
+                                real_t sidelength_z,
+                                real_t boxsize,
+                                real_t[:, :] unit_vectors_x,
+                                real_t[:, :] unit_vectors_y,
+                                real_t[:, :] unit_vectors_z,
+                                int numthreads=1):
+
+    """
+    Same as project_oriented_images but here with an openmp implementation.
+    """
+
+    # Number of particles and views
+    cdef int Np = xvec.shape[0]
+    cdef int nviews = unit_vectors_x.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+
+    # Loop integers and other variables
+    cdef int ip, iv, ix, iy, ih, threadnum
+    cdef int ipx, ipy
+    cdef int ix_min, ix_max
+    cdef int iy_min, iy_max
+    cdef real_t dx, dy, r2, h, h2, weight
+    cdef real_t x, y, z, norm
+    cdef real_t cen_x, cen_y, cen_z
+
+    assert sidelength_x/nx == sidelength_y/ny
+
+    # Create projection arrays
+    cdef real_t[:, :, :, :] tmp_var = np.zeros((numthreads, nviews, nx, ny), dtype=np.float64)
+    cdef real_t[:, :, :] projection = np.zeros((nviews, nx, ny), dtype=np.float64)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            # Centered coordinates
+            cen_x = xvec[ip] - xc
+            cen_y = yvec[ip] - yc
+            cen_z = zvec[ip] - zc
+
+            # Smoothing length in units of the pixel size
+            h = hvec[ip]*nx/sidelength_x
+
+            if h < 1.:
+                h = 1.
+
+            # Smoothing length as integer
+            ih = <int> h + 1
+
+            # Square of smoothing length
+            h2 = h*h
+
+            for iv in range(nviews):
+                # Projection of coordinate along the unit vectors of this view
+                x = cen_x * unit_vectors_x[iv, 0] + cen_y * unit_vectors_x[iv, 1] \
+                    + cen_z * unit_vectors_x[iv, 2]
+                y = cen_x * unit_vectors_y[iv, 0] + cen_y * unit_vectors_y[iv, 1] \
+                    + cen_z * unit_vectors_y[iv, 2]
+                z = cen_x * unit_vectors_z[iv, 0] + cen_y * unit_vectors_z[iv, 1] \
+                    + cen_z * unit_vectors_z[iv, 2]
+
+                # Only include particles inside the region (as in get_rotated_cube)
+                if not ((x < sidelength_x/2.0) and (x > -sidelength_x/2.0)
+                        and (y < sidelength_y/2.0) and (y > -sidelength_y/2.0)
+                        and (z < sidelength_z/2.0) and (z > -sidelength_z/2.0)):
+                    continue
+
+                # Transform these so that they are in the range [0, sidelength]
+                x = x + sidelength_x/2.0
+                y = y + sidelength_y/2.0
+
+                # Position of particle in units of sidelength (0, sidelength)
+                x = x*nx/sidelength_x
+                y = y*ny/sidelength_y
+
+                # Index of closest grid point
+                ipx = <int> x
+                ipy = <int> y
+
+                # Find minimum and maximum integers
+                ix_min = ipx - ih
+                iy_min = ipy - ih
+                ix_max = ipx + ih
+                iy_max = ipy + ih
+
+                norm = 0.0
+                for ix in range(ix_min, ix_max):
+                    for iy in range(iy_min, iy_max):
+                        dx = x - 0.5 - <real_t> ix
+                        dy = y - 0.5 - <real_t> iy
+                        r2 = dx*dx + dy*dy
+
+                        weight = 1.0 - r2/h2
+                        if weight > 0.0:
+                            norm = norm + weight
+
+                # Find minimum and maximum integers
+                ix_min = max(0, ipx - ih)
+                iy_min = max(0, ipy - ih)
+                ix_max = min(nx, ipx + ih)
+                iy_max = min(ny, ipy + ih)
+
+                for ix in range(ix_min, ix_max):
+                    for iy in range(iy_min, iy_max):
+                        dx = x - 0.5 - <real_t> ix
+                        dy = y - 0.5 - <real_t> iy
+                        r2 = dx*dx + dy*dy
+
+                        weight = 1.0 - r2/h2
+                        if weight > 0.0:
+                            tmp_var[threadnum, iv, ix, iy] = tmp_var[threadnum, iv, ix, iy] \
+                                                             + weight*variable[ip]/norm
+
+    # Add up contributions from each thread
+    for threadnum in range(numthreads):
+        for iv in range(nviews):
+            for ix in range(nx):
+                for iy in range(ny):
+                    projection[iv, ix, iy] = projection[iv, ix, iy] \
+                                             + tmp_var[threadnum, iv, ix, iy]
+
+    # Fix to avoid returning a memory-view
+    tmp = np.zeros((nviews, nx, ny), dtype=np.float64)
+    tmp[:, :, :] = projection[:, :, :]
+    return tmp
+
+
+cdef inline double _kernel_norm(double x, double y, double h) noexcept nogil:
+    """
+    The normalization of the kernel of a particle at (x, y) with smoothing
+    length h (all in units of pixels), i.e., the sum of the kernel weights
+    over all the pixels it overlaps (also those outside the image).
+    The kernel is the same as in project_image.
+    """
+    cdef int ix, iy, ih, ipx, ipy
+    cdef double dx, dy, r2, h2, weight
+    cdef double norm = 0.0
+
+    if h < 1.:
+        h = 1.
+
+    # Index of closest grid point
+    ipx = <int> x
+    ipy = <int> y
+
+    # Smoothing length as integer
+    ih = <int> h + 1
+
+    # Square of smoothing length
+    h2 = h*h
+
+    for ix in range(ipx - ih, ipx + ih):
+        for iy in range(ipy - ih, ipy + ih):
+            dx = x - 0.5 - <double> ix
+            dy = y - 0.5 - <double> iy
+            r2 = dx*dx + dy*dy
+
+            weight = 1.0 - r2/h2
+            if weight > 0.0:
+                norm = norm + weight
+
+    return norm
+
+
+def get_kernel_norms(real_t[:] xvec, real_t[:] yvec, real_t[:] hvec,
+                     int numthreads=1):
+    """
+    The kernel normalization of each particle, see project_image_window.
+
+    Parameters:
+        xvec (array, N): positions along x (horizontal) in units of pixels,
+                         with the lower, left corner of the image at 0
+        yvec (array, N): positions along y (vertical) in units of pixels
+        hvec (array, N): size of particles in units of pixels
+
+    Returns:
+        array: The normalizations.
+    """
+
+    assert numthreads == 1, 'use get_kernel_norms_omp for more than one thread'
+
+    cdef int Np = xvec.shape[0]
+    cdef double[:] norms = np.empty(Np, dtype=np.float64)
+
+    cdef int ip
+    for ip in range(Np):
+        norms[ip] = _kernel_norm(xvec[ip], yvec[ip], hvec[ip])
+
+    return np.asarray(norms)
+
+
+def get_kernel_norms_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] hvec,
+                         int numthreads=1):
+    """
+    Same as get_kernel_norms but here with an openmp parallel implementation.
+    """
+
+    cdef int Np = xvec.shape[0]
+    cdef double[:] norms = np.empty(Np, dtype=np.float64)
+
+    cdef int ip
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='dynamic'):
+            norms[ip] = _kernel_norm(xvec[ip], yvec[ip], hvec[ip])
+
+    return np.asarray(norms)
+
+
+cdef inline void _deposit_window(double x, double y, double h, double variable,
+                                 double norm, int ix0, int iy0, int ix_end,
+                                 int iy_end, double[:, :, ::1] out,
+                                 int threadnum) noexcept nogil:
+    """
+    Deposit the variable of a particle at (x, y) with smoothing length h
+    (all in units of pixels of the full image) onto the pixels
+    ix0 <= ix < ix_end and iy0 <= iy < iy_end, which are stored in
+    out[threadnum, ix - ix0, iy - iy0]. The kernel is the same as in
+    project_image, with the normalization norm (see _kernel_norm).
+    """
+    cdef int ix, iy, ih, ipx, ipy
+    cdef int ix_min, ix_max, iy_min, iy_max
+    cdef double dx, dy, r2, h2, weight
+
+    if h < 1.:
+        h = 1.
+
+    # Index of closest grid point
+    ipx = <int> x
+    ipy = <int> y
+
+    # Smoothing length as integer
+    ih = <int> h + 1
+
+    # Square of smoothing length
+    h2 = h*h
+
+    # Only the part of the kernel inside the window
+    ix_min = max(ix0, ipx - ih)
+    iy_min = max(iy0, ipy - ih)
+    ix_max = min(ix_end, ipx + ih)
+    iy_max = min(iy_end, ipy + ih)
+
+    for ix in range(ix_min, ix_max):
+        for iy in range(iy_min, iy_max):
+            dx = x - 0.5 - <double> ix
+            dy = y - 0.5 - <double> iy
+            r2 = dx*dx + dy*dy
+
+            weight = 1.0 - r2/h2
+            if weight > 0.0:
+                out[threadnum, ix - ix0, iy - iy0] += weight*variable/norm
+
+
+def project_image_window(real_t[:] xvec, real_t[:] yvec, real_t[:] variable,
+                         real_t[:] hvec, double[:] norms,
+                         int ix0, int iy0, int nx, int ny,
+                         int nx_image, int ny_image, int numthreads=1):
+    """
+    Projects particles onto the window ix0 <= ix < ix0 + nx, iy0 <= iy < iy0 + ny
+    of an image with nx_image x ny_image pixels, using the same kernel as
+    project_image. Particles extending beyond the window (or the image)
+    are clipped, such that the windows of an image add up to the image
+    found with project_image, while the memory use is set by the size
+    of the window.
+
+    Parameters:
+        xvec (array, N): positions along x (horizontal) in units of pixels,
+                         with the lower, left corner of the image at 0
+        yvec (array, N): positions along y (vertical) in units of pixels
+        variable (array, N): variable to be projected (e.g. mass)
+        hvec (array, N): size of particles in units of pixels
+        norms (array, N): the kernel normalizations, see get_kernel_norms
+
+    Returns:
+        2d array: A 2D array with shape (nx, ny) with the projected variable.
+    """
+
+    assert numthreads == 1, 'use project_image_window_omp for more than one thread'
+
+    cdef int Np = xvec.shape[0]
+
+    cdef double[:, :, ::1] projection = np.zeros((1, nx, ny), dtype=np.float64)
+
+    cdef int ix_end = min(ix0 + nx, nx_image)
+    cdef int iy_end = min(iy0 + ny, ny_image)
+
+    cdef int ip
+    for ip in range(Np):
+        _deposit_window(xvec[ip], yvec[ip], hvec[ip], variable[ip], norms[ip],
+                        ix0, iy0, ix_end, iy_end, projection, 0)
+
+    return np.array(projection[0])
+
+
+def project_image_window_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] variable,
+                             real_t[:] hvec, double[:] norms,
+                             int ix0, int iy0, int nx, int ny,
+                             int nx_image, int ny_image, int numthreads=1):
+    """
+    Same as project_image_window but here with an openmp parallel implementation.
+    """
+
+    cdef int Np = xvec.shape[0]
+
+    cdef double[:, :, ::1] tmp_var = np.zeros((numthreads, nx, ny), dtype=np.float64)
+
+    cdef int ix_end = min(ix0 + nx, nx_image)
+    cdef int iy_end = min(iy0 + ny, ny_image)
+
+    cdef int ip, threadnum
+
+    with nogil, parallel(num_threads=numthreads):
+        threadnum = openmp.omp_get_thread_num()
+        for ip in prange(Np, schedule='static'):
+            _deposit_window(xvec[ip], yvec[ip], hvec[ip], variable[ip], norms[ip],
+                            ix0, iy0, ix_end, iy_end, tmp_var, threadnum)
+
+    # Add up contributions from each thread
+    return np.sum(np.asarray(tmp_var), axis=0)
+
+
+cdef inline void _deposit(double x, double y, double h, double v0, double v1,
+                          double v2, double v3, int nvalues,
+                          double[:, :, :, ::1] out, int threadnum) noexcept nogil:
+    """
+    Deposit the values v0, ..., v{nvalues-1} (nvalues <= 4) of a particle
+    at (x, y) with smoothing length h (all in units of pixels) onto
+    out[threadnum, 0], ..., out[threadnum, nvalues - 1]. The kernel is
+    the same as in project_image.
+    """
+    cdef int ix, iy, ih, ipx, ipy
+    cdef int ix_min, ix_max, iy_min, iy_max
+    cdef double dx, dy, r2, h2, weight, norm
+
+    if h < 1.:
+        h = 1.
+
+    # Index of closest grid point
+    ipx = <int> x
+    ipy = <int> y
+
+    # Smoothing length as integer
+    ih = <int> h + 1
+
+    # Square of smoothing length
+    h2 = h*h
+
+    norm = 0.0
+    for ix in range(ipx - ih, ipx + ih):
+        for iy in range(ipy - ih, ipy + ih):
+            dx = x - 0.5 - <double> ix
+            dy = y - 0.5 - <double> iy
+            r2 = dx*dx + dy*dy
+
+            weight = 1.0 - r2/h2
+            if weight > 0.0:
+                norm = norm + weight
+
+    # Find minimum and maximum integers
+    ix_min = max(0, ipx - ih)
+    iy_min = max(0, ipy - ih)
+    ix_max = min(out.shape[2], ipx + ih)
+    iy_max = min(out.shape[3], ipy + ih)
+
+    for ix in range(ix_min, ix_max):
+        for iy in range(iy_min, iy_max):
+            dx = x - 0.5 - <double> ix
+            dy = y - 0.5 - <double> iy
+            r2 = dx*dx + dy*dy
+
+            weight = 1.0 - r2/h2
+            if weight > 0.0:
+                out[threadnum, 0, ix, iy] += weight*v0/norm
+                if nvalues > 1:
+                    out[threadnum, 1, ix, iy] += weight*v1/norm
+                if nvalues > 2:
+                    out[threadnum, 2, ix, iy] += weight*v2/norm
+                if nvalues > 3:
+                    out[threadnum, 3, ix, iy] += weight*v3/norm
+
+
+def project_weighted_image(real_t[:] xvec, real_t[:] yvec, real_t[:] variable,
+                           real_t[:] weights, real_t[:] hvec, int nx,
+                           real_t xc, real_t yc,
+                           real_t sidelength_x, real_t sidelength_y,
+                           real_t boxsize, int numthreads=1):
+    """
+    Projects weights*variable and weights in a single pass over the
+    particles, using the same SPH-like kernel as project_image.
+
+    The (e.g. mass-weighted) mean of the variable is the ratio of the
+    two images.
+
+    Parameters:
+        xvec (array, N): positions along x (horizontal)
+        yvec (array, N): positions along y (vertical)
+        variable (array, N): variable to be projected (e.g. temperature)
+        weights (array, N): weights (e.g. mass)
+        hsml (array, N): size of particles
+        sidelength_x (double): size of image along x
+        sidelength_y (double): size of image along y
+        boxsize (double): size of simulation domain,
+                           which for now is assumed to be cubic!
+
+    Returns:
+        2d array: A 2D array with the projected weights*variable.
+        2d array: A 2D array with the projected weights.
+    """
+
+    assert numthreads == 1, 'use project_weighted_image_omp for more than one thread'
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip
+    cdef double x, y, h
+
+    # Lower left corner of image in Arepo coordinates
+    cdef double x0 = xc - sidelength_x / 2.0
+    cdef double y0 = yc - sidelength_y / 2.0
+
+    cdef double[:, :, :, ::1] projections = np.zeros((1, 2, nx, ny), dtype=np.float64)
+
+    for ip in range(Np):
+        # Position of particle in units of sidelength (0, sidelength)
+        x = (xvec[ip] - x0)*nx/sidelength_x
+        y = (yvec[ip] - y0)*ny/sidelength_y
+        h = hvec[ip]*nx/sidelength_x
+        _deposit(x, y, h, weights[ip]*variable[ip], weights[ip], 0., 0., 2,
+                 projections, 0)
+
+    tmp = np.asarray(projections)[0]
+    return tmp[0], tmp[1]
+
+
+def project_weighted_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] variable,
+                               real_t[:] weights, real_t[:] hvec, int nx,
+                               real_t xc, real_t yc,
+                               real_t sidelength_x, real_t sidelength_y,
+                               real_t boxsize, int numthreads):
+    """
+    Same as project_weighted_image but here with an openmp parallel implementation.
+    """
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip, threadnum
+    cdef double x, y, h
+
+    # Lower left corner of image in Arepo coordinates
+    cdef double x0 = xc - sidelength_x / 2.0
+    cdef double y0 = yc - sidelength_y / 2.0
+
+    # One pair of images per thread
+    cdef double[:, :, :, ::1] projections = np.zeros((numthreads, 2, nx, ny),
+                                                     dtype=np.float64)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            x = (xvec[ip] - x0)*nx/sidelength_x
+            y = (yvec[ip] - y0)*ny/sidelength_y
+            h = hvec[ip]*nx/sidelength_x
+            _deposit(x, y, h, weights[ip]*variable[ip], weights[ip], 0., 0., 2,
+                     projections, threadnum)
+
+    # Add up contributions from each thread
+    tmp = np.sum(np.asarray(projections), axis=0)
+    return tmp[0], tmp[1]
+
+
+def project_weighted_oriented_image(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                    real_t[:] variable, real_t[:] weights,
+                                    real_t[:] hvec, int nx,
+                                    real_t xc, real_t yc, real_t zc,
+                                    real_t sidelength_x, real_t sidelength_y,
+                                    real_t boxsize,
+                                    real_t[:] unit_vector_x,
+                                    real_t[:] unit_vector_y,
+                                    real_t[:] unit_vector_z,
+                                    int numthreads=1):
+    """
+    Same as project_weighted_image but for an image plane with an
+    orientation, see project_oriented_image.
+    """
+
+    assert numthreads == 1, 'use project_weighted_oriented_image_omp for more than one thread'
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip
+    cdef double x, y, h
+    cdef double cen_x, cen_y, cen_z
+
+    cdef double[:, :, :, ::1] projections = np.zeros((1, 2, nx, ny), dtype=np.float64)
+
+    for ip in range(Np):
+        # Centered coordinates
+        cen_x = xvec[ip] - xc
+        cen_y = yvec[ip] - yc
+        cen_z = zvec[ip] - zc
+
+        # Projection of coordinate along perp_vector1 and perp_vector2
+        x = cen_x * unit_vector_x[0] + cen_y * unit_vector_x[1] + cen_z * unit_vector_x[2]
+        y = cen_x * unit_vector_y[0] + cen_y * unit_vector_y[1] + cen_z * unit_vector_y[2]
+
+        # Position of particle in units of sidelength (0, sidelength)
+        x = (x + sidelength_x/2.0)*nx/sidelength_x
+        y = (y + sidelength_y/2.0)*ny/sidelength_y
+        h = hvec[ip]*nx/sidelength_x
+        _deposit(x, y, h, weights[ip]*variable[ip], weights[ip], 0., 0., 2,
+                 projections, 0)
+
+    tmp = np.asarray(projections)[0]
+    return tmp[0], tmp[1]
+
+
+def project_weighted_oriented_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                        real_t[:] variable, real_t[:] weights,
+                                        real_t[:] hvec, int nx,
+                                        real_t xc, real_t yc, real_t zc,
+                                        real_t sidelength_x, real_t sidelength_y,
+                                        real_t boxsize,
+                                        real_t[:] unit_vector_x,
+                                        real_t[:] unit_vector_y,
+                                        real_t[:] unit_vector_z,
+                                        int numthreads=1):
+    """
+    Same as project_weighted_oriented_image but here with an openmp implementation.
+    """
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip, threadnum
+    cdef double x, y, h
+    cdef double cen_x, cen_y, cen_z
+
+    # One pair of images per thread
+    cdef double[:, :, :, ::1] projections = np.zeros((numthreads, 2, nx, ny),
+                                                     dtype=np.float64)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            cen_x = xvec[ip] - xc
+            cen_y = yvec[ip] - yc
+            cen_z = zvec[ip] - zc
+
+            x = cen_x * unit_vector_x[0] + cen_y * unit_vector_x[1] + cen_z * unit_vector_x[2]
+            y = cen_x * unit_vector_y[0] + cen_y * unit_vector_y[1] + cen_z * unit_vector_y[2]
+
+            x = (x + sidelength_x/2.0)*nx/sidelength_x
+            y = (y + sidelength_y/2.0)*ny/sidelength_y
+            h = hvec[ip]*nx/sidelength_x
+            _deposit(x, y, h, weights[ip]*variable[ip], weights[ip], 0., 0., 2,
+                     projections, threadnum)
+
+    # Add up contributions from each thread
+    tmp = np.sum(np.asarray(projections), axis=0)
+    return tmp[0], tmp[1]
+
+
+def project_vector_image(real_t[:] xvec, real_t[:] yvec, real_t[:, :] vectors,
+                         real_t[:] weights, real_t[:] hvec, int nx,
+                         real_t xc, real_t yc,
+                         real_t sidelength_x, real_t sidelength_y,
+                         real_t boxsize,
+                         real_t[:] unit_vector_x,
+                         real_t[:] unit_vector_y,
+                         real_t[:] unit_vector_z,
+                         int numthreads=1):
+    """
+    Projects the three components of a vector field in the coordinate system
+    given by the unit vectors (i.e., along the horizontal and vertical
+    directions of the image and along the line of sight) in a single pass
+    over the particles, using the same SPH-like kernel as project_image.
+
+    The vectors are rotated on the fly. If weights are given (i.e. if the
+    weights array is not empty) then weights times the components are
+    projected along with the weights.
+
+    Parameters:
+        xvec (array, N): positions along x (horizontal)
+        yvec (array, N): positions along y (vertical)
+        vectors (array, (N, 3)): vector field (e.g. velocities)
+        weights (array, N or 0): weights (e.g. mass) or an empty array
+        hsml (array, N): size of particles
+        sidelength_x (double): size of image along x
+        sidelength_y (double): size of image along y
+        boxsize (double): size of simulation domain,
+                           which for now is assumed to be cubic!
+        unit_vector_x, unit_vector_y, unit_vector_z (arrays, 3): the unit
+            vectors of the image, see Orientation.cartesian_unit_vectors
+
+    Returns:
+        3d array: An array with shape (3, nx, ny) (or (4, nx, ny) with
+                  the projected weights if weights are given).
+    """
+
+    assert numthreads == 1, 'use project_vector_image_omp for more than one thread'
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip
+    cdef double x, y, h, w, v_x, v_y, v_z
+    cdef int use_weights = weights.shape[0] > 0
+    cdef int nvalues = 4 if use_weights else 3
+
+    # Lower left corner of image in Arepo coordinates
+    cdef double x0 = xc - sidelength_x / 2.0
+    cdef double y0 = yc - sidelength_y / 2.0
+
+    cdef double[:, :, :, ::1] projections = np.zeros((1, nvalues, nx, ny), dtype=np.float64)
+
+    for ip in range(Np):
+        # Position of particle in units of sidelength (0, sidelength)
+        x = (xvec[ip] - x0)*nx/sidelength_x
+        y = (yvec[ip] - y0)*ny/sidelength_y
+        h = hvec[ip]*nx/sidelength_x
+
+        # Rotate the vector
+        v_x = (vectors[ip, 0] * unit_vector_x[0] + vectors[ip, 1] * unit_vector_x[1]
+               + vectors[ip, 2] * unit_vector_x[2])
+        v_y = (vectors[ip, 0] * unit_vector_y[0] + vectors[ip, 1] * unit_vector_y[1]
+               + vectors[ip, 2] * unit_vector_y[2])
+        v_z = (vectors[ip, 0] * unit_vector_z[0] + vectors[ip, 1] * unit_vector_z[1]
+               + vectors[ip, 2] * unit_vector_z[2])
+
+        if use_weights:
+            w = weights[ip]
+            _deposit(x, y, h, w*v_x, w*v_y, w*v_z, w, 4, projections, 0)
+        else:
+            _deposit(x, y, h, v_x, v_y, v_z, 0., 3, projections, 0)
+
+    return np.asarray(projections)[0]
+
+
+def project_vector_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:, :] vectors,
+                             real_t[:] weights, real_t[:] hvec, int nx,
+                             real_t xc, real_t yc,
+                             real_t sidelength_x, real_t sidelength_y,
+                             real_t boxsize,
+                             real_t[:] unit_vector_x,
+                             real_t[:] unit_vector_y,
+                             real_t[:] unit_vector_z,
+                             int numthreads=1):
+    """
+    Same as project_vector_image but here with an openmp parallel implementation.
+    """
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip, threadnum
+    cdef double x, y, h, w, v_x, v_y, v_z
+    cdef int use_weights = weights.shape[0] > 0
+    cdef int nvalues = 4 if use_weights else 3
+
+    # Lower left corner of image in Arepo coordinates
+    cdef double x0 = xc - sidelength_x / 2.0
+    cdef double y0 = yc - sidelength_y / 2.0
+
+    # One set of images per thread
+    cdef double[:, :, :, ::1] projections = np.zeros((numthreads, nvalues, nx, ny),
+                                                     dtype=np.float64)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            x = (xvec[ip] - x0)*nx/sidelength_x
+            y = (yvec[ip] - y0)*ny/sidelength_y
+            h = hvec[ip]*nx/sidelength_x
+
+            v_x = (vectors[ip, 0] * unit_vector_x[0] + vectors[ip, 1] * unit_vector_x[1]
+                   + vectors[ip, 2] * unit_vector_x[2])
+            v_y = (vectors[ip, 0] * unit_vector_y[0] + vectors[ip, 1] * unit_vector_y[1]
+                   + vectors[ip, 2] * unit_vector_y[2])
+            v_z = (vectors[ip, 0] * unit_vector_z[0] + vectors[ip, 1] * unit_vector_z[1]
+                   + vectors[ip, 2] * unit_vector_z[2])
+
+            if use_weights:
+                w = weights[ip]
+                _deposit(x, y, h, w*v_x, w*v_y, w*v_z, w, 4, projections, threadnum)
+            else:
+                _deposit(x, y, h, v_x, v_y, v_z, 0., 3, projections, threadnum)
+
+    # Add up contributions from each thread
+    return np.sum(np.asarray(projections), axis=0)
+
+
+def project_vector_oriented_image(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                  real_t[:, :] vectors, real_t[:] weights,
+                                  real_t[:] hvec, int nx,
+                                  real_t xc, real_t yc, real_t zc,
+                                  real_t sidelength_x, real_t sidelength_y,
+                                  real_t boxsize,
+                                  real_t[:] unit_vector_x,
+                                  real_t[:] unit_vector_y,
+                                  real_t[:] unit_vector_z,
+                                  int numthreads=1):
+    """
+    Same as project_vector_image but for an image plane with an
+    orientation, see project_oriented_image.
+    """
+
+    assert numthreads == 1, 'use project_vector_oriented_image_omp for more than one thread'
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip
+    cdef double x, y, h, w, v_x, v_y, v_z
+    cdef double cen_x, cen_y, cen_z
+    cdef int use_weights = weights.shape[0] > 0
+    cdef int nvalues = 4 if use_weights else 3
+
+    cdef double[:, :, :, ::1] projections = np.zeros((1, nvalues, nx, ny), dtype=np.float64)
+
+    for ip in range(Np):
+        # Centered coordinates
+        cen_x = xvec[ip] - xc
+        cen_y = yvec[ip] - yc
+        cen_z = zvec[ip] - zc
+
+        # Projection of coordinate along perp_vector1 and perp_vector2
+        x = cen_x * unit_vector_x[0] + cen_y * unit_vector_x[1] + cen_z * unit_vector_x[2]
+        y = cen_x * unit_vector_y[0] + cen_y * unit_vector_y[1] + cen_z * unit_vector_y[2]
+
+        # Position of particle in units of sidelength (0, sidelength)
+        x = (x + sidelength_x/2.0)*nx/sidelength_x
+        y = (y + sidelength_y/2.0)*ny/sidelength_y
+        h = hvec[ip]*nx/sidelength_x
+
+        # Rotate the vector
+        v_x = (vectors[ip, 0] * unit_vector_x[0] + vectors[ip, 1] * unit_vector_x[1]
+               + vectors[ip, 2] * unit_vector_x[2])
+        v_y = (vectors[ip, 0] * unit_vector_y[0] + vectors[ip, 1] * unit_vector_y[1]
+               + vectors[ip, 2] * unit_vector_y[2])
+        v_z = (vectors[ip, 0] * unit_vector_z[0] + vectors[ip, 1] * unit_vector_z[1]
+               + vectors[ip, 2] * unit_vector_z[2])
+
+        if use_weights:
+            w = weights[ip]
+            _deposit(x, y, h, w*v_x, w*v_y, w*v_z, w, 4, projections, 0)
+        else:
+            _deposit(x, y, h, v_x, v_y, v_z, 0., 3, projections, 0)
+
+    return np.asarray(projections)[0]
+
+
+def project_vector_oriented_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                      real_t[:, :] vectors, real_t[:] weights,
+                                      real_t[:] hvec, int nx,
+                                      real_t xc, real_t yc, real_t zc,
+                                      real_t sidelength_x, real_t sidelength_y,
+                                      real_t boxsize,
+                                      real_t[:] unit_vector_x,
+                                      real_t[:] unit_vector_y,
+                                      real_t[:] unit_vector_z,
+                                      int numthreads=1):
+    """
+    Same as project_vector_oriented_image but here with an openmp implementation.
+    """
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip, threadnum
+    cdef double x, y, h, w, v_x, v_y, v_z
+    cdef double cen_x, cen_y, cen_z
+    cdef int use_weights = weights.shape[0] > 0
+    cdef int nvalues = 4 if use_weights else 3
+
+    # One set of images per thread
+    cdef double[:, :, :, ::1] projections = np.zeros((numthreads, nvalues, nx, ny),
+                                                     dtype=np.float64)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            cen_x = xvec[ip] - xc
+            cen_y = yvec[ip] - yc
+            cen_z = zvec[ip] - zc
+
+            x = cen_x * unit_vector_x[0] + cen_y * unit_vector_x[1] + cen_z * unit_vector_x[2]
+            y = cen_x * unit_vector_y[0] + cen_y * unit_vector_y[1] + cen_z * unit_vector_y[2]
+
+            x = (x + sidelength_x/2.0)*nx/sidelength_x
+            y = (y + sidelength_y/2.0)*ny/sidelength_y
+            h = hvec[ip]*nx/sidelength_x
+
+            v_x = (vectors[ip, 0] * unit_vector_x[0] + vectors[ip, 1] * unit_vector_x[1]
+                   + vectors[ip, 2] * unit_vector_x[2])
+            v_y = (vectors[ip, 0] * unit_vector_y[0] + vectors[ip, 1] * unit_vector_y[1]
+                   + vectors[ip, 2] * unit_vector_y[2])
+            v_z = (vectors[ip, 0] * unit_vector_z[0] + vectors[ip, 1] * unit_vector_z[1]
+                   + vectors[ip, 2] * unit_vector_z[2])
+
+            if use_weights:
+                w = weights[ip]
+                _deposit(x, y, h, w*v_x, w*v_y, w*v_z, w, 4, projections, threadnum)
+            else:
+                _deposit(x, y, h, v_x, v_y, v_z, 0., 3, projections, threadnum)
+
+    # Add up contributions from each thread
+    return np.sum(np.asarray(projections), axis=0)
+
+
+cdef inline void _deposit_moments(double x, double y, double h, double variable,
+                                  double weight_p, double[:, :, :, ::1] out,
+                                  int threadnum) noexcept nogil:
+    """
+    Update the running weighted moments of the variable in the pixels
+    overlapped by a particle at (x, y) with smoothing length h (all in units
+    of pixels), using the weighted version of Welford's algorithm.
+    The sum of weights, the mean and the sum of squared deviations from
+    the mean (M2) are stored in out[threadnum, 0], out[threadnum, 1]
+    and out[threadnum, 2], respectively. The kernel is the same as in
+    project_image.
+    """
+    cdef int ix, iy, ih, ipx, ipy
+    cdef int ix_min, ix_max, iy_min, iy_max
+    cdef double dx, dy, r2, h2, weight, norm, w, w_sum, delta
+
+    if h < 1.:
+        h = 1.
+
+    # Index of closest grid point
+    ipx = <int> x
+    ipy = <int> y
+
+    # Smoothing length as integer
+    ih = <int> h + 1
+
+    # Square of smoothing length
+    h2 = h*h
+
+    norm = 0.0
+    for ix in range(ipx - ih, ipx + ih):
+        for iy in range(ipy - ih, ipy + ih):
+            dx = x - 0.5 - <double> ix
+            dy = y - 0.5 - <double> iy
+            r2 = dx*dx + dy*dy
+
+            weight = 1.0 - r2/h2
+            if weight > 0.0:
+                norm = norm + weight
+
+    # Find minimum and maximum integers
+    ix_min = max(0, ipx - ih)
+    iy_min = max(0, ipy - ih)
+    ix_max = min(out.shape[2], ipx + ih)
+    iy_max = min(out.shape[3], ipy + ih)
+
+    for ix in range(ix_min, ix_max):
+        for iy in range(iy_min, iy_max):
+            dx = x - 0.5 - <double> ix
+            dy = y - 0.5 - <double> iy
+            r2 = dx*dx + dy*dy
+
+            weight = 1.0 - r2/h2
+            w = weight*weight_p/norm
+            if w > 0.0:
+                if out[threadnum, 0, ix, iy] == 0.0:
+                    # First contribution to this pixel (set the mean exactly)
+                    out[threadnum, 0, ix, iy] = w
+                    out[threadnum, 1, ix, iy] = variable
+                    continue
+                w_sum = out[threadnum, 0, ix, iy] + w
+                delta = variable - out[threadnum, 1, ix, iy]
+                out[threadnum, 0, ix, iy] = w_sum
+                out[threadnum, 1, ix, iy] += delta*w/w_sum
+                out[threadnum, 2, ix, iy] += w*delta*(variable - out[threadnum, 1, ix, iy])
+
+
+def merge_moments(double[:, :, :, ::1] moments):
+    """
+    Merge the weighted moments (sum of weights, mean and M2, see
+    _deposit_moments) of several images, moments[0], moments[1], ...,
+    using the parallel algorithm of Chan et al., which is numerically stable.
+
+    Returns:
+        3d array: The merged moments with shape moments.shape[1:].
+    """
+    cdef int n = moments.shape[0]
+    cdef int nx = moments.shape[2]
+    cdef int ny = moments.shape[3]
+    cdef int ii, ix, iy
+    cdef double w_a, w_b, w_sum, delta
+
+    cdef double[:, :, ::1] merged = np.zeros((3, nx, ny), dtype=np.float64)
+    merged[:, :, :] = moments[0]
+
+    for ii in range(1, n):
+        for ix in range(nx):
+            for iy in range(ny):
+                w_a = merged[0, ix, iy]
+                w_b = moments[ii, 0, ix, iy]
+                if w_b == 0.0:
+                    continue
+                if w_a == 0.0:
+                    merged[0, ix, iy] = w_b
+                    merged[1, ix, iy] = moments[ii, 1, ix, iy]
+                    merged[2, ix, iy] = moments[ii, 2, ix, iy]
+                    continue
+                w_sum = w_a + w_b
+                delta = moments[ii, 1, ix, iy] - merged[1, ix, iy]
+                merged[0, ix, iy] = w_sum
+                merged[1, ix, iy] += delta*w_b/w_sum
+                merged[2, ix, iy] += moments[ii, 2, ix, iy] + delta*delta*w_a*w_b/w_sum
+
+    return np.asarray(merged)
+
+
+def project_moments_image(real_t[:] xvec, real_t[:] yvec, real_t[:] variable,
+                          real_t[:] weights, real_t[:] hvec, int nx,
+                          real_t xc, real_t yc,
+                          real_t sidelength_x, real_t sidelength_y,
+                          real_t boxsize, int numthreads=1):
+    """
+    Projects the weighted moments of a variable in a single pass over the
+    particles, using the same SPH-like kernel as project_image.
+
+    Per pixel, the sum of the (kernel-weighted) weights, the weighted mean
+    of the variable and the weighted sum of squared deviations from the mean
+    (M2) are accumulated with Welford's algorithm. The weighted variance is
+    M2 divided by the sum of weights. Unlike the variance computed from the
+    projections of weights * variable**2 and weights * variable, this does
+    not suffer from catastrophic cancellation.
+
+    Parameters:
+        xvec (array, N): positions along x (horizontal)
+        yvec (array, N): positions along y (vertical)
+        variable (array, N): variable (e.g. line-of-sight velocity)
+        weights (array, N): non-negative weights (e.g. mass)
+        hsml (array, N): size of particles
+        sidelength_x (double): size of image along x
+        sidelength_y (double): size of image along y
+        boxsize (double): size of simulation domain,
+                           which for now is assumed to be cubic!
+
+    Returns:
+        3d array: An array with shape (3, nx, ny) with the sum of weights,
+                  the mean and M2.
+    """
+
+    assert numthreads == 1, 'use project_moments_image_omp for more than one thread'
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip
+    cdef double x, y, h
+
+    # Lower left corner of image in Arepo coordinates
+    cdef double x0 = xc - sidelength_x / 2.0
+    cdef double y0 = yc - sidelength_y / 2.0
+
+    cdef double[:, :, :, ::1] moments = np.zeros((1, 3, nx, ny), dtype=np.float64)
+
+    for ip in range(Np):
+        # Position of particle in units of sidelength (0, sidelength)
+        x = (xvec[ip] - x0)*nx/sidelength_x
+        y = (yvec[ip] - y0)*ny/sidelength_y
+        h = hvec[ip]*nx/sidelength_x
+        _deposit_moments(x, y, h, variable[ip], weights[ip], moments, 0)
+
+    return np.asarray(moments)[0]
+
+
+def project_moments_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] variable,
+                              real_t[:] weights, real_t[:] hvec, int nx,
+                              real_t xc, real_t yc,
+                              real_t sidelength_x, real_t sidelength_y,
+                              real_t boxsize, int numthreads):
+    """
+    Same as project_moments_image but here with an openmp parallel implementation.
+    The moments of the threads are merged with merge_moments.
+    """
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip, threadnum
+    cdef double x, y, h
+
+    # Lower left corner of image in Arepo coordinates
+    cdef double x0 = xc - sidelength_x / 2.0
+    cdef double y0 = yc - sidelength_y / 2.0
+
+    # One set of moments per thread
+    cdef double[:, :, :, ::1] moments = np.zeros((numthreads, 3, nx, ny),
+                                                 dtype=np.float64)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            x = (xvec[ip] - x0)*nx/sidelength_x
+            y = (yvec[ip] - y0)*ny/sidelength_y
+            h = hvec[ip]*nx/sidelength_x
+            _deposit_moments(x, y, h, variable[ip], weights[ip], moments, threadnum)
+
+    return merge_moments(moments)
+
+
+def project_moments_oriented_image(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                   real_t[:] variable, real_t[:] weights,
+                                   real_t[:] hvec, int nx,
+                                   real_t xc, real_t yc, real_t zc,
+                                   real_t sidelength_x, real_t sidelength_y,
+                                   real_t boxsize,
+                                   real_t[:] unit_vector_x,
+                                   real_t[:] unit_vector_y,
+                                   real_t[:] unit_vector_z,
+                                   int numthreads=1):
+    """
+    Same as project_moments_image but for an image plane with an
+    orientation, see project_oriented_image.
+    """
+
+    assert numthreads == 1, 'use project_moments_oriented_image_omp for more than one thread'
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip
+    cdef double x, y, h
+    cdef double cen_x, cen_y, cen_z
+
+    cdef double[:, :, :, ::1] moments = np.zeros((1, 3, nx, ny), dtype=np.float64)
+
+    for ip in range(Np):
+        # Centered coordinates
+        cen_x = xvec[ip] - xc
+        cen_y = yvec[ip] - yc
+        cen_z = zvec[ip] - zc
+
+        # Projection of coordinate along perp_vector1 and perp_vector2
+        x = cen_x * unit_vector_x[0] + cen_y * unit_vector_x[1] + cen_z * unit_vector_x[2]
+        y = cen_x * unit_vector_y[0] + cen_y * unit_vector_y[1] + cen_z * unit_vector_y[2]
+
+        # Position of particle in units of sidelength (0, sidelength)
+        x = (x + sidelength_x/2.0)*nx/sidelength_x
+        y = (y + sidelength_y/2.0)*ny/sidelength_y
+        h = hvec[ip]*nx/sidelength_x
+        _deposit_moments(x, y, h, variable[ip], weights[ip], moments, 0)
+
+    return np.asarray(moments)[0]
+
+
+def project_moments_oriented_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                       real_t[:] variable, real_t[:] weights,
+                                       real_t[:] hvec, int nx,
+                                       real_t xc, real_t yc, real_t zc,
+                                       real_t sidelength_x, real_t sidelength_y,
+                                       real_t boxsize,
+                                       real_t[:] unit_vector_x,
+                                       real_t[:] unit_vector_y,
+                                       real_t[:] unit_vector_z,
+                                       int numthreads=1):
+    """
+    Same as project_moments_oriented_image but here with an openmp implementation.
+    """
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip, threadnum
+    cdef double x, y, h
+    cdef double cen_x, cen_y, cen_z
+
+    # One set of moments per thread
+    cdef double[:, :, :, ::1] moments = np.zeros((numthreads, 3, nx, ny),
+                                                 dtype=np.float64)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            cen_x = xvec[ip] - xc
+            cen_y = yvec[ip] - yc
+            cen_z = zvec[ip] - zc
+
+            x = cen_x * unit_vector_x[0] + cen_y * unit_vector_x[1] + cen_z * unit_vector_x[2]
+            y = cen_x * unit_vector_y[0] + cen_y * unit_vector_y[1] + cen_z * unit_vector_y[2]
+
+            x = (x + sidelength_x/2.0)*nx/sidelength_x
+            y = (y + sidelength_y/2.0)*ny/sidelength_y
+            h = hvec[ip]*nx/sidelength_x
+            _deposit_moments(x, y, h, variable[ip], weights[ip], moments, threadnum)
+
+    return merge_moments(moments)
+
+
+cdef inline void _deposit_extremum(double x, double y, double h, double variable,
+                                   int find_max, double[:, :, ::1] out,
+                                   int threadnum) noexcept nogil:
+    """
+    Update the maximum (if find_max is 1) or minimum (if find_max is 0)
+    of out[threadnum] in the pixels overlapped by the kernel of a particle
+    at (x, y) with smoothing length h (all in units of pixels), i.e., the
+    pixels to which project_image would deposit the particle.
+    """
+    cdef int ix, iy, ih, ipx, ipy
+    cdef int ix_min, ix_max, iy_min, iy_max
+    cdef double dx, dy, r2, h2
+
+    if h < 1.:
+        h = 1.
+
+    # Index of closest grid point
+    ipx = <int> x
+    ipy = <int> y
+
+    # Smoothing length as integer
+    ih = <int> h + 1
+
+    # Square of smoothing length
+    h2 = h*h
+
+    # Find minimum and maximum integers
+    ix_min = max(0, ipx - ih)
+    iy_min = max(0, ipy - ih)
+    ix_max = min(out.shape[1], ipx + ih)
+    iy_max = min(out.shape[2], ipy + ih)
+
+    for ix in range(ix_min, ix_max):
+        for iy in range(iy_min, iy_max):
+            dx = x - 0.5 - <double> ix
+            dy = y - 0.5 - <double> iy
+            r2 = dx*dx + dy*dy
+
+            if r2 < h2:
+                if find_max:
+                    if variable > out[threadnum, ix, iy]:
+                        out[threadnum, ix, iy] = variable
+                else:
+                    if variable < out[threadnum, ix, iy]:
+                        out[threadnum, ix, iy] = variable
+
+
+def _reduce_extremum(double[:, :, ::1] images, int find_max):
+    """
+    Reduce the per-thread images of the project_extremum functions,
+    setting pixels without any particles to nan.
+    """
+    images_arr = np.asarray(images)
+    if find_max:
+        image = np.max(images_arr, axis=0)
+    else:
+        image = np.min(images_arr, axis=0)
+    image[np.isinf(image)] = np.nan
+    return image
+
+
+def project_extremum_image(real_t[:] xvec, real_t[:] yvec, real_t[:] variable,
+                           int find_max, real_t[:] hvec, int nx,
+                           real_t xc, real_t yc,
+                           real_t sidelength_x, real_t sidelength_y,
+                           real_t boxsize, int numthreads=1):
+    """
+    Finds the maximum (if find_max is 1) or minimum (if find_max is 0)
+    of a variable along the line of sight of each pixel, i.e., over the
+    particles whose kernel (the same as in project_image) overlaps the pixel.
+
+    Parameters:
+        xvec (array, N): positions along x (horizontal)
+        yvec (array, N): positions along y (vertical)
+        variable (array, N): variable (e.g. temperature)
+        find_max (int): 1 for the maximum and 0 for the minimum
+        hsml (array, N): size of particles
+        sidelength_x (double): size of image along x
+        sidelength_y (double): size of image along y
+        boxsize (double): size of simulation domain,
+                           which for now is assumed to be cubic!
+
+    Returns:
+        2d array: A 2D array with the maximum (or minimum), which is nan
+                  for pixels without any particles.
+    """
+
+    assert numthreads == 1, 'use project_extremum_image_omp for more than one thread'
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip
+    cdef double x, y, h
+
+    # Lower left corner of image in Arepo coordinates
+    cdef double x0 = xc - sidelength_x / 2.0
+    cdef double y0 = yc - sidelength_y / 2.0
+
+    cdef double[:, :, ::1] images = np.full((1, nx, ny), -np.inf if find_max else np.inf)
+
+    for ip in range(Np):
+        # Position of particle in units of sidelength (0, sidelength)
+        x = (xvec[ip] - x0)*nx/sidelength_x
+        y = (yvec[ip] - y0)*ny/sidelength_y
+        h = hvec[ip]*nx/sidelength_x
+        _deposit_extremum(x, y, h, variable[ip], find_max, images, 0)
+
+    return _reduce_extremum(images, find_max)
+
+
+def project_extremum_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] variable,
+                               int find_max, real_t[:] hvec, int nx,
+                               real_t xc, real_t yc,
+                               real_t sidelength_x, real_t sidelength_y,
+                               real_t boxsize, int numthreads):
+    """
+    Same as project_extremum_image but here with an openmp parallel
+    implementation, in which each thread updates its own image.
+    """
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip, threadnum
+    cdef double x, y, h
+
+    # Lower left corner of image in Arepo coordinates
+    cdef double x0 = xc - sidelength_x / 2.0
+    cdef double y0 = yc - sidelength_y / 2.0
+
+    # One image per thread
+    cdef double[:, :, ::1] images = np.full((numthreads, nx, ny),
+                                            -np.inf if find_max else np.inf)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            x = (xvec[ip] - x0)*nx/sidelength_x
+            y = (yvec[ip] - y0)*ny/sidelength_y
+            h = hvec[ip]*nx/sidelength_x
+            _deposit_extremum(x, y, h, variable[ip], find_max, images, threadnum)
+
+    return _reduce_extremum(images, find_max)
+
+
+def project_extremum_oriented_image(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                    real_t[:] variable, int find_max,
+                                    real_t[:] hvec, int nx,
+                                    real_t xc, real_t yc, real_t zc,
+                                    real_t sidelength_x, real_t sidelength_y,
+                                    real_t boxsize,
+                                    real_t[:] unit_vector_x,
+                                    real_t[:] unit_vector_y,
+                                    real_t[:] unit_vector_z,
+                                    int numthreads=1):
+    """
+    Same as project_extremum_image but for an image plane with an
+    orientation, see project_oriented_image.
+    """
+
+    assert numthreads == 1, 'use project_extremum_oriented_image_omp for more than one thread'
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip
+    cdef double x, y, h
+    cdef double cen_x, cen_y, cen_z
+
+    cdef double[:, :, ::1] images = np.full((1, nx, ny), -np.inf if find_max else np.inf)
+
+    for ip in range(Np):
+        # Centered coordinates
+        cen_x = xvec[ip] - xc
+        cen_y = yvec[ip] - yc
+        cen_z = zvec[ip] - zc
+
+        # Projection of coordinate along perp_vector1 and perp_vector2
+        x = cen_x * unit_vector_x[0] + cen_y * unit_vector_x[1] + cen_z * unit_vector_x[2]
+        y = cen_x * unit_vector_y[0] + cen_y * unit_vector_y[1] + cen_z * unit_vector_y[2]
+
+        # Position of particle in units of sidelength (0, sidelength)
+        x = (x + sidelength_x/2.0)*nx/sidelength_x
+        y = (y + sidelength_y/2.0)*ny/sidelength_y
+        h = hvec[ip]*nx/sidelength_x
+        _deposit_extremum(x, y, h, variable[ip], find_max, images, 0)
+
+    return _reduce_extremum(images, find_max)
+
+
+def project_extremum_oriented_image_omp(real_t[:] xvec, real_t[:] yvec, real_t[:] zvec,
+                                        real_t[:] variable, int find_max,
+                                        real_t[:] hvec, int nx,
+                                        real_t xc, real_t yc, real_t zc,
+                                        real_t sidelength_x, real_t sidelength_y,
+                                        real_t boxsize,
+                                        real_t[:] unit_vector_x,
+                                        real_t[:] unit_vector_y,
+                                        real_t[:] unit_vector_z,
+                                        int numthreads=1):
+    """
+    Same as project_extremum_oriented_image but here with an openmp implementation.
+    """
+
+    # Number of particles
+    cdef int Np = xvec.shape[0]
+
+    # Shape of projection array
+    cdef int ny = <int> (sidelength_y/sidelength_x * nx)
+    msg = '(sidelength_y/sidelength_x * nx) needs to be an integer'
+    assert (sidelength_y/sidelength_x * nx) == <float> ny, msg
+    assert sidelength_x/nx == sidelength_y/ny
+
+    cdef int ip, threadnum
+    cdef double x, y, h
+    cdef double cen_x, cen_y, cen_z
+
+    # One image per thread
+    cdef double[:, :, ::1] images = np.full((numthreads, nx, ny),
+                                            -np.inf if find_max else np.inf)
+
+    with nogil, parallel(num_threads=numthreads):
+        for ip in prange(Np, schedule='static'):
+            threadnum = openmp.omp_get_thread_num()
+            cen_x = xvec[ip] - xc
+            cen_y = yvec[ip] - yc
+            cen_z = zvec[ip] - zc
+
+            x = cen_x * unit_vector_x[0] + cen_y * unit_vector_x[1] + cen_z * unit_vector_x[2]
+            y = cen_x * unit_vector_y[0] + cen_y * unit_vector_y[1] + cen_z * unit_vector_y[2]
+
+            x = (x + sidelength_x/2.0)*nx/sidelength_x
+            y = (y + sidelength_y/2.0)*ny/sidelength_y
+            h = hvec[ip]*nx/sidelength_x
+            _deposit_extremum(x, y, h, variable[ip], find_max, images, threadnum)
+
+    return _reduce_extremum(images, find_max)
@@ -0,0 +1,450 @@
+"""
+This module defines accumulators for 1D and 2D histograms, which can be
+updated with chunks of data, merged with each other and saved/loaded
+as partial results.
+"""
+import h5py
+import numpy as np
+from .. import units as pu
+from .. import util
+from .. import settings
+from .histogram import _make_bins, _get_weight_arrays
+
+
+class _HistogramAccumulator:
+    """
+    Base class for the histogram accumulators, which keeps track of the
+    accumulated counts and sums of weights and implements merging and
+    saving/loading. The subclasses implement the binning.
+    """
+
+    # Names of the attributes with the bin edges (set by the subclasses)
+    _edge_names = []
+
+    def _initialize(self, logscale):
+        """
+        Initialize the accumulated data.
+        """
+        self.logscale = logscale
+
+        # The unit quantities of the data on the axes (None without units)
+        self._axis_uqs = [getattr(getattr(self, name), 'unit_quantity', None)
+                          for name in self._edge_names]
+
+        # Number of data points in each bin
+        self.count = np.zeros(self._shape, dtype=np.int64)
+
+        # Sums of the weights in each bin (and their unit quantities),
+        # the keys of these are set by the first update
+        self.keys = None
+        self._named = False
+        self.sums = {}
+        self._weight_uqs = {}
+
+    @property
+    def _shape(self):
+        return tuple(getattr(self, name).shape[0] - 1 for name in self._edge_names)
+
+    @staticmethod
+    def _get_value(data, unit_quantity, name):
+        """
+        Get the data as a numpy array in the unit of unit_quantity.
+        """
+        if not hasattr(data, 'unit'):
+            if unit_quantity is not None:
+                raise RuntimeError(f'{name} needs to have units')
+            return np.asarray(data)
+
+        if unit_quantity is None:
+            raise RuntimeError(f'{name} has units but the accumulated data does not')
+
+        if isinstance(data, pu.PaicosQuantity):
+            bases = [str(base) for base in data.unit.bases]
+            if 'small_a' in bases and not np.isclose(data._a, unit_quantity._a):
+                err_msg = (f'{name} is in comoving units at a different scale factor '
+                           + 'than the accumulated data, please use physical units '
+                           + '(e.g. with .to_physical)')
+                raise RuntimeError(err_msg)
+
+        if data.unit != unit_quantity.unit:
+            data = data.to(unit_quantity.unit)
+
+        return data.value
+
+    def _set_keys(self, weights):
+        """
+        Get the names and the list of weights, and set up the sums
+        on the first update with weights.
+        """
+        if isinstance(weights, dict):
+            keys = list(weights.keys())
+            weights = list(weights.values())
+            named = True
+        else:
+            keys = ['weights']
+            weights = [weights]
+            named = False
+
+        if self.keys is None:
+            self.keys = keys
+            self._named = named
+            for key, weight in zip(keys, weights):
+                self.sums[key] = np.zeros(self._shape)
+                self._weight_uqs[key] = getattr(weight, 'unit_quantity', None)
+        elif keys != self.keys or named != self._named:
+            raise RuntimeError(f'Expected the weights {self.keys} but got {keys}')
+
+        return weights
+
+    def _accumulate(self, idigit, weights):
+        """
+        Add the counts and weights of the data with (flattened) bin indices
+        idigit (0 for data outside the histogram).
+        """
+        if settings.openMP_has_issues:
+            from ..cython.histogram import get_hists_from_weights_and_idigit as get_hists
+        else:
+            from ..cython.histogram import get_hists_from_weights_and_idigit_omp as get_hists
+
+        n_bins = int(np.prod(self._shape))
+        count = np.bincount(idigit, minlength=n_bins + 1)[1:n_bins + 1]
+        self.count += count.reshape(self._shape)
+
+        if weights is None:
+            # Only counting (the keys are an empty list)
+            if self.keys is None:
+                self.keys = []
+            elif len(self.keys) > 0:
+                raise RuntimeError(f'Expected the weights {self.keys}')
+            return
+
+        weights = self._set_keys(weights)
+        arrays = [self._get_value(weight, self._weight_uqs[key], key)
+                  for key, weight in zip(self.keys, weights)]
+
+        hists = get_hists(n_bins + 1, _get_weight_arrays(arrays), idigit,
+                          numthreads=settings.numthreads_reduction)
+        for key, hist in zip(self.keys, hists):
+            self.sums[key] += hist.reshape(self._shape)
+
+    def merge(self, other):
+        """
+        Add the data accumulated by another accumulator (with the same
+        binning and weights) to this one, e.g. from another chunk of data,
+        process, snapshot or halo.
+
+        Parameters:
+            other (accumulator): The other accumulator.
+
+        Returns:
+            The accumulator itself.
+        """
+        if type(other) is not type(self):
+            raise RuntimeError('Can only merge accumulators of the same type')
+
+        for name in self._edge_names:
+            edges = getattr(self, name)
+            other_edges = getattr(other, name)
+            if hasattr(edges, 'unit'):
+                if edges.unit != other_edges.unit:
+                    raise RuntimeError('The bin edges have different units')
+                edges = edges.value
+                other_edges = other_edges.value
+            if not np.array_equal(edges, other_edges) or self.logscale != other.logscale:
+                raise RuntimeError('The accumulators have different binning')
+
+        if other.keys is not None:
+            if self.keys is None:
+                self.keys = list(other.keys)
+                self._named = other._named
+                for key in self.keys:
+                    self.sums[key] = np.zeros(self._shape)
+                    self._weight_uqs[key] = other._weight_uqs[key]
+            elif other.keys != self.keys:
+                raise RuntimeError(f'Expected the weights {self.keys} but got {other.keys}')
+
+            for key in self.keys:
+                uq = self._weight_uqs[key]
+                other_uq = other._weight_uqs[key]
+                if (uq is None) != (other_uq is None) or \
+                        (uq is not None and uq.unit != other_uq.unit):
+                    raise RuntimeError(f'The weights {key} have different units')
+                self.sums[key] += other.sums[key]
+
+        self.count += other.count
+
+        return self
+
+    def _add_units(self, hist, unit_quantity):
+        """
+        Return the histogram in the orientation of Histogram/Histogram2D
+        and with units.
+        """
+        hist = self._orient(hist)
+        if unit_quantity is not None:
+            hist = hist * unit_quantity
+        return hist
+
+    @staticmethod
+    def _orient(hist):
+        return hist
+
+    def finalize(self):
+        """
+        Get the accumulated histogram(s).
+
+        Returns:
+            The histogram of the weights (with the units of the weights),
+            or a dictionary with a histogram for each of the weights if
+            the weights were passed as a dictionary. If no weights were
+            passed, the number of data points in each bin is returned.
+        """
+        if not self.keys:
+            return self._orient(self.count)
+
+        hists = {key: self._add_units(self.sums[key], self._weight_uqs[key])
+                 for key in self.keys}
+
+        if self._named:
+            return hists
+        return hists['weights']
+
+    def save(self, writer, group='histogram_accumulator'):
+        """
+        Save the accumulated data in an hdf5 file, such that it can be
+        loaded (with the load method) and merged with other partial results.
+
+        Parameters:
+            writer (PaicosWriter): The writer for the hdf5 file, e.g.
+                                   PaicosWriter(snap, basedir, 'profiles').
+
+            group (str): The name of the group in the hdf5 file in which the
+                         data is saved (default: 'histogram_accumulator').
+        """
+        group_attrs = {'accumulator': type(self).__name__,
+                       'logscale': self.logscale,
+                       'named': self._named}
+        if self.keys:
+            group_attrs['keys'] = self.keys
+
+        for name in self._edge_names:
+            writer.write_data(name, getattr(self, name), group=group,
+                              group_attrs=group_attrs)
+
+        writer.write_data('count', self.count, group=group)
+
+        for key in self.sums:
+            writer.write_data(key, self._add_units(self.sums[key], self._weight_uqs[key]),
+                              group=group + '/sums')
+
+    @classmethod
+    def load(cls, filename, group='histogram_accumulator'):
+        """
+        Load an accumulator saved with the save method.
+
+        Parameters:
+            filename (str): The hdf5 file, e.g. writer.filename.
+
+            group (str): The name of the group in the hdf5 file
+                         (default: 'histogram_accumulator').
+
+        Returns:
+            The accumulator.
+        """
+        with h5py.File(filename, 'r') as f:
+            attrs = f[group].attrs
+            if attrs['accumulator'] != cls.__name__:
+                raise RuntimeError(f"The group {group} contains a {attrs['accumulator']}")
+
+            accumulator = cls.__new__(cls)
+            for name in cls._edge_names:
+                setattr(accumulator, name, util.load_dataset(f, name, group=group))
+            accumulator._initialize(bool(attrs['logscale']))
+            accumulator.count = f[group]['count'][()]
+
+            if 'keys' in attrs:
+                accumulator.keys = [str(key) for key in attrs['keys']]
+                accumulator._named = bool(attrs['named'])
+                for key in accumulator.keys:
+                    hist = util.load_dataset(f, key, group=group + '/sums')
+                    accumulator._weight_uqs[key] = getattr(hist, 'unit_quantity', None)
+                    if hasattr(hist, 'unit'):
+                        hist = hist.value
+                    accumulator.sums[key] = accumulator._orient(np.array(hist))
+            else:
+                accumulator.keys = []
+
+        accumulator._set_centers()
+        return accumulator
+
+
+class HistogramAccumulator(_HistogramAccumulator):
+    """
+    An accumulator for 1D histograms (e.g. radial profiles) of data which
+    is passed in chunks, e.g. for data that does not fit in memory or for
+    stacking over many snapshots or halos.
+
+    The histograms are identical to those of the Histogram class with the
+    same binning. Accumulators with the same binning can be merged, and
+    partial results can be saved and loaded, such that chunked,
+    multi-process and multi-snapshot histograms can be combined.
+
+    Example::
+
+        acc = pa.HistogramAccumulator([r_min, r_max, 50], logscale=True)
+        for snap in snapshots:
+            r = ...
+            acc.update(r, {'M': snap['0_Masses'], 'V': snap['0_Volume']})
+        hists = acc.finalize()
+        density = hists['M'] / hists['V']
+    """
+
+    _edge_names = ['edges']
+
+    def __init__(self, bins, logscale=False):
+        """
+        Initialize the accumulator.
+
+        Parameters:
+            bins (tuple): Tuple of lower edge, upper edge and number of bins.
+
+            logscale (bool): Indicates whether to use logscale for the
+                             histogram, default is False.
+        """
+        if isinstance(bins, int):
+            raise RuntimeError('The accumulator requires bins=[lower, upper, nbins]')
+        self.edges, self.centers = _make_bins(bins, logscale)
+        self.bin_edges = self.edges
+        self.bin_centers = self.centers
+        self._initialize(logscale)
+
+    def _set_centers(self):
+        _, self.centers = _make_bins([self.edges[0], self.edges[-1],
+                                      self.edges.shape[0] - 1], self.logscale)
+        self.bin_edges = self.edges
+        self.bin_centers = self.centers
+
+    def update(self, x, weights=None):
+        """
+        Add a chunk of data to the histogram.
+
+        Parameters:
+            x (array): The x-coordinates of the data.
+
+            weights (array or dict): The weights of the data, either as an
+                                     array or as a dictionary of arrays for
+                                     accumulating several histograms. Default
+                                     is None, in which case only the number
+                                     of data points in the bins is counted.
+        """
+        if settings.openMP_has_issues:
+            from ..cython.histogram import digitize_uniform as digitize
+        else:
+            from ..cython.histogram import digitize_uniform_omp as digitize
+
+        x = self._get_value(x, self._axis_uqs[0], 'x')
+        edges = self.edges.value if hasattr(self.edges, 'unit') else self.edges
+
+        idigit = digitize(np.asarray(x, dtype=np.float64), np.asarray(edges, dtype=np.float64),
+                          self.logscale, numthreads=settings.numthreads_reduction)
+
+        # Data outside the histogram (np.digitize convention) goes to bin 0
+        idigit[idigit == edges.shape[0]] = 0
+
+        self._accumulate(idigit, weights)
+
+
+class Histogram2DAccumulator(_HistogramAccumulator):
+    """
+    An accumulator for 2D histograms (e.g. phase diagrams) of data which
+    is passed in chunks, e.g. for data that does not fit in memory or for
+    stacking over many snapshots or halos.
+
+    The binning is the same as in the Histogram2D class, and the finalized
+    histograms are equal to Histogram2D(..., normalize=False).hist2d
+    (without the normalization and units per bin area of the Histogram2D).
+    Accumulators with the same binning can be merged, and partial results
+    can be saved and loaded, such that chunked, multi-process and
+    multi-snapshot histograms can be combined.
+
+    Example::
+
+        acc = pa.Histogram2DAccumulator([rho_min, rho_max, 200],
+                                        [T_min, T_max, 200])
+        for chunk in chunks:
+            acc.update(rho[chunk], T[chunk], M[chunk])
+        hist2d = acc.finalize()
+    """
+
+    _edge_names = ['edges_x', 'edges_y']
+
+    def __init__(self, bins_x, bins_y, logscale=True):
+        """
+        Initialize the accumulator.
+
+        Parameters:
+            bins_x (tuple): Tuple of lower edge, upper edge and number
+                            of bins for x axis.
+
+            bins_y (tuple): Tuple of lower edge, upper edge and number
+                            of bins for y axis.
+
+            logscale (bool): Indicates whether to use logscale for the
+                             histogram, default is True.
+        """
+        if isinstance(bins_x, int) or isinstance(bins_y, int):
+            raise RuntimeError('The accumulator requires bins=[lower, upper, nbins]')
+        assert bins_x[0] < bins_x[1], 'min and max values swapped!'
+        assert bins_y[0] < bins_y[1], 'min and max values swapped!'
+        if logscale:
+            assert bins_x[0] > 0
+            assert bins_y[0] > 0
+
+        self.edges_x, self.centers_x = _make_bins(bins_x, logscale)
+        self.edges_y, self.centers_y = _make_bins(bins_y, logscale)
+        self._initialize(logscale)
+
+    def _set_centers(self):
+        _, self.centers_x = _make_bins([self.edges_x[0], self.edges_x[-1],
+                                        self.edges_x.shape[0] - 1], self.logscale)
+        _, self.centers_y = _make_bins([self.edges_y[0], self.edges_y[-1],
+                                        self.edges_y.shape[0] - 1], self.logscale)
+
+    @staticmethod
+    def _orient(hist):
+        # Same orientation as Histogram2D.hist2d, i.e., (nbins_y, nbins_x)
+        return hist.T
+
+    def update(self, x, y, weights=None):
+        """
+        Add a chunk of data to the histogram.
+
+        Parameters:
+            x (array): The x data for the histogram.
+
+            y (array): The y data for the histogram.
+
+            weights (array or dict): The weights of the data, either as an
+                                     array or as a dictionary of arrays for
+                                     accumulating several histograms. Default
+                                     is None, in which case only the number
+                                     of data points in the bins is counted.
+        """
+        if settings.openMP_has_issues:
+            from ..cython.histogram import digitize_2d as digitize
+        else:
+            from ..cython.histogram import digitize_2d_omp as digitize
+
+        x = np.asarray(self._get_value(x, self._axis_uqs[0], 'x'), dtype=np.float64)
+        y = np.asarray(self._get_value(y, self._axis_uqs[1], 'y'), dtype=np.float64)
+        assert x.shape == y.shape
+
+        edges_x = self.edges_x.value if hasattr(self.edges_x, 'unit') else self.edges_x
+        edges_y = self.edges_y.value if hasattr(self.edges_y, 'unit') else self.edges_y
+
+        idigit = digitize(x, y,
+                          edges_x[0], edges_x[-1], edges_x.shape[0] - 1,
+                          edges_y[0], edges_y[-1], edges_y.shape[0] - 1,
+                          self.logscale, numthreads=settings.numthreads_reduction)
+
+        self._accumulate(idigit, weights)
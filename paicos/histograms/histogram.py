@@ -5,7 +5,6 @@ import time
 import numpy as np
 from .. import util
 from .. import settings
-from ..cython.histogram import get_hist_from_weights_and_idigit as func
 
 
 def _make_bins(bins, logscale):
@@ -58,12 +57,31 @@ def _make_bins_helper(lower, upper, nbins, logscale):
     return edges, centers
 
 
+def _get_weight_arrays(weights):
+    """
+    Private function which converts a list of weights (with or without
+    units) to a list of contiguous float64 arrays without units (only
+    copying the weights that are not already of this type), which
+    allows computing the histograms for all the weights in a single pass.
+    """
+    arrays = []
+    for weight in weights:
+        if hasattr(weight, 'unit'):
+            weight = weight.value
+        arrays.append(np.ascontiguousarray(weight, dtype=np.float64))
+    return arrays
+
+
 class Histogram:
     """
     This is a brief class for efficient computation of many 1D histograms
     using the same x-variables and binning but different weights.
 
-    The heavy part of the computation is stored in idigit
+    The heavy part of the computation is stored in idigit, an int32 array
+    with the bin index of each data point, which is found in parallel
+    using a closed-form expression for the evenly spaced (linear or log)
+    bins. The histograms for the different weights are then computed by
+    a single parallel pass through idigit.
     """
 
     def __init__(self, x, bins, logscale=False, verbose=False):
@@ -96,10 +114,32 @@ class Histogram:
             t = time.time()
             print('Digitize for histogram begun')
 
-        self.idigit = np.digitize(x, self.edges)
+        self.idigit = self._cython_digitize(x, self.edges)
         if self.verbose:
             print(f'This took {time.time() - t:1.2f} seconds')
 
+    def _cython_digitize(self, x, edges):
+        """
+        Private method for finding the bin indices of x using cython
+        """
+        if settings.openMP_has_issues:
+            from ..cython.histogram import digitize_uniform as digitize
+        else:
+            from ..cython.histogram import digitize_uniform_omp as digitize
+
+        if hasattr(x, 'unit'):
+            if x.unit != edges.unit:
+                x = x.to(edges.unit)
+            x = x.value
+            edges = edges.value
+
+        x = np.asarray(x)
+        if x.dtype not in [np.float32, np.float64]:
+            x = x.astype(np.float64)
+
+        return digitize(x, np.asarray(edges, dtype=np.float64), self.logscale,
+                        numthreads=settings.numthreads_reduction)
+
     def hist(self, weights):
         """
         Compute the histogram of the data.
@@ -110,13 +150,63 @@ class Histogram:
         Returns:
             array: Histogram of the data.
         """
+        if settings.openMP_has_issues:
+            from ..cython.histogram import get_hist_from_weights_and_idigit as func
+        else:
+            from ..cython.histogram import get_hist_from_weights_and_idigit_omp as func
 
         get_hist_from_weights_and_idigit = util.remove_astro_units(func)
 
         # compute histogram using pre-digitized x-coordinates and given weights
         hist = get_hist_from_weights_and_idigit(self.edges.shape[0], weights,
-                                                self.idigit)
+                                                self.idigit,
+                                                numthreads=settings.numthreads_reduction)
         if settings.use_units:
             hist = hist * weights.unit_quantity
 
         return hist
+
+    def hist_many(self, weights):
+        """
+        Compute the histograms of the data for several weights at once,
+        using a single pass through the data.
+
+        Parameters:
+            weights (list or dict): The weights of the data, either as a
+                                    list of arrays or as a dictionary with
+                                    arrays as values.
+
+        Returns:
+            list or dict: The histograms (with the units of the
+                          corresponding weights), in a list or in a
+                          dictionary with the same keys as the weights.
+
+        Example::
+
+            h_r = pa.Histogram(r, bins, logscale=True)
+            profiles = h_r.hist_many({'Masses': snap['0_Masses'],
+                                      'Volume': snap['0_Volume']})
+            density = profiles['Masses'] / profiles['Volume']
+        """
+        if settings.openMP_has_issues:
+            from ..cython.histogram import get_hists_from_weights_and_idigit as func
+        else:
+            from ..cython.histogram import get_hists_from_weights_and_idigit_omp as func
+
+        keys = None
+        if isinstance(weights, dict):
+            keys = list(weights.keys())
+            weights = list(weights.values())
+
+        hists = func(self.edges.shape[0], _get_weight_arrays(weights), self.idigit,
+                     numthreads=settings.numthreads_reduction)
+
+        results = []
+        for hist, weight in zip(hists, weights):
+            if hasattr(weight, 'unit_quantity'):
+                hist = hist * weight.unit_quantity
+            results.append(hist)
+
+        if keys is not None:
+            return dict(zip(keys, results))
+        return results
@@ -7,7 +7,7 @@ from astropy import units as u
 from .. import units as pu
 from .. import util
 from .. import settings
-from .histogram import _make_bins
+from .histogram import _make_bins, _get_weight_arrays
 from ..cython.histogram import find_normalizing_norm_of_2d_hist
 
 
@@ -19,6 +19,11 @@ class Histogram2D:
     class has methods to calculate the bin edges and centers, remove astro
     units, and create the histogram with a specific normalization. It also has
     a method to generate a color label for the histogram with units.
+
+    The (flattened) 2D bin index of each data point is computed once and
+    stored in idigit, such that histograms of the same x and y data with
+    other weights (see the hist and hist_many methods) only require a
+    parallel scatter-add of the weights.
     """
 
     def __init__(self, snap, x, y, weights=None, bins_x=200, bins_y=200,
@@ -107,6 +112,12 @@ class Histogram2D:
 
         self._get_image_properties()
 
+        # Find the bin index of each data point
+        if settings.use_units:
+            assert self.x.unit == self.edges_x.unit
+            assert self.y.unit == self.edges_y.unit
+        self.idigit = self._cython_digitize(self.x, self.y, self.edges_x, self.edges_y)
+
         # Make the histogram
         self.hist2d = self._make_histogram()
 
@@ -183,32 +194,44 @@ class Histogram2D:
         return self.colorlabel
 
     @util.remove_astro_units
-    def _cython_make_histogram(self, x, y, edges_x, edges_y, weights):
+    def _cython_digitize(self, x, y, edges_x, edges_y):
         """
-        Private method for making the 2D histogram using cython code
+        Private method for finding the (flattened) bin index of each
+        data point using cython code
         """
 
         if settings.openMP_has_issues:
-            from ..cython.histogram import get_hist2d_from_weights as get_hist2d
+            from ..cython.histogram import digitize_2d as digitize
         else:
-            from ..cython.histogram import get_hist2d_from_weights_omp as get_hist2d
+            from ..cython.histogram import digitize_2d_omp as digitize
 
         nbins_x = edges_x.shape[0] - 1
         nbins_y = edges_y.shape[0] - 1
 
-        lower_x = edges_x[0]
-        upper_x = edges_x[-1]
-        lower_y = edges_y[0]
-        upper_y = edges_y[-1]
+        return digitize(x, y,
+                        edges_x[0], edges_x[-1], nbins_x,
+                        edges_y[0], edges_y[-1], nbins_y,
+                        self.logscale,
+                        numthreads=settings.numthreads_reduction)
 
-        hist2d = get_hist2d(
-            x, y, weights,
-            lower_x, upper_x, nbins_x,
-            lower_y, upper_y, nbins_y,
-            self.logscale,
-            numthreads=settings.numthreads_reduction)
+    def _cython_make_histograms(self, weights):
+        """
+        Private method for making 2D histograms for a list of weights
+        (arrays without units) using the stored bin indices
+        """
 
-        return hist2d
+        if settings.openMP_has_issues:
+            from ..cython.histogram import get_hists_from_weights_and_idigit as get_hists
+        else:
+            from ..cython.histogram import get_hists_from_weights_and_idigit_omp as get_hists
+
+        nbins_x = self.edges_x.shape[0] - 1
+        nbins_y = self.edges_y.shape[0] - 1
+
+        hists = get_hists(nbins_x * nbins_y + 1, _get_weight_arrays(weights),
+                          self.idigit, numthreads=settings.numthreads_reduction)
+
+        return hists.reshape((len(weights), nbins_x, nbins_y))
 
     def _make_histogram(self):
         """
@@ -217,43 +240,38 @@ class Histogram2D:
         Returns:
             hist2d (2D array): The 2D histogram
         """
-
-        x = self.x
-        y = self.y
-        weights = self.weights
-        normalize = self.normalize
-
-        # Figure out units for the histogram
         if settings.use_units:
-            if not normalize and (weights is not None):
-                hist_units = weights.unit
-            else:
-                hist_units = u.Unit('')
-            if self.logscale:
-                hist_units *= u.Unit('dex')**(-2)
-            else:
-                hist_units /= x.unit * y.unit
-
-            self.hist_units = hist_units
-
-            assert x.unit == self.edges_x.unit
-            assert y.unit == self.edges_y.unit
+            self.hist_units = self._get_hist_units(self.weights)
 
-        if weights is None:
-            # np.ones_like returns something with units,
-            # should replace with np.ones and the shape
-            weights = np.ones(x.shape, dtype=np.float64)
+        return self.hist(self.weights)
 
-        hist2d = self._cython_make_histogram(x, y, self.edges_x,
-                                             self.edges_y, weights)
+    def _get_hist_units(self, weights):
+        """
+        Private method to figure out the units of the histogram
+        for given weights.
+        """
+        if not self.normalize and (weights is not None):
+            hist_units = weights.unit
+        else:
+            hist_units = u.Unit('')
+        if self.logscale:
+            hist_units *= u.Unit('dex')**(-2)
+        else:
+            hist_units /= self.x.unit * self.y.unit
+        return hist_units
 
+    def _finalize_histogram(self, hist2d, weights):
+        """
+        Private method which transposes the histogram calculated by the
+        cython code, adds units and normalizes it (if normalize is True).
+        """
         hist2d = hist2d.T
 
         if settings.use_units:
-            hist2d = pu.PaicosQuantity(hist2d, self.hist_units, a=self.x._a,
-                                       h=self.x._h,
+            hist2d = pu.PaicosQuantity(hist2d, self._get_hist_units(weights),
+                                       a=self.x._a, h=self.x._h,
                                        comoving_sim=self.x.comoving_sim)
-        if normalize:
+        if self.normalize:
             norm = np.sum(self.area_per_bin * hist2d)
             hist2d /= norm
 
@@ -266,6 +284,65 @@ class Histogram2D:
 
         return hist2d
 
+    def hist(self, weights):
+        """
+        Compute the 2D histogram of the x and y data of the Histogram2D
+        for other weights, using the stored bin indices. The histogram is
+        normalized if the Histogram2D was created with normalize=True.
+
+        Parameters:
+            weights (array, str or None): The weights, e.g. '0_Volume',
+                                          or None for the number of data
+                                          points.
+
+        Returns:
+            hist2d (2D array): The 2D histogram.
+        """
+        return self.hist_many([weights])[0]
+
+    def hist_many(self, weights):
+        """
+        Compute 2D histograms of the x and y data of the Histogram2D for
+        several weights at once, using a single pass through the stored
+        bin indices.
+        The histograms are normalized if the Histogram2D was created
+        with normalize=True.
+
+        Parameters:
+            weights (list or dict): The weights, either as a list or as a
+                                    dictionary with the weights as values.
+                                    Each weight can be an array, a string
+                                    (e.g. '0_Masses') or None (for the
+                                    number of data points).
+
+        Returns:
+            list or dict: The 2D histograms, in a list or in a dictionary
+                          with the same keys as the weights.
+
+        Example::
+
+            r_rho = pa.Histogram2D(snap, r, rho, weights='0_Masses',
+                                   normalize=False)
+            hists = r_rho.hist_many({'M': '0_Masses', 'V': '0_Volume'})
+        """
+        keys = None
+        if isinstance(weights, dict):
+            keys = list(weights.keys())
+            weights = list(weights.values())
+
+        weights = [self.snap[weight] if isinstance(weight, str) else weight
+                   for weight in weights]
+
+        hists = self._cython_make_histograms([np.ones(self.x.shape[0]) if weight is None
+                                              else weight for weight in weights])
+
+        results = [self._finalize_histogram(hist2d, weight)
+                   for hist2d, weight in zip(hists, weights)]
+
+        if keys is not None:
+            return dict(zip(keys, results))
+        return results
+
     def save(self, basedir, basename="2d_histogram"):
         """
         Saves the 2D histogram in the basedir directory.
@@ -0,0 +1,349 @@
+"""
+This module defines a class for N-dimensional histograms.
+"""
+import numpy as np
+import h5py
+from astropy import units as u
+from .. import units as pu
+from .. import util
+from .. import settings
+from .histogram import _make_bins, _get_weight_arrays
+
+
+class HistogramND:
+    """
+    This code defines a HistogramND class which can be used to create
+    N-dimensional histograms, e.g. 3D phase-space histograms of density,
+    temperature and metallicity. Each axis has evenly spaced bins, either
+    in linear or in log scale.
+
+    The (flattened) N-dimensional bin index of each data point is computed
+    once in parallel and stored in idigit, such that histograms with other
+    weights (see the hist and hist_many methods) only require a parallel
+    scatter-add of the weights. The histograms have the shape
+    (nbins_0, nbins_1, ..., nbins_N-1), i.e., the first axis corresponds
+    to the first variable. They contain the sum of the weights in each bin,
+    or the density per bin volume (volume_per_bin) if normalize is True.
+
+    The scatter-add uses a histogram for each thread when these fit within
+    max_thread_memory bytes (the fastest option). For histograms with many
+    bins, the bins are instead split into tiles which are each handled by
+    a single thread, such that the memory use is that of a single histogram.
+    """
+
+    # Maximum total memory (in bytes) for the histograms of the threads
+    max_thread_memory = 2**28
+
+    def __init__(self, snap, variables, weights=None, bins=200,
+                 normalize=True, logscale=True):
+        """
+        Initialize the HistogramND class.
+
+        Parameters:
+            snap (Snapshot): the input snapshot
+
+            variables (list): The data for each axis of the histogram,
+                              arrays or strings (e.g. '0_Density').
+
+            weights (array): The weight data for the histogram, default
+                             is None
+
+            bins (int or list): A list with a tuple of lower edge, upper
+                                edge and number of bins for each axis.
+                                Alternatively an integer (for an axis or
+                                for all axes) denoting the number of bins
+                                spanning the range of the data.
+
+            normalize (bool): Indicates whether the histogram should be
+                              normalized, default is True
+
+            logscale (bool or list): Indicates whether to use logscale for
+                                     the histogram, default is True. Either
+                                     the same for all axes or a list with one
+                                     for each axis.
+
+        Example::
+
+            rho_T_Z = pa.HistogramND(snap, ['0_Density', '0_Temperatures',
+                                            '0_GFM_Metallicity'],
+                                     weights='0_Masses', bins=[100, 100, 20],
+                                     normalize=False)
+        """
+
+        self.snap = snap
+
+        self.variables = [snap[variable] if isinstance(variable, str) else variable
+                          for variable in variables]
+        self.ndim = len(self.variables)
+        assert self.ndim > 0
+
+        if isinstance(weights, str):
+            self.weights = snap[weights]
+        else:
+            self.weights = weights
+
+        self.normalize = normalize
+
+        if isinstance(logscale, (list, tuple, np.ndarray)):
+            assert len(logscale) == self.ndim
+            self.logscale = [bool(log) for log in logscale]
+        else:
+            self.logscale = [bool(logscale)] * self.ndim
+
+        if isinstance(bins, int):
+            bins = [bins] * self.ndim
+        assert len(bins) == self.ndim
+
+        self.edges = []
+        self.centers = []
+        for variable, bins_i, log in zip(self.variables, bins, self.logscale):
+            if isinstance(bins_i, int):
+                bins_i = [variable.min(), variable.max(), bins_i]
+                if log:
+                    bins_i[0] = variable[variable > 0].min()
+            else:
+                assert bins_i[0] < bins_i[1], 'min and max values swapped!'
+
+            if log:
+                assert bins_i[0] > 0
+
+            edges, centers = _make_bins(bins_i, log)
+            self.edges.append(edges)
+            self.centers.append(centers)
+
+        self.lower = [edges[0] for edges in self.edges]
+        self.upper = [edges[-1] for edges in self.edges]
+        self.shape = tuple(edges.shape[0] - 1 for edges in self.edges)
+
+        if np.prod(self.shape, dtype=np.int64) >= np.iinfo(np.int32).max:
+            raise RuntimeError(f'Too many bins, {self.shape}, for int32 bin indices')
+
+        self._get_volume_per_bin()
+
+        # Find the bin index of each data point
+        self.idigit = self._cython_digitize(self.variables, self.edges)
+
+        # Make the histogram
+        self.histnd = self._make_histogram()
+
+    def _get_volume_per_bin(self):
+        """
+        Private method which finds the volume of each bin, i.e., the
+        product of the bin widths (in dex for logscale axes).
+        """
+        self.volume_per_bin = np.ones(self.shape)
+        volume_unit = u.Unit('')
+        for idim, (edges, log) in enumerate(zip(self.edges, self.logscale)):
+            values = edges.value if hasattr(edges, 'unit') else edges
+            if log:
+                width = np.diff(np.log10(values))
+                volume_unit *= u.Unit('dex')
+            else:
+                width = np.diff(values)
+                if hasattr(edges, 'unit'):
+                    volume_unit *= edges.unit
+            shape = [1] * self.ndim
+            shape[idim] = self.shape[idim]
+            self.volume_per_bin = self.volume_per_bin * width.reshape(shape)
+
+        if settings.use_units:
+            self.volume_per_bin = self._to_quantity(self.volume_per_bin, volume_unit)
+
+    def _to_quantity(self, data, unit):
+        """
+        Private method which returns data as a PaicosQuantity with the
+        scale factor etc. of the variables.
+        """
+        variable = self.variables[0]
+        return pu.PaicosQuantity(data, unit, a=variable._a, h=variable._h,
+                                 comoving_sim=variable.comoving_sim)
+
+    def _cython_digitize(self, variables, edges):
+        """
+        Private method for finding the (flattened) bin index of each
+        data point using cython code
+        """
+
+        if settings.openMP_has_issues:
+            from ..cython.histogram import digitize_nd as digitize
+        else:
+            from ..cython.histogram import digitize_nd_omp as digitize
+
+        data = []
+        for variable, edges_i in zip(variables, edges):
+            if hasattr(variable, 'unit'):
+                if variable.unit != edges_i.unit:
+                    variable = variable.to(edges_i.unit)
+            data.append(variable)
+        data = _get_weight_arrays(data)
+
+        edges = [edges_i.value if hasattr(edges_i, 'unit') else edges_i
+                 for edges_i in edges]
+        lower = np.array([edges_i[0] for edges_i in edges], dtype=np.float64)
+        upper = np.array([edges_i[-1] for edges_i in edges], dtype=np.float64)
+
+        return digitize(data, lower, upper, np.array(self.shape, dtype=np.int32),
+                        np.array(self.logscale, dtype=np.int32),
+                        numthreads=settings.numthreads_reduction)
+
+    def _cython_make_histograms(self, weights):
+        """
+        Private method for making N-dimensional histograms for a list of
+        weights using the stored bin indices
+        """
+        num_bins = int(np.prod(self.shape))
+        numthreads = settings.numthreads_reduction
+
+        thread_memory = 8 * numthreads * (num_bins + 2) * len(weights)
+
+        if settings.openMP_has_issues:
+            from ..cython.histogram import get_hists_from_weights_and_idigit as get_hists
+            numthreads = 1
+        elif thread_memory > self.max_thread_memory:
+            from ..cython.histogram import get_hists_from_weights_and_idigit_tiled_omp as get_hists
+        else:
+            from ..cython.histogram import get_hists_from_weights_and_idigit_omp as get_hists
+
+        hists = get_hists(num_bins + 1, _get_weight_arrays(weights),
+                          self.idigit, numthreads=numthreads)
+
+        return hists.reshape((len(weights),) + self.shape)
+
+    def _make_histogram(self):
+        """
+        Private method to create the N-dimensional histogram.
+
+        Returns:
+            histnd (array): The N-dimensional histogram
+        """
+        if settings.use_units:
+            self.hist_units = self._get_hist_units(self.weights)
+
+        return self.hist(self.weights)
+
+    def _get_hist_units(self, weights):
+        """
+        Private method to figure out the units of the histogram
+        for given weights.
+        """
+        if self.normalize:
+            return u.Unit('') / self.volume_per_bin.unit
+        if weights is not None:
+            return weights.unit
+        return u.Unit('')
+
+    def _finalize_histogram(self, histnd, weights):
+        """
+        Private method which adds units to the histogram calculated by the
+        cython code and normalizes it (if normalize is True), i.e., the
+        histogram is either the sum of the weights in each bin or the
+        normalized density (per bin volume).
+        """
+        if settings.use_units:
+            if weights is not None and hasattr(weights, 'unit'):
+                histnd = self._to_quantity(histnd, weights.unit)
+            else:
+                histnd = self._to_quantity(histnd, u.Unit(''))
+
+        if self.normalize:
+            norm = np.sum(self.volume_per_bin * histnd)
+            histnd /= norm
+
+            sanity = np.sum(self.volume_per_bin * histnd)
+            if settings.use_units:
+                np.testing.assert_allclose(sanity.value, 1.0)
+                assert sanity.unit == u.Unit(''), f'{sanity.unit} should be dimensionless'
+            else:
+                np.testing.assert_allclose(sanity, 1.0)
+
+        if settings.use_units:
+            assert histnd.unit == self._get_hist_units(weights)
+
+        return histnd
+
+    def hist(self, weights):
+        """
+        Compute the N-dimensional histogram of the variables of the
+        HistogramND for other weights, using the stored bin indices.
+        The histogram is normalized if the HistogramND was created with
+        normalize=True.
+
+        Parameters:
+            weights (array, str or None): The weights, e.g. '0_Volume',
+                                          or None for the number of data
+                                          points.
+
+        Returns:
+            histnd (array): The N-dimensional histogram.
+        """
+        return self.hist_many([weights])[0]
+
+    def hist_many(self, weights):
+        """
+        Compute N-dimensional histograms of the variables of the HistogramND
+        for several weights at once, using a single pass through the stored
+        bin indices.
+        The histograms are normalized if the HistogramND was created
+        with normalize=True.
+
+        Parameters:
+            weights (list or dict): The weights, either as a list or as a
+                                    dictionary with the weights as values.
+                                    Each weight can be an array, a string
+                                    (e.g. '0_Masses') or None (for the
+                                    number of data points).
+
+        Returns:
+            list or dict: The histograms, in a list or in a dictionary
+                          with the same keys as the weights.
+        """
+        keys = None
+        if isinstance(weights, dict):
+            keys = list(weights.keys())
+            weights = list(weights.values())
+
+        weights = [self.snap[weight] if isinstance(weight, str) else weight
+                   for weight in weights]
+
+        npart = self.idigit.shape[0]
+        hists = self._cython_make_histograms([np.ones(npart) if weight is None
+                                              else weight for weight in weights])
+
+        results = [self._finalize_histogram(histnd, weight)
+                   for histnd, weight in zip(hists, weights)]
+
+        if keys is not None:
+            return dict(zip(keys, results))
+        return results
+
+    def save(self, basedir, basename="nd_histogram"):
+        """
+        Saves the N-dimensional histogram in the basedir directory, it can
+        be loaded with the HistogramNDReader.
+
+        Parameters:
+            basedir (path): The directory where the histogram should be saved.
+            basename (string): The basename for the filename, which will take
+                               the form::
+
+                                   filename =  basename + f'_{snapnum:03d}.hdf5'
+        """
+
+        if basedir[-1] != '/':
+            basedir += '/'
+
+        snapnum = self.snap.snapnum
+        filename = basedir + basename + f'_{snapnum:03d}.hdf5'
+        with h5py.File(filename, 'w') as hdf5file:
+            #
+            hdf5file.create_group('hist_info')
+            hdf5file['hist_info'].attrs['ndim'] = self.ndim
+            hdf5file['hist_info'].attrs['logscale'] = self.logscale
+            hdf5file['hist_info'].attrs['normalize'] = self.normalize
+
+            for idim in range(self.ndim):
+                util.save_dataset(hdf5file, f'edges_{idim}', self.edges[idim])
+                util.save_dataset(hdf5file, f'centers_{idim}', self.centers[idim])
+            util.save_dataset(hdf5file, 'histnd', self.histnd)
+
+        util._copy_over_snapshot_information(self.snap, filename)
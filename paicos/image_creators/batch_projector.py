@@ -0,0 +1,339 @@
+"""
+Defines a class that creates small projections (stamps) of a given variable
+for many regions at once, e.g. for all the halos in a catalog.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import h5py
+import numpy as np
+from .projector import Projector
+from ..orientation import Orientation
+from ..trees.bvh_cpu import BinaryTree
+from ..writers.paicos_writer import PaicosWriter
+from .. import settings
+from .. import units
+
+
+class BatchProjector:
+    """
+    A class that allows creating projections of a variable for many
+    regions (stamps) at once, e.g. centered on the halos in snap.Cat.Group.
+
+    Instead of scanning all the cells for each stamp (as a Projector per
+    stamp would), the cells are assigned to the stamps using a single BVH
+    tree (see paicos.trees.bvh_cpu.BinaryTree), after which the stamps are
+    rendered in parallel. The smoothing lengths and the tree are only
+    computed for the cells in the vicinity of the stamps, which are found
+    using a coarse grid. The images are identical to those of a Projector
+    with make_snap_with_selection=False for each of the stamps.
+    """
+
+    def __init__(self, snap, centers, widths, direction, npix=128, parttype=0, nvol=8):
+        """
+        Initialize the BatchProjector class.
+
+        Parameters
+        ----------
+        snap : Snapshot
+            A snapshot object of Snapshot class from paicos package.
+
+        centers : numpy array
+            Centers of the stamps, shape (n_stamps, 3), e.g.
+            snap.Cat.Group['GroupPos'].
+
+        widths : numpy array
+            Widths of the stamps, either with shape (n_stamps, 3) (same
+            convention as for the Projector) or with shape (n_stamps,) for
+            cubic regions, e.g. 2 * snap.Cat.Group['Group_R_Crit200'].
+            All stamps must have the same aspect ratio.
+
+        direction : str, Orientation
+            Direction of the projection, e.g. 'x', 'y' or 'z'
+            or an Orientation instance.
+
+        npix : int, optional
+            Number of pixels in the horizontal direction of the stamps,
+            by default 128.
+
+        parttype : int, optional
+            Number of the particle type to project, by default gas (PartType 0).
+
+        nvol : int, optional
+            Integer used to determine the smoothing length, by default 8
+        """
+        self.snap = snap
+        self.npix = npix
+        self.parttype = parttype
+        self.nvol = nvol
+
+        pos = snap[f'{parttype}_Coordinates']
+        if settings.use_units:
+            centers = centers.to(pos.unit).value
+            widths = widths.to(pos.unit).value
+            self._length_uq = pos.uq
+
+        centers = np.array(centers, dtype=np.float64).reshape(-1, 3)
+        widths = np.array(widths, dtype=np.float64)
+        if widths.ndim == 1:
+            widths = np.repeat(widths[:, None], 3, axis=1)
+        assert widths.shape == centers.shape
+
+        self.centers = centers
+        self.widths = widths
+        self.n_stamps = centers.shape[0]
+
+        if isinstance(direction, Orientation):
+            self.direction = 'orientation'
+            self.orientation = direction.copy
+        else:
+            self.direction = direction
+            if direction not in ['x', 'y', 'z']:
+                raise RuntimeError(f'invalid input for direction={direction}')
+
+        # Indices of the widths along the horizontal and vertical
+        # directions of the image
+        self._image_axes = {'x': (1, 2), 'y': (2, 0), 'z': (0, 1),
+                            'orientation': (0, 1)}[self.direction]
+
+        aspect = widths[:, self._image_axes[1]] / widths[:, self._image_axes[0]]
+        if not np.allclose(aspect, aspect[0]):
+            raise RuntimeError('All stamps must have the same aspect ratio')
+        self.npix_height = int(aspect[0] * npix)
+
+        self._assign_cells_to_stamps()
+
+    # Shared with the Projector
+    _get_hsml = Projector._get_hsml
+    _project_particles = Projector._project_particles
+
+    def _get_cells_near_stamps(self, pos, radii):
+        """
+        Find the (sorted) indices of the cells in the grid cells of a coarse
+        grid (covering the bounding box of the cells) which overlap with the
+        spheres containing the stamps. This is a superset of the cells
+        inside the stamps, found in a single pass over the cells.
+        """
+        lower = np.min(pos, axis=0)
+        extent = np.max(np.max(pos, axis=0) - lower) * (1 + 1e-8) + 1e-300
+
+        # Grid cells of about the size of a typical stamp
+        ngrid = int(np.clip(extent / (2 * np.median(radii)), 1, 256))
+        cell_size = extent / ngrid
+
+        occupied = np.zeros((ngrid, ngrid, ngrid), dtype=bool)
+        lo = np.clip(((self.centers - radii[:, None] - lower) / cell_size).astype(int),
+                     0, ngrid - 1)
+        hi = np.clip(((self.centers + radii[:, None] - lower) / cell_size).astype(int),
+                     0, ngrid - 1)
+        for istamp in range(self.n_stamps):
+            occupied[lo[istamp, 0]:hi[istamp, 0] + 1,
+                     lo[istamp, 1]:hi[istamp, 1] + 1,
+                     lo[istamp, 2]:hi[istamp, 2] + 1] = True
+
+        igrid = np.minimum(((pos - lower) / cell_size).astype(np.int64), ngrid - 1)
+        return np.flatnonzero(occupied[igrid[:, 0], igrid[:, 1], igrid[:, 2]])
+
+    def _assign_cells_to_stamps(self):
+        """
+        Find the cells in each stamp, using a BVH tree to find the cells
+        within the circumscribed sphere of each stamp.
+        """
+        pos = self.snap[f'{self.parttype}_Coordinates']
+        if settings.use_units:
+            pos = pos.value
+        pos = np.array(pos, dtype=np.float64)
+        self._num_cells = pos.shape[0]
+
+        # Radius of the sphere containing the stamp region
+        radii = 0.5 * np.sqrt(np.sum(self.widths**2, axis=1)) * (1 + 1e-8)
+
+        # Only the cells near the stamps are used below
+        self._cell_ids = self._get_cells_near_stamps(pos, radii)
+        self.pos = pos[self._cell_ids]
+
+        # Calculate the smoothing length (as in the Projector)
+        hsml = self._get_hsml(self.snap, self._cell_ids)
+        if settings.use_units:
+            hsml = hsml.to(self._length_uq.unit).value
+        self.hsml = np.array(hsml, dtype=np.float64)
+
+        self.index = [np.zeros(0, dtype=np.int64)] * self.n_stamps
+        if self.pos.shape[0] == 0:
+            return
+
+        tree = BinaryTree(self.pos, self.hsml)
+        offsets, _, ids = tree.query_ball(self.centers, radii)
+
+        # Keep the cells inside the stamp regions (as in the Projector)
+        for istamp in range(self.n_stamps):
+            candidates = np.sort(ids[offsets[istamp]:offsets[istamp + 1]])
+            dpos = self.pos[candidates] - self.centers[istamp]
+            if self.direction == 'orientation':
+                dpos = dpos @ self.orientation.rotation_matrix
+            half_widths = self.widths[istamp] / 2
+            inside = np.all((dpos < half_widths) * (dpos > -half_widths), axis=1)
+            self.index[istamp] = candidates[inside]
+
+    def _project_stamp(self, istamp, variable):
+        """
+        Project the variable (for the cells near the stamps) onto a single stamp.
+        """
+        index = self.index[istamp]
+
+        # Each stamp is projected by a single thread
+        projection = self._project_particles(self.pos[index], self.hsml[index],
+                                             variable[index], self.npix,
+                                             self.centers[istamp], self.widths[istamp],
+                                             numthreads=1)
+
+        width = self.widths[istamp, self._image_axes[0]]
+        height = self.widths[istamp, self._image_axes[1]]
+        area_per_pixel = width * height / (self.npix * self.npix_height)
+
+        return projection.T / area_per_pixel
+
+    def _get_variable(self, variable):
+        """
+        Get the variable (for the cells near the stamps) as a numpy array
+        and its unit quantity.
+        """
+        if isinstance(variable, str):
+            err_msg = 'projector uses a different parttype'
+            assert int(variable[0]) == self.parttype, err_msg
+            variable = self.snap[variable]
+        else:
+            if not isinstance(variable, np.ndarray):
+                raise RuntimeError('Unexpected type for variable')
+
+        assert variable.shape == (self._num_cells,), 'only scalars can be projected'
+
+        unit_quantity = None
+        if isinstance(variable, units.PaicosQuantity):
+            unit_quantity = variable.unit_quantity / self._length_uq**2
+            variable = variable.value
+
+        return np.array(variable[self._cell_ids], dtype=np.float64), unit_quantity
+
+    def _iter_stamps(self, variable, stamps, numthreads):
+        """
+        Project the stamps in parallel (using threads, since the cython
+        projection functions release the GIL), yielding them in order.
+        """
+        if numthreads is None:
+            numthreads = settings.numthreads
+
+        with ThreadPoolExecutor(max_workers=numthreads) as executor:
+            # Submit a limited number of stamps at a time to bound the memory
+            batch_size = 16 * numthreads
+            for start in range(0, len(stamps), batch_size):
+                batch = stamps[start:start + batch_size]
+                images = executor.map(self._project_stamp, batch,
+                                      [variable] * len(batch))
+                for istamp, image in zip(batch, images):
+                    yield istamp, image
+
+    def project_variable(self, variable, stamps=None, numthreads=None):
+        """
+        Projects a given variable onto the stamps.
+
+        Parameters
+        ----------
+        variable : str, array
+            The variable to be projected, it can be passed as string
+            or a 1d array (for all the cells in the snapshot).
+
+        stamps : list, optional
+            The indices of the stamps to project. Defaults to all stamps.
+
+        numthreads : int, optional
+            The number of stamps projected in parallel. Defaults to
+            settings.numthreads.
+
+        Returns
+        -------
+        numpy array
+            The images with shape (len(stamps), npix_height, npix).
+        """
+        if stamps is None:
+            stamps = range(self.n_stamps)
+        stamps = list(stamps)
+
+        variable, unit_quantity = self._get_variable(variable)
+
+        images = np.zeros((len(stamps), self.npix_height, self.npix))
+        for ii, (_, image) in enumerate(self._iter_stamps(variable, stamps, numthreads)):
+            images[ii] = image
+
+        if unit_quantity is not None:
+            images = images * unit_quantity
+
+        return images
+
+    def save(self, variables, basedir, basename='stamps', ids=None, numthreads=None):
+        """
+        Project the variables onto all the stamps and save them to a single
+        hdf5 file. Each variable is saved as a data set with shape
+        (n_stamps, npix_height, npix), and the group 'stamp_info' contains
+        the centers, widths and ids of the stamps.
+
+        Parameters
+        ----------
+        variables : str, list of str or dict
+            The variables to project, e.g. '0_Masses' or a list of such
+            strings. Arrays (for all the cells in the snapshot) can be passed
+            in a dictionary with the names to use in the hdf5 file as keys.
+
+        basedir : file path
+            The folder where the hdf5 file should be saved.
+
+        basename : string
+            The base name for the hdf5 file, which will be in
+            the format ``basename_{:03d}.hdf5`` (default: "stamps").
+
+        ids : array, optional
+            Identifiers of the stamps (e.g. the halo indices in the catalog)
+            which are saved in the hdf5 file. Defaults to 0, 1, ..., n_stamps - 1.
+
+        numthreads : int, optional
+            The number of stamps projected in parallel. Defaults to
+            settings.numthreads.
+
+        Returns
+        -------
+        str
+            The filename of the hdf5 file.
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+        if not isinstance(variables, dict):
+            variables = {name: name for name in variables}
+
+        if ids is None:
+            ids = np.arange(self.n_stamps)
+
+        writer = PaicosWriter(self.snap, basedir, basename=basename)
+        with h5py.File(writer.tmp_filename, 'r+') as f:
+            info = f.create_group('stamp_info')
+            info.create_dataset('ids', data=np.asarray(ids))
+            info.create_dataset('centers', data=self.centers)
+            info.create_dataset('widths', data=self.widths)
+            if settings.use_units:
+                info['centers'].attrs['unit'] = self._length_uq.unit.to_string()
+                info['widths'].attrs['unit'] = self._length_uq.unit.to_string()
+            info.attrs['direction'] = self.direction
+            if self.direction == 'orientation':
+                info.attrs['normal_vector'] = self.orientation.normal_vector
+                info.attrs['perp_vector1'] = self.orientation.perp_vector1
+
+            shape = (self.n_stamps, self.npix_height, self.npix)
+            for name, variable in variables.items():
+                variable, unit_quantity = self._get_variable(variable)
+                dataset = f.create_dataset(name, shape=shape, dtype=np.float64,
+                                           chunks=(1,) + shape[1:])
+                if unit_quantity is not None:
+                    dataset.attrs['unit'] = unit_quantity.unit.to_string()
+                for istamp, image in self._iter_stamps(variable, list(range(self.n_stamps)),
+                                                       numthreads):
+                    dataset[istamp] = image
+
+        writer.finalize()
+        return writer.filename
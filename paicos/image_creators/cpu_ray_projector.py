@@ -0,0 +1,384 @@
+"""
+Defines a class that creates an image of a given variable by ray tracing
+through the Voronoi cells on the CPU, using a BVH tree.
+"""
+import numpy as np
+import numba
+
+from .image_creator import ImageCreator
+from .. import util
+from .. import settings
+from .. import units
+
+from ..trees.bvh_cpu import BinaryTree
+from ..trees.bvh_cpu import nearest_neighbor_cpu
+
+
+@numba.jit(nopython=True, inline='always')
+def rotate_point_around_center(point, tmp_point, center, rotation_matrix):
+    """
+    Rotate around center. Note that we overwrite point.
+    """
+
+    # Subtract center
+    for ii in range(3):
+        tmp_point[ii] = point[ii] - center[ii]
+        point[ii] = 0.0
+
+    # Rotate around center (matrix multiplication).
+    for ii in range(3):
+        for jj in range(3):
+            point[ii] += rotation_matrix[ii, jj] * tmp_point[jj]
+
+    # Add center back
+    for ii in range(3):
+        point[ii] = point[ii] + center[ii]
+
+
+@numba.jit(nopython=True, parallel=True)
+def trace_rays_cpu(points, tree_parents, tree_children, tree_bounds, variable, hsml,
+                   widths, center,
+                   tree_scale_factor, tree_offsets, image, rotation_matrix, tol,
+                   reduce_mode=0):
+    """
+    CPU version of the trace_rays kernel in gpu_ray_projector.py, parallelized
+    over the rays (pixels) using numba.prange.
+
+    Each ray is integrated with steps of length tol * hsml of the cell
+    containing the current point. The cell found in the previous step
+    is used as the initial guess for the nearest neighbor search
+    (see nearest_neighbor_cpu), which allows skipping most of the tree.
+
+    With reduce_mode=1 (or 2) the maximum (or minimum) of the variable
+    along the ray is found instead of the integral (reduce_mode=0).
+    """
+
+    nx = image.shape[0]
+    ny = image.shape[1]
+
+    dx = widths[0] / nx
+    dy = widths[1] / ny
+
+    num_internal_nodes = tree_children.shape[0]
+
+    for ipix in numba.prange(nx * ny):  # pylint: disable=not-an-iterable
+        ix = ipix // ny
+        iy = ipix % ny
+
+        # Thread local memory
+        queue = np.empty(256, dtype=np.int64)
+        query_point = np.empty(3, dtype=np.float64)
+        tmp_point = np.empty(3, dtype=np.float64)
+
+        result = 0.0
+        if reduce_mode == 1:
+            result = -np.inf
+        elif reduce_mode == 2:
+            result = np.inf
+
+        # Initialize z (in arepo code units)
+        z = 0.0
+        min_index = -1
+
+        while z < widths[2]:
+
+            # Query points in aligned coords
+            query_point[0] = (center[0] - widths[0] / 2.0) + (ix + 0.5) * dx
+            query_point[1] = (center[1] - widths[1] / 2.0) + (iy + 0.5) * dy
+            query_point[2] = (center[2] - widths[2] / 2.0) + z
+
+            # Rotate to simulation coords
+            rotate_point_around_center(query_point, tmp_point, center, rotation_matrix)
+
+            # Convert to the tree coordinates
+            for ii in range(3):
+                query_point[ii] = (query_point[ii] - tree_offsets[ii]) * tree_scale_factor
+
+            min_dist, min_index = nearest_neighbor_cpu(points, tree_parents, tree_children,
+                                                       tree_bounds, query_point,
+                                                       num_internal_nodes, queue,
+                                                       0, min_index)
+
+            # Calculate dz
+            dz = tol * hsml[min_index]
+
+            # Update integral (or extremum)
+            if reduce_mode == 1:
+                result = max(result, variable[min_index])
+            elif reduce_mode == 2:
+                result = min(result, variable[min_index])
+            else:
+                result = result + dz * variable[min_index]
+
+            # Update position
+            z = z + dz
+
+        # Subtract the 'extra' stuff added in last iteration
+        if reduce_mode == 0:
+            result = result - (z - widths[2]) * variable[min_index]
+
+        # Set result in image array
+        image[ix, iy] = result
+
+
+class CpuRayProjector(ImageCreator):
+    """
+    A class that allows creating an image of a given variable by projecting
+    it onto a 2D plane. This class works by raytracing the variable
+    (i.e. by calculating a line integral along the line-of-sight).
+
+    It is a CPU version of the GpuRayProjector, parallelized with numba.
+    """
+
+    def __init__(self, snap, center, widths, direction,
+                 npix=512, parttype=0, tol=0.25, do_pre_selection=False, tree=None):
+        """
+        Initialize the CpuRayProjector class.
+
+        Parameters
+        ----------
+        snap : Snapshot
+            A snapshot object of Snapshot class from paicos package.
+
+        center : numpy array
+            Center of the region on which projection is to be done, e.g.
+            center = [x_c, y_c, z_c].
+
+        widths : numpy array
+            Widths of the region on which projection is to be done,
+            e.g.m widths=[width_x, width_y, width_z].
+
+        direction : str
+            Direction of the projection, e.g. 'x', 'y' or 'z',
+            or a Paicos Orientation class instance.
+
+        npix : int, optional
+            Number of pixels in the horizontal direction of the image,
+            by default 512.
+
+        parttype : int, optional
+            Number of the particle type to project, by default gas (PartType 0).
+
+        tol : float, optional
+            The step size along each ray in units of the size of the
+            current cell, by default 0.25.
+
+        do_pre_selection : bool, optional
+            Whether to only construct the tree for the cells inside
+            the projection region (instead of the full snapshot).
+            The tree then has to be reconstructed whenever the
+            center, widths or orientation is changed. Defaults to False.
+
+        tree : BinaryTree or str, optional
+            A BinaryTree constructed for all the cells of the parttype in
+            the snapshot, or the path of such a tree saved with
+            BinaryTree.save. This avoids constructing the tree again,
+            e.g. in every process of a parallel job, and requires
+            do_pre_selection=False.
+
+        """
+
+        # call the superclass constructor to initialize the ImageCreator class
+        super().__init__(snap, center, widths, direction, npix=npix, parttype=parttype)
+
+        parttype = self.parttype
+
+        self.do_pre_selection = do_pre_selection
+
+        self.tol = tol
+
+        if isinstance(tree, str):
+            tree = BinaryTree.load(tree)
+        if tree is not None and do_pre_selection:
+            raise RuntimeError('A precomputed tree requires do_pre_selection=False')
+        self._precomputed_tree = tree
+
+        # Calculate the smoothing length
+        avail_list = (list(snap.keys()) + snap._auto_list)
+        if f'{parttype}_Volume' in avail_list:
+            self._hsml = 2.0 * np.cbrt((self.snap[f"{parttype}_Volume"])
+                                       / (4.0 * np.pi / 3.0))
+        elif f'{parttype}_SubfindHsml' in avail_list:
+            self._hsml = self.snap[f'{parttype}_SubfindHsml']
+        else:
+            raise RuntimeError(
+                'There is no smoothing length or volume for the projector')
+
+        self._pos = self.snap[f'{self.parttype}_Coordinates']
+
+        if settings.use_units:
+            self._hsml = self._hsml.to(self._pos.unit)
+
+        # Call selection
+        self.has_do_region_selection_been_called = False
+        self._do_region_selection()
+        self.has_do_region_selection_been_called = True
+
+    def _do_region_selection(self):
+
+        self.do_unit_consistency_check()
+
+        center = self.center
+        widths = self.widths
+        snap = self.snap
+
+        if self.do_pre_selection:
+            # get the index of the region of projection
+            if self.direction != 'orientation':
+                get_index = util.get_index_of_cubic_region_plus_thin_layer
+                self.index = get_index(self._pos, center, widths, self._hsml,
+                                       snap.box)
+            else:
+                get_index = util.get_index_of_rotated_cubic_region_plus_thin_layer
+                self.index = get_index(self._pos, center, widths, self._hsml,
+                                       snap.box, self.orientation)
+
+            self.hsml = self._hsml[self.index]
+            self.pos = self._pos[self.index]
+
+        # Only construct the tree for the full snapshot once
+        elif not self.has_do_region_selection_been_called:
+            self.hsml = self._hsml
+            self.pos = self._pos
+        else:
+            return
+
+        if settings.use_units:
+            pos = self.pos.value
+            hsml = self.hsml.value
+        else:
+            pos = np.array(self.pos)
+            hsml = np.array(self.hsml)
+
+        if self._precomputed_tree is None:
+            self.tree = BinaryTree(pos, hsml)
+        else:
+            self.tree = self._precomputed_tree
+            err_msg = ('The precomputed tree was not constructed for the '
+                       + f'{pos.shape[0]} cells of parttype {self.parttype}')
+            if self.tree.num_leafs != pos.shape[0]:
+                raise RuntimeError(err_msg)
+            first = self.tree.sort_index[:10]
+            if not np.allclose(self.tree._to_tree_coordinates(pos[first]),
+                               self.tree._pos[:10]):
+                raise RuntimeError(err_msg)
+
+        # Variables sorted according to the Morton code sorting of the tree
+        self._tree_variables = {'hsml': hsml[self.tree.sort_index]}
+
+    def _cpu_project(self, variable_str, reduce='sum'):
+        """
+        Private method for projecting using numba code
+        """
+        rotation_matrix = self.orientation.rotation_matrix
+        if settings.use_units:
+            widths = np.array([self.width.value, self.height.value, self.depth.value])
+            center = np.array(self.center.value)
+        else:
+            widths = np.array([self.width, self.height, self.depth])
+            center = np.array(self.center)
+
+        nx = self.npix_width
+        ny = self.npix_height
+        image = np.zeros((nx, ny))
+
+        numba.set_num_threads(settings.numthreads)
+        trace_rays_cpu(self.tree._pos, self.tree.parents, self.tree.children,
+                       self.tree.point_bounds, self._tree_variables[variable_str],
+                       self._tree_variables['hsml'], widths, center,
+                       self.tree.conversion_factor, self.tree.off_sets, image,
+                       rotation_matrix, self.tol,
+                       {'sum': 0, 'max': 1, 'min': 2}[reduce])
+
+        return image
+
+    def _set_tree_variable(self, variable):
+        """
+        Store the variable sorted according to the Morton code sorting
+        of the tree (unless it is already stored) and return its key in
+        self._tree_variables.
+        """
+        if isinstance(variable, str):
+            variable_str = str(variable)
+            err_msg = 'projector uses a different parttype'
+            assert int(variable[0]) == self.parttype, err_msg
+            variable = self.snap[variable]
+        else:
+            variable_str = 'projection_variable'
+            if not isinstance(variable, np.ndarray):
+                raise RuntimeError('Unexpected type for variable')
+
+        assert len(variable.shape) == 1, 'only scalars can be projected'
+
+        if variable_str not in self._tree_variables or variable_str == 'projection_variable':
+            # Select same part of array that the projector has selected
+            if self.do_pre_selection:
+                tree_variable = variable[self.index]
+            else:
+                tree_variable = variable
+
+            if settings.use_units:
+                tree_variable = tree_variable.value
+
+            # Sort the variable according to Morton code sorting
+            self._tree_variables[variable_str] = np.array(tree_variable,
+                                                          dtype=np.float64)[self.tree.sort_index]
+
+        return variable_str
+
+    def project_variable(self, variable, additive=False, reduce='sum'):
+        """
+        projects a given variable onto a 2D plane.
+
+        Parameters
+        ----------
+        variable : str, numpy array
+            variable, it can be passed as string or an array
+
+        reduce : str
+            How the variable is reduced along the rays. By default ('sum')
+            the mean of the variable along the ray is found. With 'max'
+            (or 'min') the image is instead the maximum (or minimum) of
+            the variable along the ray.
+
+        Returns
+        -------
+        numpy array
+            The image of the projected variable
+        """
+
+        # This calls _do_region_selection if resolution, Orientation,
+        # widths or center changed
+        self._check_if_properties_changed()
+
+        if additive:
+            err_msg = "CPU ray tracer does not yet support additive=True"
+            raise RuntimeError(err_msg)
+
+        if reduce not in ['sum', 'max', 'min']:
+            raise RuntimeError(f"reduce='{reduce}' is not one of 'sum', 'max' or 'min'")
+
+        variable_str = self._set_tree_variable(variable)
+
+        if isinstance(variable, str):
+            variable = self.snap[variable]
+
+        # Do the projection
+        projection = self._cpu_project(variable_str, reduce)
+
+        # Transpose
+        projection = projection.T
+
+        assert projection.shape[0] == self.npix_height
+        assert projection.shape[1] == self.npix_width
+
+        if reduce != 'sum':
+            if isinstance(variable, units.PaicosQuantity):
+                projection = projection * variable.unit_quantity
+            return projection
+
+        if isinstance(variable, units.PaicosQuantity):
+            unit_length = self.snap[f'{self.parttype}_Coordinates'].uq
+            projection = projection * variable.unit_quantity * unit_length
+
+        return projection / self.depth
@@ -0,0 +1,376 @@
+"""
+Defines a class that creates volume renderings (emission-absorption images)
+of a given variable by ray tracing through the Voronoi cells on the CPU,
+using a BVH tree.
+"""
+import numpy as np
+import numba
+
+from .cpu_ray_projector import CpuRayProjector
+from .cpu_ray_projector import rotate_point_around_center
+from .. import settings
+from .. import units
+
+from ..trees.bvh_cpu import nearest_neighbor_cpu
+
+
+class TransferFunction:
+    """
+    A transfer function maps the value of a variable to a color and an
+    opacity (extinction coefficient), which are used for compositing along
+    the rays in the CpuVolumeRenderer.
+
+    The transfer function is tabulated on a regular grid in the normalized
+    variable u ∈ [0, 1], where u = 0 at vmin and u = 1 at vmax (values
+    outside this range are clipped).
+    """
+
+    def __init__(self, vmin, vmax, cmap='inferno', opacity=None, log=True, n_table=1024):
+        """
+        Initialize a transfer function.
+
+        Parameters
+        ----------
+        vmin, vmax : float or PaicosQuantity
+            The range of the variable mapped onto the color map.
+
+        cmap : str or matplotlib colormap, optional
+            The color map, by default 'inferno'.
+
+        opacity : callable, array or float, optional
+            The extinction coefficient as a function of the normalized
+            variable u, either as a callable, as an array of values on
+            an evenly spaced grid in u, or as a constant. The extinction
+            coefficient is in units of the inverse depth of the rendered
+            region, i.e., a medium with opacity 1 absorbs a fraction
+            1 - 1/e of the light over the full depth. Defaults to
+            opacity(u) = 4 u², such that only the high values
+            are (partially) opaque.
+
+        log : bool, optional
+            Whether the variable is mapped logarithmically between
+            vmin and vmax, by default True.
+
+        n_table : int, optional
+            The number of entries in the tabulated transfer function,
+            by default 1024.
+        """
+        import matplotlib
+
+        if log and (vmin <= 0 or vmax <= 0):
+            raise RuntimeError('vmin and vmax must be positive when log=True')
+        if not vmax > vmin:
+            raise RuntimeError('vmax must be larger than vmin')
+
+        self.vmin = vmin
+        self.vmax = vmax
+        self.log = log
+
+        if isinstance(cmap, str):
+            cmap = matplotlib.colormaps[cmap]
+        self.cmap = cmap
+
+        u = np.linspace(0, 1, n_table)
+
+        if opacity is None:
+            kappa = 4 * u**2
+        elif callable(opacity):
+            kappa = opacity(u) * np.ones_like(u)
+        elif np.ndim(opacity) == 0:
+            kappa = opacity * np.ones_like(u)
+        else:
+            kappa = np.interp(u, np.linspace(0, 1, len(opacity)), opacity)
+
+        if np.any(kappa < 0):
+            raise RuntimeError('The opacity must be non-negative')
+
+        # Columns are red, green, blue and the extinction coefficient
+        self.table = np.empty((n_table, 4))
+        self.table[:, :3] = cmap(u)[:, :3]
+        self.table[:, 3] = kappa
+
+    def get_limits(self, unit_quantity=None):
+        """
+        Get the limits used for normalizing the variable in the rendering
+        kernel (log10 of the limits if log=True), converted to the unit of
+        the variable if units are used.
+        """
+        limits = []
+        for value in [self.vmin, self.vmax]:
+            if isinstance(value, units.PaicosQuantity) or hasattr(value, 'unit'):
+                if unit_quantity is None:
+                    raise RuntimeError('The limits of the transfer function have units, '
+                                       + 'but the rendered variable does not')
+                value = value.to(unit_quantity.unit).value
+            limits.append(float(value))
+        if self.log:
+            limits = [np.log10(limit) for limit in limits]
+        return limits
+
+
+@numba.jit(nopython=True, parallel=True)
+def render_rays_cpu(points, tree_parents, tree_children, tree_bounds, variable, hsml,
+                    widths, center, tree_scale_factor, tree_offsets, image,
+                    rotation_matrix, tol, table, vmin, vmax, log_scale,
+                    min_transmittance, tile_size):
+    """
+    Render an emission-absorption image by front-to-back compositing
+    along the rays, using the same stepping through the Voronoi cells
+    as trace_rays_cpu.
+
+    For each step of length dz through a cell with color c and
+    extinction coefficient κ (looked up in the tabulated transfer
+    function), the opacity of the step is α = 1 - exp(-κ dz) and
+
+        color += T α c,    T *= 1 - α,
+
+    where T is the transmittance. Rays are terminated early when
+    T < min_transmittance.
+
+    The image is rendered in parallel over square tiles of tile_size
+    pixels. Within a tile, the cell found at the start of the previous
+    ray is used as the initial guess for the nearest neighbor search.
+    """
+
+    nx = image.shape[0]
+    ny = image.shape[1]
+
+    dx = widths[0] / nx
+    dy = widths[1] / ny
+
+    num_internal_nodes = tree_children.shape[0]
+    n_table = table.shape[0]
+
+    n_tiles_x = (nx + tile_size - 1) // tile_size
+    n_tiles_y = (ny + tile_size - 1) // tile_size
+
+    for itile in numba.prange(n_tiles_x * n_tiles_y):  # pylint: disable=not-an-iterable
+        tile_x = itile // n_tiles_y
+        tile_y = itile % n_tiles_y
+
+        # Thread local memory
+        queue = np.empty(256, dtype=np.int64)
+        query_point = np.empty(3, dtype=np.float64)
+        tmp_point = np.empty(3, dtype=np.float64)
+
+        guess = -1
+
+        for ix in range(tile_x * tile_size, min(nx, (tile_x + 1) * tile_size)):
+            for iy in range(tile_y * tile_size, min(ny, (tile_y + 1) * tile_size)):
+
+                red = 0.0
+                green = 0.0
+                blue = 0.0
+                transmittance = 1.0
+
+                z = 0.0
+                min_index = guess
+
+                while z < widths[2] and transmittance > min_transmittance:
+
+                    # Query points in aligned coords
+                    query_point[0] = (center[0] - widths[0] / 2.0) + (ix + 0.5) * dx
+                    query_point[1] = (center[1] - widths[1] / 2.0) + (iy + 0.5) * dy
+                    query_point[2] = (center[2] - widths[2] / 2.0) + z
+
+                    # Rotate to simulation coords
+                    rotate_point_around_center(query_point, tmp_point, center,
+                                               rotation_matrix)
+
+                    # Convert to the tree coordinates
+                    for ii in range(3):
+                        query_point[ii] = (query_point[ii] - tree_offsets[ii]) \
+                            * tree_scale_factor
+
+                    min_dist, min_index = nearest_neighbor_cpu(points, tree_parents,
+                                                               tree_children, tree_bounds,
+                                                               query_point,
+                                                               num_internal_nodes, queue,
+                                                               0, min_index)
+                    if z == 0.0:
+                        guess = min_index
+
+                    # Step length (the last step ends at the back of the region)
+                    dz = min(tol * hsml[min_index], widths[2] - z)
+
+                    # Look up the color and extinction coefficient
+                    value = variable[min_index]
+                    if log_scale:
+                        if value > 0.0:
+                            value = np.log10(value)
+                        else:
+                            value = vmin
+                    u = (value - vmin) / (vmax - vmin)
+                    u = min(max(u, 0.0), 1.0)
+                    itable = int(u * (n_table - 1) + 0.5)
+
+                    alpha = 1.0 - np.exp(-table[itable, 3] * dz)
+
+                    # Front-to-back compositing
+                    red += transmittance * alpha * table[itable, 0]
+                    green += transmittance * alpha * table[itable, 1]
+                    blue += transmittance * alpha * table[itable, 2]
+                    transmittance *= 1.0 - alpha
+
+                    z = z + dz
+
+                image[ix, iy, 0] = red
+                image[ix, iy, 1] = green
+                image[ix, iy, 2] = blue
+                image[ix, iy, 3] = 1.0 - transmittance
+
+
+class CpuVolumeRenderer(CpuRayProjector):
+    """
+    A class that allows creating volume renderings of a given variable,
+    i.e., emission-absorption images where a transfer function assigns
+    a color and an opacity to each Voronoi cell, and the colors are
+    composited front-to-back along each line-of-sight.
+
+    The rays are traced through the Voronoi cells with the BVH tree of
+    the CpuRayProjector (which this class extends) and are terminated
+    once they become opaque. The image is rendered in parallel over tiles
+    using numba.
+    """
+
+    def __init__(self, snap, center, widths, direction,
+                 npix=512, parttype=0, tol=0.25, do_pre_selection=False, tree=None,
+                 min_transmittance=1e-3, tile_size=16):
+        """
+        Initialize the CpuVolumeRenderer class.
+
+        Parameters
+        ----------
+        snap : Snapshot
+            A snapshot object of Snapshot class from paicos package.
+
+        center : numpy array
+            Center of the region on which the rendering is to be done, e.g.
+            center = [x_c, y_c, z_c].
+
+        widths : numpy array
+            Widths of the region on which the rendering is to be done,
+            e.g.m widths=[width_x, width_y, width_z].
+
+        direction : str
+            Direction of the rays, e.g. 'x', 'y' or 'z',
+            or a Paicos Orientation class instance. The rays enter at
+            the front of the region (nearest to the viewer), which
+            is at -depth/2 along the normal vector.
+
+        npix : int, optional
+            Number of pixels in the horizontal direction of the image,
+            by default 512.
+
+        parttype : int, optional
+            Number of the particle type to render, by default gas (PartType 0).
+
+        tol : float, optional
+            The step size along each ray in units of the size of the
+            current cell, by default 0.25.
+
+        do_pre_selection : bool, optional
+            See CpuRayProjector.
+
+        tree : BinaryTree or str, optional
+            See CpuRayProjector.
+
+        min_transmittance : float, optional
+            Rays are terminated when the transmittance falls below
+            this value, by default 1e-3.
+
+        tile_size : int, optional
+            The image is rendered in parallel over tiles with
+            tile_size × tile_size pixels, by default 16.
+        """
+        super().__init__(snap, center, widths, direction, npix=npix, parttype=parttype,
+                         tol=tol, do_pre_selection=do_pre_selection, tree=tree)
+
+        self.min_transmittance = min_transmittance
+        self.tile_size = tile_size
+
+    def _cpu_render(self, variable_str, transfer_function, limits):
+        """
+        Private method for rendering using numba code
+        """
+        rotation_matrix = self.orientation.rotation_matrix
+        if settings.use_units:
+            widths = np.array([self.width.value, self.height.value, self.depth.value])
+            center = np.array(self.center.value)
+        else:
+            widths = np.array([self.width, self.height, self.depth])
+            center = np.array(self.center)
+
+        nx = self.npix_width
+        ny = self.npix_height
+        image = np.zeros((nx, ny, 4))
+
+        # Extinction coefficient in units of the inverse depth
+        table = np.array(transfer_function.table)
+        table[:, 3] /= widths[2]
+
+        numba.set_num_threads(settings.numthreads)
+        render_rays_cpu(self.tree._pos, self.tree.parents, self.tree.children,
+                        self.tree.point_bounds, self._tree_variables[variable_str],
+                        self._tree_variables['hsml'], widths, center,
+                        self.tree.conversion_factor, self.tree.off_sets, image,
+                        rotation_matrix, self.tol, table, limits[0], limits[1],
+                        transfer_function.log, self.min_transmittance, self.tile_size)
+
+        return image
+
+    def render(self, variable, transfer_function, background=None):
+        """
+        Create a volume rendering of a given variable.
+
+        Parameters
+        ----------
+        variable : str, numpy array
+            variable, it can be passed as string or an array
+
+        transfer_function : TransferFunction
+            Maps the values of the variable to colors and opacities.
+
+        background : array, optional
+            An RGB color, e.g. [1, 1, 1] for white, onto which the rendering
+            is composited. By default (None), the RGBA image is returned.
+
+        Returns
+        -------
+        numpy array
+            The image with shape (npix_height, npix_width, 4), where the
+            colors are premultiplied with the alpha channel (i.e. composited
+            onto black), or with shape (npix_height, npix_width, 3) if a
+            background color is given.
+        """
+
+        # This calls _do_region_selection if resolution, Orientation,
+        # widths or center changed
+        self._check_if_properties_changed()
+
+        unit_quantity = None
+        if isinstance(variable, str):
+            unit_variable = self.snap[variable]
+        else:
+            unit_variable = variable
+        if isinstance(unit_variable, units.PaicosQuantity):
+            unit_quantity = unit_variable.unit_quantity
+
+        limits = transfer_function.get_limits(unit_quantity)
+
+        variable_str = self._set_tree_variable(variable)
+
+        # Do the rendering
+        image = self._cpu_render(variable_str, transfer_function, limits)
+
+        # Transpose
+        image = np.transpose(image, (1, 0, 2))
+
+        assert image.shape[0] == self.npix_height
+        assert image.shape[1] == self.npix_width
+
+        if background is not None:
+            background = np.asarray(background, dtype=np.float64)
+            return image[:, :, :3] + (1.0 - image[:, :, 3:]) * background[None, None, :]
+
+        return image
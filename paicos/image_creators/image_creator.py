@@ -44,9 +44,9 @@ class ImageCreator:
             self._center = center.copy
             assert center.unit == code_length.unit, 'this restriction applies'
         elif settings.use_units:
-            self._center = np.array(center) * code_length
+            self._center = np.array(center, dtype=np.float64) * code_length
         else:
-            self._center = np.array(center)
+            self._center = np.array(center, dtype=np.float64)
 
         # Difference from original center of image
         if settings.use_units:
@@ -58,9 +58,9 @@ class ImageCreator:
             self._widths = widths.copy
             assert widths.unit == code_length.unit, 'this restriction applies'
         elif settings.use_units:
-            self._widths = np.array(widths) * code_length
+            self._widths = np.array(widths, dtype=np.float64) * code_length
         else:
-            self._widths = np.array(widths)
+            self._widths = np.array(widths, dtype=np.float64)
 
         if isinstance(direction, str):
 
@@ -365,13 +365,13 @@ class ImageCreator:
         if settings.use_units:
             assert hasattr(value, 'unit')
         if self.direction == 'x':
-            self._widths[1] = value.copy
+            self._widths[1] = value
 
         elif self.direction == 'y':
-            self._widths[2] = value.copy
+            self._widths[2] = value
 
         elif self.direction == 'z' or self.direction == 'orientation':
-            self._widths[0] = value.copy
+            self._widths[0] = value
         self._properties_changed = True
 
     @height.setter
@@ -379,13 +379,13 @@ class ImageCreator:
         if settings.use_units:
             assert hasattr(value, 'unit')
         if self.direction == 'x':
-            self._widths[2] = value.copy
+            self._widths[2] = value
 
         elif self.direction == 'y':
-            self._widths[0] = value.copy
+            self._widths[0] = value
 
         elif self.direction == 'z' or self.direction == 'orientation':
-            self._widths[1] = value.copy
+            self._widths[1] = value
         self._properties_changed = True
 
     @depth.setter
@@ -393,13 +393,13 @@ class ImageCreator:
         if settings.use_units:
             assert hasattr(value, 'unit')
         if self.direction == 'x':
-            self._widths[0] = value.copy
+            self._widths[0] = value
 
         elif self.direction == 'y':
-            self._widths[1] = value.copy
+            self._widths[1] = value
 
         elif self.direction == 'z' or self.direction == 'orientation':
-            self._widths[2] = value.copy
+            self._widths[2] = value
         self._properties_changed = True
 
     def double_resolution(self):
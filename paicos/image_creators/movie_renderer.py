@@ -0,0 +1,415 @@
+"""
+Defines a class for rendering the frames of a movie, e.g. a fly-through,
+along a camera path given by a list of keyframes.
+"""
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+import h5py
+import numpy as np
+from scipy.spatial.transform import Rotation, Slerp
+from .image_creator import ImageCreator
+from ..orientation import Orientation
+from ..writers.arepo_image import ArepoImage
+from .. import util
+from .. import settings
+from .. import units
+
+
+def _project_frame(pos, hsml, variable, center, widths, orientation, npix, box):
+    """
+    Project the variable for a single frame. The cells are selected
+    (from the superset region) in the same way as in the Projector.
+    """
+    if settings.openMP_has_issues:
+        from ..cython.sph_projectors import project_oriented_image as project_orie
+    else:
+        from ..cython.sph_projectors import project_oriented_image_omp as project_orie
+
+    get_index = util.get_index_of_rotated_cubic_region
+    index = get_index(pos, center, widths, box, orientation)
+
+    pos = pos[index]
+    unit_vectors = orientation.cartesian_unit_vectors
+    projection = project_orie(pos[:, 0], pos[:, 1], pos[:, 2], variable[index],
+                              hsml[index], npix,
+                              center[0], center[1], center[2], widths[0], widths[1],
+                              box,
+                              unit_vectors['x'],
+                              unit_vectors['y'],
+                              unit_vectors['z'],
+                              settings.numthreads_reduction)
+
+    projection = projection.T
+    area_per_pixel = widths[0] * widths[1] / np.prod(projection.shape)
+
+    return projection / area_per_pixel
+
+
+# Data shared with the worker processes
+_worker_data = {}
+
+
+def _init_worker(shm_info, frame_info, numthreads):
+    """
+    Attach the worker process to the shared memory blocks.
+    """
+    settings.numthreads = numthreads
+    settings.numthreads_reduction = numthreads
+    _worker_data['shm'] = []
+    for key, (shm_name, shape) in shm_info.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_data['shm'].append(shm)
+        _worker_data[key] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _worker_data.update(frame_info)
+
+
+def _render_frame_in_worker(args):
+    """
+    Render a frame of a variable in a worker process.
+    """
+    name, iframe = args
+    data = _worker_data
+    orientation = Orientation(normal_vector=data['normal_vectors'][iframe],
+                              perp_vector1=data['perp_vectors1'][iframe])
+    image = _project_frame(data['pos'], data['hsml'], data[name],
+                           data['centers'][iframe], data['widths'][iframe],
+                           orientation, data['npix'], data['box'])
+    return name, iframe, image
+
+
+class MovieRenderer:
+    """
+    A class for rendering projections for the frames of a movie.
+
+    The camera path is given by keyframes of centers, widths and
+    orientations. The cells in a region containing all the frames are
+    selected and loaded once, after which the frames are rendered
+    (optionally in parallel by several processes sharing the loaded data).
+
+    The frames are written to an hdf5 file (created with ArepoImage)
+    as soon as they are rendered, such that an interrupted run can be
+    resumed by calling render again.
+    """
+
+    def __init__(self, snap, centers, widths, orientations, npix=512, parttype=0,
+                 nvol=8, n_frames=None):
+        """
+        Initialize the MovieRenderer class.
+
+        Parameters
+        ----------
+        snap : Snapshot
+            A snapshot object of Snapshot class from paicos package.
+
+        centers : array
+            The centers of the keyframes, shape (n_keyframes, 3).
+
+        widths : array
+            The widths [width, height, depth] of the keyframes,
+            shape (n_keyframes, 3). All frames must have the same
+            aspect ratio.
+
+        orientations : list of Orientation
+            The orientations of the keyframes.
+
+        npix : int, optional
+            Number of pixels in the horizontal direction of the frames,
+            by default 512.
+
+        parttype : int, optional
+            Number of the particle type to project, by default gas (PartType 0).
+
+        nvol : int, optional
+            Integer used to determine the smoothing length, by default 8
+            (as in the Projector).
+
+        n_frames : int, optional
+            The number of frames in the movie. The frames are interpolated
+            between the keyframes (linearly for the centers, logarithmically
+            for the widths and by spherical linear interpolation for the
+            orientations). By default, the keyframes are used as frames.
+        """
+        self.snap = snap
+        self.parttype = parttype
+        self.nvol = nvol
+        self.npix = npix
+
+        n_keyframes = len(orientations)
+        if settings.use_units:
+            assert hasattr(centers, 'unit') and hasattr(widths, 'unit')
+            self._length_uq = centers.uq
+            centers = centers.value
+            widths = widths.value
+        centers = np.array(centers, dtype=np.float64).reshape(n_keyframes, 3)
+        widths = np.array(widths, dtype=np.float64).reshape(n_keyframes, 3)
+
+        if n_frames is None or n_frames == n_keyframes:
+            self.centers = centers
+            self.widths = widths
+            self.orientations = [orientation.copy for orientation in orientations]
+        else:
+            self._interpolate_keyframes(centers, widths, orientations, n_frames)
+
+        self.n_frames = self.centers.shape[0]
+
+        aspect = self.widths[:, 1] / self.widths[:, 0]
+        if not np.allclose(aspect, aspect[0]):
+            raise RuntimeError('All frames must have the same aspect ratio')
+
+        # An image creator for the first frame (used for the image file)
+        self.image_creator = ImageCreator(snap, self._with_units(self.centers[0]),
+                                          self._with_units(self.widths[0]),
+                                          self.orientations[0], npix=npix,
+                                          parttype=parttype)
+        self.shape = (self.image_creator.npix_height, npix)
+
+        self._select_superset()
+
+        self.filename = None
+        self.frames_rendered = 0
+
+    def _with_units(self, value):
+        if settings.use_units:
+            return value * self._length_uq
+        return value
+
+    def _interpolate_keyframes(self, centers, widths, orientations, n_frames):
+        """
+        Interpolate the camera path between the keyframes.
+        """
+        n_keyframes = len(orientations)
+        times = np.linspace(0, 1, n_keyframes)
+        new_times = np.linspace(0, 1, n_frames)
+
+        self.centers = np.array([np.interp(new_times, times, centers[:, ii])
+                                 for ii in range(3)]).T
+        self.widths = np.exp(np.array([np.interp(new_times, times, np.log(widths[:, ii]))
+                                       for ii in range(3)]).T)
+
+        # The columns of the rotation matrix are perp_vector1,
+        # perp_vector2 and normal_vector
+        rotations = Rotation.from_matrix([orientation.rotation_matrix
+                                          for orientation in orientations])
+        matrices = Slerp(times, rotations)(new_times).as_matrix()
+        self.orientations = [Orientation(normal_vector=matrix[:, 2],
+                                         perp_vector1=matrix[:, 0])
+                             for matrix in matrices]
+
+    def _select_superset(self):
+        """
+        Select and load the cells in an axis-aligned region containing
+        all the frames.
+        """
+        parttype = self.parttype
+        snap = self.snap
+
+        # Half-extents of the (rotated) frame regions along x, y and z
+        half_extents = np.zeros((self.n_frames, 3))
+        for iframe, orientation in enumerate(self.orientations):
+            half_extents[iframe] = 0.5 * np.abs(orientation.rotation_matrix) \
+                @ self.widths[iframe]
+
+        lower = np.min(self.centers - half_extents, axis=0)
+        upper = np.max(self.centers + half_extents, axis=0)
+
+        pos = snap[f'{parttype}_Coordinates']
+        self.index = util.get_index_of_cubic_region(
+            pos, self._with_units((lower + upper) / 2),
+            self._with_units(upper - lower), snap.box)
+
+        # Calculate the smoothing length (as in the Projector)
+        avail_list = (list(snap.keys()) + snap._auto_list)
+        if f'{parttype}_Volume' in avail_list:
+            hsml = np.cbrt(self.nvol * (snap[f"{parttype}_Volume"][self.index])
+                           / (4.0 * np.pi / 3.0))
+        elif f'{parttype}_SubfindHsml' in avail_list:
+            hsml = snap[f'{parttype}_SubfindHsml'][self.index]
+        else:
+            raise RuntimeError(
+                'There is no smoothing length or volume for the movie renderer')
+
+        pos = pos[self.index]
+        if settings.use_units:
+            hsml = hsml.to(pos.unit).value
+            pos = pos.value
+
+        self.pos = np.array(pos, dtype=np.float64)
+        self.hsml = np.array(hsml, dtype=np.float64)
+
+    def _get_variables(self, variables):
+        """
+        Get a dictionary with the (superset selection of the) variables
+        and their units.
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+        if not isinstance(variables, dict):
+            variables = {name: name for name in variables}
+
+        data = {}
+        unit_quantities = {}
+        for name, variable in variables.items():
+            if isinstance(variable, str):
+                err_msg = 'movie renderer uses a different parttype'
+                assert int(variable[0]) == self.parttype, err_msg
+                variable = self.snap[variable]
+            variable = variable[self.index]
+            assert len(variable.shape) == 1, 'only scalars can be projected'
+
+            unit_quantities[name] = None
+            if isinstance(variable, units.PaicosQuantity):
+                unit_quantities[name] = variable.unit_quantity / self._length_uq**2
+                variable = variable.value
+            data[name] = np.array(variable, dtype=np.float64)
+        return data, unit_quantities
+
+    def _open_image_file(self, basedir, basename):
+        """
+        Create the image file, or check that an existing one has the
+        same frames.
+        """
+        if basedir[-1] != '/':
+            basedir += '/'
+        filename = basedir + f'{basename}_{self.snap.snapnum:03d}.hdf5'
+
+        if os.path.exists(filename):
+            image_file = ArepoImage(self.image_creator, basedir, basename=basename,
+                                    mode='a')
+            with h5py.File(filename, 'r') as f:
+                for key, value in self._frame_info().items():
+                    stored = f['frame_info'][key][...]
+                    if stored.shape != value.shape or not np.allclose(stored, value,
+                                                                      rtol=1e-14):
+                        err_msg = (f'The frames in {filename} differ from the '
+                                   + 'frames of this movie renderer')
+                        raise RuntimeError(err_msg)
+        else:
+            image_file = ArepoImage(self.image_creator, basedir, basename=basename)
+            with h5py.File(image_file.tmp_filename, 'r+') as f:
+                for key, value in self._frame_info().items():
+                    f.create_dataset('frame_info/' + key, data=value)
+            image_file.finalize()
+
+        return image_file.filename
+
+    def _frame_info(self):
+        return {'centers': self.centers,
+                'widths': self.widths,
+                'normal_vectors': np.array([orientation.normal_vector
+                                            for orientation in self.orientations]),
+                'perp_vectors1': np.array([orientation.perp_vector1
+                                           for orientation in self.orientations])}
+
+    def render(self, variables, basedir, basename='movie', numprocesses=1):
+        """
+        Render the frames of the movie and save them to an hdf5 file.
+
+        Frames that have already been rendered (e.g. in an interrupted run)
+        are skipped.
+
+        Parameters
+        ----------
+        variables : str, list of str or dict
+            The variables to project, e.g. '0_Masses' or a list of such
+            strings. Arrays (for all the cells in the snapshot) can be passed
+            in a dictionary with the names to use in the hdf5 file as keys.
+
+        basedir : file path
+            The folder where the hdf5 file should be saved.
+
+        basename : string
+            The base name for the hdf5 file, which will be in
+            the format ``basename_{:03d}.hdf5`` (default: "movie").
+
+        numprocesses : int
+            The number of processes rendering frames in parallel.
+            The loaded data is shared between the processes and each
+            of them uses settings.numthreads // numprocesses threads.
+        """
+        data, unit_quantities = self._get_variables(variables)
+
+        self.filename = self._open_image_file(basedir, basename)
+        self.frames_rendered = 0
+
+        with h5py.File(self.filename, 'r+') as f:
+            todo = []
+            for name in data:
+                group = f.require_group(name)
+                if 'frames' not in group:
+                    group.create_dataset('frames', shape=(self.n_frames,) + self.shape,
+                                         dtype=np.float64, chunks=(1,) + self.shape)
+                    group.create_dataset('rendered', shape=(self.n_frames,), dtype=bool)
+                if unit_quantities[name] is not None:
+                    group['frames'].attrs['unit'] = unit_quantities[name].unit.to_string()
+                rendered = group['rendered'][...]
+                todo += [(name, iframe) for iframe in range(self.n_frames)
+                         if not rendered[iframe]]
+
+            for name, iframe, image in self._iter_rendered_frames(data, todo,
+                                                                  numprocesses):
+                f[name]['frames'][iframe] = image
+                f[name]['rendered'][iframe] = True
+                f.flush()
+                self.frames_rendered += 1
+
+    def _iter_rendered_frames(self, data, todo, numprocesses):
+        """
+        Render the frames in todo, yielding (name, iframe, image).
+        """
+        if numprocesses == 1:
+            for name, iframe in todo:
+                image = _project_frame(self.pos, self.hsml, data[name],
+                                       self.centers[iframe], self.widths[iframe],
+                                       self.orientations[iframe], self.npix,
+                                       self._box)
+                yield name, iframe, image
+            return
+
+        arrays = {'pos': self.pos, 'hsml': self.hsml}
+        arrays.update(data)
+
+        shms = []
+        try:
+            # Copy the data to shared memory blocks
+            shm_info = {}
+            for key, array in arrays.items():
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                shms.append(shm)
+                np.ndarray(array.shape, dtype=np.float64, buffer=shm.buf)[...] = array
+                shm_info[key] = (shm.name, array.shape)
+
+            frame_info = self._frame_info()
+            frame_info.update({'npix': self.npix, 'box': self._box})
+
+            numthreads = max(1, settings.numthreads // numprocesses)
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(numprocesses, initializer=_init_worker,
+                              initargs=(shm_info, frame_info, numthreads)) as pool:
+                for result in pool.imap_unordered(_render_frame_in_worker, todo):
+                    yield result
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+    @property
+    def _box(self):
+        box = self.snap.box
+        if hasattr(box, 'unit'):
+            box = box.value
+        return box
+
+    def get_frame(self, name, iframe):
+        """
+        Read a rendered frame from the hdf5 file,
+        with units if they are enabled.
+        """
+        with h5py.File(self.filename, 'r') as f:
+            if not f[name]['rendered'][iframe]:
+                raise RuntimeError(f'Frame {iframe} of {name} has not been rendered')
+            dataset = f[name]['frames']
+            frame = dataset[iframe]
+            if settings.use_units and 'unit' in dataset.attrs:
+                frame = frame * self.snap.uq(dataset.attrs['unit'])
+        return frame
@@ -0,0 +1,220 @@
+"""
+Defines a class that creates images of a given variable by projecting it
+onto several 2D planes (views) in a single pass over the particles.
+"""
+import numpy as np
+from ..orientation import Orientation
+from .. import util
+from .. import settings
+from .. import units
+
+
+class MultiViewProjector:
+    """
+    A class that allows creating images of a given variable by projecting
+    it along several directions (e.g. x, y and z, or a fan of inclinations)
+    at once.
+
+    All views share the same center and widths. The cells are selected
+    once (in a region containing all the views) and each cell is deposited
+    onto the images of all the views that it belongs to in a single loop
+    over the cells. The images are identical to those of a Projector
+    with make_snap_with_selection=False for each of the views.
+    """
+
+    def __init__(self, snap, center, widths, directions, npix=512, parttype=0, nvol=8):
+        """
+        Initialize the MultiViewProjector class.
+
+        Parameters
+        ----------
+        snap : Snapshot
+            A snapshot object of Snapshot class from paicos package.
+
+        center : numpy array
+            Center of the region on which projection is to be done, e.g.
+            center = [x_c, y_c, z_c].
+
+        widths : numpy array
+            Widths of the region of each view, given as
+            [width, height, depth], i.e., along the horizontal, vertical
+            and depth directions of the images.
+
+        directions : list
+            The directions of the views, e.g. ['x', 'y', 'z'] or
+            a list of Orientation instances.
+
+        npix : int, optional
+            Number of pixels in the horizontal direction of the images,
+            by default 512.
+
+        parttype : int, optional
+            Number of the particle type to project, by default gas (PartType 0).
+
+        nvol : int, optional
+            Integer used to determine the smoothing length, by default 8
+        """
+        self.snap = snap
+        self.npix = npix
+        self.parttype = parttype
+        self.nvol = nvol
+
+        code_length = snap[f'{parttype}_Coordinates'].uq if settings.use_units else 1
+        if settings.use_units and not hasattr(center, 'unit'):
+            center = np.array(center) * code_length
+        if settings.use_units and not hasattr(widths, 'unit'):
+            widths = np.array(widths) * code_length
+        self.center = center
+        self.widths = widths
+
+        self.orientations = []
+        for direction in directions:
+            if isinstance(direction, Orientation):
+                self.orientations.append(direction.copy)
+            elif direction == 'x':
+                self.orientations.append(Orientation(normal_vector=[1, 0, 0],
+                                                     perp_vector1=[0, 1, 0]))
+            elif direction == 'y':
+                self.orientations.append(Orientation(normal_vector=[0, 1, 0],
+                                                     perp_vector1=[0, 0, 1]))
+            elif direction == 'z':
+                self.orientations.append(Orientation(normal_vector=[0, 0, 1],
+                                                     perp_vector1=[1, 0, 0]))
+            else:
+                raise RuntimeError(f'invalid input for direction={direction}')
+
+        self.n_views = len(self.orientations)
+
+        self._do_region_selection()
+
+    @property
+    def npix_height(self):
+        """
+        The number of pixels of the images in the vertical direction.
+        """
+        return int(float(self.widths[1] / self.widths[0]) * self.npix)
+
+    @property
+    def centered_extent(self):
+        """
+        The extent of the images centered on the center of the region.
+        """
+        return [-self.widths[0] / 2, self.widths[0] / 2,
+                -self.widths[1] / 2, self.widths[1] / 2]
+
+    @property
+    def area_per_pixel(self):
+        """
+        The area per pixel of the images.
+        """
+        return self.widths[0] * self.widths[1] / (self.npix * self.npix_height)
+
+    def _do_region_selection(self):
+        """
+        Select the cells in an axis-aligned region containing all the views.
+        """
+        snap = self.snap
+        parttype = self.parttype
+
+        if settings.use_units:
+            widths = self.widths.value
+        else:
+            widths = np.array(self.widths)
+
+        # Half-extents of the (rotated) regions along x, y and z
+        half_extent = np.zeros(3)
+        for orientation in self.orientations:
+            half_extent = np.maximum(half_extent,
+                                     0.5 * np.abs(orientation.rotation_matrix) @ widths)
+
+        self.index = util.get_index_of_cubic_region(snap[f'{parttype}_Coordinates'],
+                                                    self.center, 2 * half_extent,
+                                                    snap.box)
+
+        # Calculate the smoothing length (as in the Projector)
+        avail_list = (list(snap.keys()) + snap._auto_list)
+        if f'{parttype}_Volume' in avail_list:
+            self.hsml = np.cbrt(self.nvol * (snap[f"{parttype}_Volume"][self.index])
+                                / (4.0 * np.pi / 3.0))
+        elif f'{parttype}_SubfindHsml' in avail_list:
+            self.hsml = snap[f'{parttype}_SubfindHsml'][self.index]
+        else:
+            raise RuntimeError(
+                'There is no smoothing length or volume for the projector')
+
+        self.pos = snap[f'{parttype}_Coordinates'][self.index]
+
+        if settings.use_units:
+            self.hsml = self.hsml.to(self.pos.unit)
+
+    @util.remove_astro_units
+    def _cython_project(self, center, widths, variable):
+        """
+        Private method for projecting using cython
+        """
+        if settings.openMP_has_issues:
+            from ..cython.sph_projectors import project_oriented_images as project
+        else:
+            from ..cython.sph_projectors import project_oriented_images_omp as project
+
+        unit_vectors = {}
+        for key in ['x', 'y', 'z']:
+            unit_vectors[key] = np.array([orientation.cartesian_unit_vectors[key]
+                                          for orientation in self.orientations])
+
+        pos = self.pos.value if settings.use_units else self.pos
+        hsml = self.hsml.value if settings.use_units else self.hsml
+
+        projections = project(pos[:, 0], pos[:, 1], pos[:, 2],
+                              variable, hsml, self.npix,
+                              center[0], center[1], center[2],
+                              widths[0], widths[1], widths[2],
+                              self.snap.box,
+                              unit_vectors['x'],
+                              unit_vectors['y'],
+                              unit_vectors['z'],
+                              settings.numthreads_reduction)
+        return projections
+
+    def project_variable(self, variable):
+        """
+        Projects a given variable onto the image planes of all the views.
+
+        Parameters
+        ----------
+        variable : str, array
+            The variable to be projected, it can be passed as string
+            or a 1d array.
+
+        Returns
+        -------
+        numpy array
+            The images (3d array with shape (n_views, npix_height, npix))
+            of the projected variable.
+        """
+        if isinstance(variable, str):
+            err_msg = 'projector uses a different parttype'
+            assert int(variable[0]) == self.parttype, err_msg
+            variable = self.snap[variable]
+        else:
+            if not isinstance(variable, np.ndarray):
+                raise RuntimeError('Unexpected type for variable')
+
+        if variable.shape == self.index.shape:
+            variable = variable[self.index]
+
+        assert len(variable.shape) == 1, 'only scalars can be projected'
+
+        # Do the projection
+        projections = self._cython_project(self.center, self.widths, variable)
+
+        # Transpose
+        projections = np.transpose(projections, (0, 2, 1))
+
+        assert projections.shape[1] == self.npix_height
+        assert projections.shape[2] == self.npix
+
+        if isinstance(variable, units.PaicosQuantity):
+            projections = projections * variable.unit_quantity
+
+        return projections / self.area_per_pixel
@@ -3,7 +3,6 @@ Defines a class that creates an image of a given variable by projecting it
 onto a 2D plane using nested grids.
 """
 import numpy as np
-from .. import settings
 from .projector import Projector
 from ..util import remove_astro_units
 
@@ -181,61 +180,11 @@ class NestedProjector(Projector):
         This method performs the projection of a given variable onto a 2D
         plane using nested grids and a cython implementation.
         """
-        if settings.openMP_has_issues:
-            from ..cython.sph_projectors import project_image as project
-            from ..cython.sph_projectors import project_oriented_image as project_orie
-        else:
-            from ..cython.sph_projectors import project_image_omp as project
-            from ..cython.sph_projectors import project_oriented_image_omp as project_orie
-
-        x_c, y_c, z_c = center[0], center[1], center[2]
-        width_x, width_y, width_z = widths
-
-        boxsize = self.snap.box
-
         images = []
         for ii, n_grid in enumerate(self.n_grids):
             index_n = self.i_digit == (ii + 1)
-            hsml_n = self.hsml[index_n]
-            pos_n = self.pos[index_n]
-            variable_n = variable[index_n]
-            if self.direction == 'x':
-                proj_n = project(pos_n[:, 1],
-                                 pos_n[:, 2],
-                                 variable_n,
-                                 hsml_n, n_grid,
-                                 y_c, z_c, width_y, width_z,
-                                 boxsize, settings.numthreads_reduction)
-            elif self.direction == 'y':
-                proj_n = project(pos_n[:, 2],
-                                 pos_n[:, 0],
-                                 variable_n,
-                                 hsml_n, n_grid,
-                                 z_c, x_c, width_z, width_x,
-                                 boxsize, settings.numthreads_reduction)
-            elif self.direction == 'z':
-                proj_n = project(pos_n[:, 0],
-                                 pos_n[:, 1],
-                                 variable_n,
-                                 hsml_n, n_grid,
-                                 x_c, y_c, width_x, width_y,
-                                 boxsize, settings.numthreads_reduction)
-            elif self.direction == 'orientation':
-                unit_vectors = self.orientation.cartesian_unit_vectors
-
-                proj_n = project_orie(pos_n[:, 0],
-                                      pos_n[:, 1],
-                                      pos_n[:, 2],
-                                      variable_n,
-                                      hsml_n, n_grid,
-                                      x_c, y_c, z_c, width_x, width_y,
-                                      boxsize,
-                                      unit_vectors['x'],
-                                      unit_vectors['y'],
-                                      unit_vectors['z'],
-                                      settings.numthreads_reduction)
-            else:
-                raise RuntimeError(f'invalid input for direction={self.direction}')
+            proj_n = self._project_particles(self.pos[index_n], self.hsml[index_n],
+                                             variable[index_n], n_grid, center, widths)
             images.append(proj_n)
 
         projection = self.sum_contributions(images)
@@ -244,3 +193,155 @@ class NestedProjector(Projector):
             self.images = images
 
         return projection
+
+    @remove_astro_units
+    def _cython_project_particles(self, center, widths, pos, hsml, variable):
+        """
+        This method projects a subset of the particles (e.g. with rescaled
+        smoothing lengths, see Projector.iter_progressive) using the nested
+        grids. Particles that are larger than the coarsest grid
+        allows are projected onto the coarsest grid.
+        """
+        i_digit = np.maximum(np.digitize(hsml, bins=self.bins), 1)
+
+        images = []
+        for ii, n_grid in enumerate(self.n_grids):
+            index_n = i_digit == (ii + 1)
+            images.append(self._project_particles(pos[index_n], hsml[index_n],
+                                                  variable[index_n], n_grid, center,
+                                                  widths))
+
+        return self.sum_contributions(images)
+
+    @remove_astro_units
+    def _cython_project_weighted(self, center, widths, variable, weights):
+        """
+        This method projects weights * variable and weights onto a 2D
+        plane using nested grids, see Projector.project_weighted.
+        """
+        weighted_images = []
+        weight_images = []
+        for ii, n_grid in enumerate(self.n_grids):
+            index_n = self.i_digit == (ii + 1)
+            weighted_n, weight_n = self._project_particles_weighted(
+                self.pos[index_n], self.hsml[index_n], variable[index_n],
+                weights[index_n], n_grid, center, widths)
+            weighted_images.append(weighted_n)
+            weight_images.append(weight_n)
+
+        return self.sum_contributions(weighted_images), self.sum_contributions(weight_images)
+
+    @remove_astro_units
+    def _cython_project_vector(self, center, widths, vectors, weights):
+        """
+        This method projects the components of a vector field onto a 2D
+        plane using nested grids, see Projector.project_vector.
+        """
+        images = []
+        for ii, n_grid in enumerate(self.n_grids):
+            index_n = self.i_digit == (ii + 1)
+            weights_n = None if weights is None else weights[index_n]
+            images.append(self._project_particles_vector(
+                self.pos[index_n], self.hsml[index_n], vectors[index_n],
+                weights_n, n_grid, center, widths))
+
+        return np.array([self.sum_contributions([image[ii] for image in images])
+                         for ii in range(images[0].shape[0])])
+
+    @remove_astro_units
+    def _cython_project_moments(self, center, widths, variable, weights):
+        """
+        This method projects the weighted moments of a variable onto a 2D
+        plane using nested grids, see Projector.project_moments. The moments
+        of the grids are merged with the same algorithm as used for merging
+        the moments of the threads.
+        """
+        from ..cython.sph_projectors import merge_moments
+
+        images = []
+        for ii, n_grid in enumerate(self.n_grids):
+            index_n = self.i_digit == (ii + 1)
+            images.append(self._project_particles_moments(
+                self.pos[index_n], self.hsml[index_n], variable[index_n],
+                weights[index_n], n_grid, center, widths))
+
+        # Increase the resolution of the images to that of the finest grid
+        n = images[-1].shape[1]
+        moments = np.zeros((len(images),) + images[-1].shape)
+        for ii, (weight_n, mean_n, m2_n) in enumerate(images):
+            factor = n // weight_n.shape[0]
+            moments[ii, 0] = self.increase_image_resolution(weight_n, factor)
+            moments[ii, 1] = self.increase_image_resolution(mean_n, factor) * factor**2
+            moments[ii, 2] = self.increase_image_resolution(m2_n, factor)
+
+        return merge_moments(moments)
+
+    @remove_astro_units
+    def _cython_project_extremum(self, center, widths, variable, find_max):
+        """
+        This method finds the maximum (or minimum) of a variable along the
+        line of sight using nested grids, see Projector.project_variable.
+        """
+        images = []
+        for ii, n_grid in enumerate(self.n_grids):
+            index_n = self.i_digit == (ii + 1)
+            images.append(self._project_particles_extremum(
+                self.pos[index_n], self.hsml[index_n], variable[index_n], find_max,
+                n_grid, center, widths))
+
+        # Combine the images at the resolution of the finest grid,
+        # ignoring pixels without any particles (nan)
+        reduce = np.fmax if find_max else np.fmin
+        n = images[-1].shape[0]
+        extremum = images[-1]
+        for image in images[:-1]:
+            factor = n // image.shape[0]
+            image = np.repeat(np.repeat(image, factor, axis=0), factor, axis=1)
+            extremum = reduce(extremum, image)
+
+        return extremum
+
+    def _get_tile_factors(self):
+        """
+        The pixel size of the nested grid onto which each cell is projected
+        in units of the pixel size of the image, see Projector.iter_tiles.
+        """
+        n_grids = np.array(self.n_grids)
+        return (self.npix // n_grids[self.i_digit - 1]).astype(np.float64)
+
+    def _project_tile(self, index, x, y, h, norms, variable, origin, npix):
+        """
+        Project the particles in index onto a tile using the nested grids,
+        see Projector.iter_tiles.
+        """
+        if npix & (npix - 1) != 0:
+            raise RuntimeError('The NestedProjector requires a tile size '
+                               + f'which is a power of two, not {npix}')
+
+        tile = np.zeros((npix, npix))
+        i_digit = self.i_digit[index]
+        for ii, n_grid in enumerate(self.n_grids):
+            factor = self.npix // n_grid
+            npix_n = npix // factor
+            if npix_n >= 1:
+                index_n = index[i_digit == (ii + 1)]
+                image = self._render_window(x[index_n] / factor, y[index_n] / factor,
+                                            h[index_n] / factor, norms[index_n],
+                                            variable[index_n], origin[1] // factor,
+                                            origin[0] // factor, npix_n, n_grid,
+                                            self.npix_height // factor)
+                tile += self.increase_image_resolution(image, factor)
+            else:
+                # The tile is inside a single pixel of this grid, which
+                # we get from the (small) image of the full region
+                if ii not in self._tile_cache:
+                    index_n = self.i_digit == (ii + 1)
+                    self._tile_cache[ii] = self._project_particles(
+                        self.pos[index_n], self.hsml[index_n], variable[index_n],
+                        n_grid, self.center, self.widths).T
+                image = self._tile_cache[ii]
+                iy = min(origin[0] // factor, image.shape[0] - 1)
+                ix = min(origin[1] // factor, image.shape[1] - 1)
+                tile += image[iy, ix] / factor**2
+
+        return tile
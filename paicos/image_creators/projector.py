@@ -75,6 +75,10 @@ class Projector(ImageCreator):
     def _bind_to(self, callback):
         self._observers.append(callback)
 
+    # The superset region (see _select_superset) is a factor
+    # (1 + superset_padding) larger than the region of the projection
+    superset_padding = 1.0
+
     def _do_region_selection(self):
 
         self.do_unit_consistency_check()
@@ -92,51 +96,154 @@ class Projector(ImageCreator):
         snap = self.snap
         parttype = self.parttype
 
-        # get the index of the region of projection
-        if self.direction != 'orientation':
-            get_index = util.get_index_of_cubic_region
-            self.index = get_index(self.snap[f"{parttype}_Coordinates"],
-                                   center, widths, snap.box)
-        else:
-            get_index = util.get_index_of_rotated_cubic_region
-            self.index = get_index(snap[f"{parttype}_Coordinates"],
-                                   center, widths, snap.box,
-                                   self.orientation)
-
-        # Reduce the snapshot to only contain region of interest
         if self.make_snap_with_selection:
-            self.snap = self.snap.select(self.index, parttype=parttype)
+            pos = snap[f"{parttype}_Coordinates"]
+            self._index_ids = self._get_ids(pos)
+            self._num_cells = pos.shape[0]
 
-        # Calculate the smoothing length
-        avail_list = (list(snap.keys()) + snap._auto_list)
-        if f'{parttype}_Volume' in avail_list:
-            self.hsml = np.cbrt(self.nvol * (self.snap[f"{parttype}_Volume"])
-                                / (4.0 * np.pi / 3.0))
-        elif f'{parttype}_SubfindHsml' in avail_list:
-            self.hsml = np.copy(self.snap[f'{parttype}_SubfindHsml'])
+            # Reduce the snapshot to only contain region of interest
+            self.snap = self.snap.select(self._index_ids, parttype=parttype)
+
+            self.hsml = self._get_hsml(self.snap)
+            self.pos = np.copy(self.snap[f'{self.parttype}_Coordinates'])
+            if settings.use_units:
+                self.hsml = self.hsml.to(self.pos.unit)
         else:
-            raise RuntimeError(
-                'There is no smoothing length or volume for the projector')
+            # Only select from the full snapshot when the region is
+            # not contained in the cached superset region
+            if not self._is_region_in_superset(center, widths):
+                self._select_superset(center, widths)
 
-        self.pos = np.copy(self.snap[f'{self.parttype}_Coordinates'])
+            ids = self._get_ids(self._superset_pos)
+            self._index_ids = self._superset_ids[ids]
+            self.hsml = self._superset_hsml[ids]
+            self.pos = self._superset_pos[ids]
 
-        if settings.use_units:
-            self.hsml = self.hsml.to(self.pos.unit)
-
-        if not self.make_snap_with_selection:
-            self.hsml = self.hsml[self.index]
-            self.pos = self.pos[self.index]
+        # The boolean index is constructed on demand
+        self._index = None
 
         # Call other functions that need to be updated
         for callback in self._observers:
             # print(callback, 'from projector')
             callback()
 
+    @property
+    def index(self):
+        """
+        A boolean array which is True for the cells (of the snapshot
+        passed to the projector) in the region of the projection.
+        """
+        if self._index is None:
+            self._index = np.zeros(self._num_cells, dtype=bool)
+            self._index[self._index_ids] = True
+        return self._index
+
+    def _get_ids(self, pos):
+        """
+        Get the (sorted) indices of the positions in the region of projection.
+        """
+        if self.direction != 'orientation':
+            get_ids = util.get_ids_of_cubic_region
+            return get_ids(pos, self.center, self.widths, self.snap.box)
+
+        get_ids = util.get_ids_of_rotated_cubic_region
+        return get_ids(pos, self.center, self.widths, self.snap.box,
+                       self.orientation)
+
+    def _get_hsml(self, snap, index=None):
+        """
+        Calculate the smoothing length (for the cells in index).
+        """
+        parttype = self.parttype
+        if index is None:
+            index = slice(None)
+        avail_list = (list(snap.keys()) + snap._auto_list)
+        if f'{parttype}_Volume' in avail_list:
+            return np.cbrt(self.nvol * (snap[f"{parttype}_Volume"][index])
+                           / (4.0 * np.pi / 3.0))
+        if f'{parttype}_SubfindHsml' in avail_list:
+            return np.copy(snap[f'{parttype}_SubfindHsml'][index])
+        raise RuntimeError(
+            'There is no smoothing length or volume for the projector')
+
+    @util.remove_astro_units
+    def _get_half_extent(self, widths):
+        """
+        Half the extent of the region of projection along the x, y and z
+        directions of the simulation (for a rotated region, this is the
+        extent of the axis-aligned box containing it).
+        """
+        widths = np.array(widths, dtype=np.float64)
+        if self.direction != 'orientation':
+            return widths / 2
+        return 0.5 * np.abs(self.orientation.rotation_matrix) @ widths
+
+    @util.remove_astro_units
+    def _is_region_in_superset(self, center, widths):
+        """
+        Check whether the region of projection is inside the superset region.
+        """
+        if not hasattr(self, '_superset_center'):
+            return False
+        half_extent = self._get_half_extent(widths)
+        distance = np.abs(np.array(center) - self._superset_center)
+        return bool(np.all(distance + half_extent <= self._superset_half_extent))
+
+    def _select_superset(self, center, widths):
+        """
+        Select the cells in an axis-aligned region which is larger than the
+        region of projection (by a factor 1 + superset_padding). Panning and
+        zooming within this superset region only requires a selection among
+        the cells in the superset (instead of among all the cells in the
+        snapshot).
+        """
+        snap = self.snap
+        parttype = self.parttype
+
+        half_extent = self._get_half_extent(widths) * (1 + self.superset_padding)
+        if settings.use_units:
+            self._superset_center = np.array(center.value)
+            superset_widths = 2 * half_extent * center.uq
+        else:
+            self._superset_center = np.array(center)
+            superset_widths = 2 * half_extent
+        self._superset_half_extent = half_extent
+
+        pos = snap[f"{parttype}_Coordinates"]
+        self._num_cells = pos.shape[0]
+        self._superset_ids = util.get_ids_of_cubic_region(pos, center, superset_widths,
+                                                          snap.box)
+        self._superset_pos = pos[self._superset_ids]
+        self._superset_hsml = self._get_hsml(snap, self._superset_ids)
+        if settings.use_units:
+            self._superset_hsml = self._superset_hsml.to(pos.unit)
+
     @util.remove_astro_units
     def _cython_project(self, center, widths, variable):
         """
         Private method for projecting using cython
         """
+        return self._project_particles(self.pos, self.hsml, variable, self.npix,
+                                       center, widths)
+
+    @util.remove_astro_units
+    def _cython_project_particles(self, center, widths, pos, hsml, variable):
+        """
+        Private method for projecting a subset of the particles (e.g. with
+        rescaled smoothing lengths, see iter_progressive) using cython
+        """
+        return self._project_particles(pos, hsml, variable, self.npix,
+                                       center, widths)
+
+    @util.remove_astro_units
+    def _project_particles(self, pos, hsml, variable, npix, center, widths,
+                           numthreads=None):
+        """
+        Private method for projecting the particles at pos, with smoothing
+        lengths hsml, onto an image with npix pixels in the horizontal
+        direction (using cython). numthreads defaults to
+        settings.numthreads_reduction.
+        """
         if settings.openMP_has_issues:
             from ..cython.sph_projectors import project_image as project
             from ..cython.sph_projectors import project_oriented_image as project_orie
@@ -147,59 +254,211 @@ class Projector(ImageCreator):
         x_c, y_c, z_c = center[0], center[1], center[2]
         width_x, width_y, width_z = widths
 
+        if numthreads is None:
+            numthreads = settings.numthreads_reduction
+
         boxsize = self.snap.box
         if self.direction == 'x':
-            projection = project(self.pos[:, 1],
-                                 self.pos[:, 2],
+            projection = project(pos[:, 1],
+                                 pos[:, 2],
                                  variable,
-                                 self.hsml, self.npix,
+                                 hsml, npix,
                                  y_c, z_c, width_y, width_z,
-                                 boxsize, settings.numthreads_reduction)
+                                 boxsize, numthreads)
         elif self.direction == 'y':
-            projection = project(self.pos[:, 2],
-                                 self.pos[:, 0],
+            projection = project(pos[:, 2],
+                                 pos[:, 0],
                                  variable,
-                                 self.hsml, self.npix,
+                                 hsml, npix,
                                  z_c, x_c, width_z, width_x,
-                                 boxsize, settings.numthreads_reduction)
+                                 boxsize, numthreads)
         elif self.direction == 'z':
-            projection = project(self.pos[:, 0],
-                                 self.pos[:, 1],
+            projection = project(pos[:, 0],
+                                 pos[:, 1],
                                  variable,
-                                 self.hsml, self.npix,
+                                 hsml, npix,
                                  x_c, y_c, width_x, width_y,
-                                 boxsize, settings.numthreads_reduction)
+                                 boxsize, numthreads)
         elif self.direction == 'orientation':
             unit_vectors = self.orientation.cartesian_unit_vectors
 
-            projection = project_orie(self.pos[:, 0],
-                                      self.pos[:, 1],
-                                      self.pos[:, 2],
+            projection = project_orie(pos[:, 0],
+                                      pos[:, 1],
+                                      pos[:, 2],
                                       variable,
-                                      self.hsml, self.npix,
+                                      hsml, npix,
                                       x_c, y_c, z_c, width_x, width_y,
                                       boxsize,
                                       unit_vectors['x'],
                                       unit_vectors['y'],
                                       unit_vectors['z'],
-                                      settings.numthreads_reduction)
+                                      numthreads)
+        else:
+            raise RuntimeError(f'invalid input for direction={self.direction}')
 
         return projection
 
-    def project_variable(self, variable):
+    def _project_particles_values(self, project, project_orie, pos, hsml, values,
+                                  npix, center, widths, rotate=False):
         """
-        projects a given variable onto a 2D plane.
+        Private method for projecting several values of the particles at pos
+        in a single pass, using the cython kernels project (for the
+        directions 'x', 'y' and 'z') and project_orie (for an orientation),
+        which take the values after the positions, see e.g.
+        sph_projectors.project_weighted_image.
 
-        Parameters
-        ----------
-        variable : str, array
-            The variable to be projected, it can be passed as string
-            or a 1d array.
+        If rotate is True, the unit vectors of the orientation are
+        also passed to the kernel for the directions 'x', 'y' and 'z'.
+        """
+        x_c, y_c, z_c = center[0], center[1], center[2]
+        width_x, width_y, width_z = widths
 
-        Returns
-        -------
-        numpy array
-            The image (2d array) of the projected variable.
+        unit_vectors = self.orientation.cartesian_unit_vectors
+        unit_vectors = (unit_vectors['x'], unit_vectors['y'], unit_vectors['z'])
+        axis_unit_vectors = unit_vectors if rotate else ()
+
+        boxsize = self.snap.box
+        if self.direction == 'x':
+            projections = project(pos[:, 1], pos[:, 2], *values, hsml, npix,
+                                  y_c, z_c, width_y, width_z, boxsize,
+                                  *axis_unit_vectors, settings.numthreads_reduction)
+        elif self.direction == 'y':
+            projections = project(pos[:, 2], pos[:, 0], *values, hsml, npix,
+                                  z_c, x_c, width_z, width_x, boxsize,
+                                  *axis_unit_vectors, settings.numthreads_reduction)
+        elif self.direction == 'z':
+            projections = project(pos[:, 0], pos[:, 1], *values, hsml, npix,
+                                  x_c, y_c, width_x, width_y, boxsize,
+                                  *axis_unit_vectors, settings.numthreads_reduction)
+        elif self.direction == 'orientation':
+            projections = project_orie(pos[:, 0], pos[:, 1], pos[:, 2], *values,
+                                       hsml, npix,
+                                       x_c, y_c, z_c, width_x, width_y, boxsize,
+                                       *unit_vectors, settings.numthreads_reduction)
+        else:
+            raise RuntimeError(f'invalid input for direction={self.direction}')
+
+        return projections
+
+    def _project_particles_weighted(self, pos, hsml, variable, weights, npix,
+                                    center, widths):
+        """
+        Private method for projecting weights * variable and weights of the
+        particles at pos in a single pass (using cython), see _project_particles.
+        """
+        if settings.openMP_has_issues:
+            from ..cython.sph_projectors import project_weighted_image as project
+            from ..cython.sph_projectors import project_weighted_oriented_image \
+                as project_orie
+        else:
+            from ..cython.sph_projectors import project_weighted_image_omp as project
+            from ..cython.sph_projectors import project_weighted_oriented_image_omp \
+                as project_orie
+
+        return self._project_particles_values(project, project_orie, pos, hsml,
+                                              (variable, weights), npix, center, widths)
+
+    @util.remove_astro_units
+    def _cython_project_weighted(self, center, widths, variable, weights):
+        """
+        Private method for projecting weights * variable and weights using cython
+        """
+        return self._project_particles_weighted(self.pos, self.hsml, variable, weights,
+                                                self.npix, center, widths)
+
+    def _project_particles_vector(self, pos, hsml, vectors, weights, npix, center,
+                                  widths):
+        """
+        Private method for projecting the components of the vectors (and
+        the weights) of the particles at pos in a single pass (using cython),
+        see _project_particles.
+        """
+        if settings.openMP_has_issues:
+            from ..cython.sph_projectors import project_vector_image as project
+            from ..cython.sph_projectors import project_vector_oriented_image \
+                as project_orie
+        else:
+            from ..cython.sph_projectors import project_vector_image_omp as project
+            from ..cython.sph_projectors import project_vector_oriented_image_omp \
+                as project_orie
+
+        if weights is None:
+            weights = np.zeros(0, dtype=vectors.dtype)
+
+        # The vectors are rotated into the coordinate system of the image
+        return self._project_particles_values(project, project_orie, pos, hsml,
+                                              (vectors, weights), npix, center, widths,
+                                              rotate=True)
+
+    @util.remove_astro_units
+    def _cython_project_vector(self, center, widths, vectors, weights):
+        """
+        Private method for projecting the components of a vector field using cython
+        """
+        return self._project_particles_vector(self.pos, self.hsml, vectors, weights,
+                                              self.npix, center, widths)
+
+    def _project_particles_moments(self, pos, hsml, variable, weights, npix, center,
+                                   widths):
+        """
+        Private method for projecting the weighted moments (sum of weights,
+        mean and M2) of the variable of the particles at pos in a single
+        pass (using cython), see _project_particles.
+        """
+        if settings.openMP_has_issues:
+            from ..cython.sph_projectors import project_moments_image as project
+            from ..cython.sph_projectors import project_moments_oriented_image \
+                as project_orie
+        else:
+            from ..cython.sph_projectors import project_moments_image_omp as project
+            from ..cython.sph_projectors import project_moments_oriented_image_omp \
+                as project_orie
+
+        return self._project_particles_values(project, project_orie, pos, hsml,
+                                              (variable, weights), npix, center, widths)
+
+    @util.remove_astro_units
+    def _cython_project_moments(self, center, widths, variable, weights):
+        """
+        Private method for projecting the weighted moments of a variable using cython
+        """
+        return self._project_particles_moments(self.pos, self.hsml, variable, weights,
+                                               self.npix, center, widths)
+
+    def _project_particles_extremum(self, pos, hsml, variable, find_max, npix, center,
+                                    widths):
+        """
+        Private method for finding the maximum (or minimum) of the variable
+        of the particles at pos along the line of sight (using cython),
+        see _project_particles.
+        """
+        if settings.openMP_has_issues:
+            from ..cython.sph_projectors import project_extremum_image as project
+            from ..cython.sph_projectors import project_extremum_oriented_image \
+                as project_orie
+        else:
+            from ..cython.sph_projectors import project_extremum_image_omp as project
+            from ..cython.sph_projectors import project_extremum_oriented_image_omp \
+                as project_orie
+
+        return self._project_particles_values(project, project_orie, pos, hsml,
+                                              (variable, int(find_max)), npix, center,
+                                              widths)
+
+    @util.remove_astro_units
+    def _cython_project_extremum(self, center, widths, variable, find_max):
+        """
+        Private method for finding the maximum (or minimum) of a variable
+        along the line of sight using cython
+        """
+        return self._project_particles_extremum(self.pos, self.hsml, variable, find_max,
+                                                self.npix, center, widths)
+
+    def _get_variable(self, variable, vector=False):
+        """
+        Get the variable to project for the cells in the projection region
+        (this also updates the selection if the properties have changed).
+        If vector is True, the variable is a vector field with shape (N, 3).
         """
         self.do_unit_consistency_check()
         # This calls _do_region_selection if resolution, Orientation,
@@ -214,13 +473,52 @@ class Projector(ImageCreator):
             if not isinstance(variable, np.ndarray):
                 raise RuntimeError('Unexpected type for variable')
 
-        if variable.shape == self.index.shape:
-            variable = variable[self.index]
+        if vector:
+            if variable.shape == (self._num_cells, 3):
+                variable = variable[self._index_ids]
+            assert variable.shape[1:] == (3,), 'expected a vector field with shape (N, 3)'
+            return variable
+
+        if variable.shape == (self._num_cells,):
+            variable = variable[self._index_ids]
 
         assert len(variable.shape) == 1, 'only scalars can be projected'
 
+        return variable
+
+    def project_variable(self, variable, reduce='sum'):
+        """
+        projects a given variable onto a 2D plane.
+
+        Parameters
+        ----------
+        variable : str, array
+            The variable to be projected, it can be passed as string
+            or a 1d array.
+
+        reduce : str, optional
+            How the variable is reduced along the line of sight. By default
+            ('sum') the variable is integrated. With 'max' (or 'min') the
+            image is the maximum (or minimum) of the variable among the
+            cells whose kernel overlaps each pixel (nan for pixels without
+            any cells), e.g. for finding shocks or hot spots.
+
+        Returns
+        -------
+        numpy array
+            The image (2d array) of the projected variable.
+        """
+        if reduce not in ['sum', 'max', 'min']:
+            raise RuntimeError(f"reduce='{reduce}' is not one of 'sum', 'max' or 'min'")
+
+        variable = self._get_variable(variable)
+
         # Do the projection
-        projection = self._cython_project(self.center, self.widths, variable)
+        if reduce == 'sum':
+            projection = self._cython_project(self.center, self.widths, variable)
+        else:
+            projection = self._cython_project_extremum(self.center, self.widths,
+                                                       variable, reduce == 'max')
 
         # Transpose
         projection = projection.T
@@ -231,9 +529,521 @@ class Projector(ImageCreator):
         assert projection.shape[0] == self.npix_height, (projection.shape,
                                                          self.npix_height)
 
+        if reduce != 'sum':
+            if isinstance(variable, units.PaicosQuantity):
+                projection = projection * variable.unit_quantity
+            return projection
+
         area_per_pixel = self.area / np.prod(projection.shape)
 
         if isinstance(variable, units.PaicosQuantity):
             projection = projection * variable.unit_quantity
 
         return projection / area_per_pixel
+
+    def project_weighted(self, variable, weights, return_weights=False):
+        """
+        Projects the weighted mean of a given variable onto a 2D plane,
+        e.g. the mass-weighted temperature.
+
+        This gives the same result as
+
+            projector.project_variable(weights * variable) / projector.project_variable(weights)
+
+        but the two images are computed in a single pass over the cells.
+
+        Parameters
+        ----------
+        variable : str, array
+            The variable to be averaged, it can be passed as string
+            or a 1d array.
+
+        weights : str, array
+            The weights (e.g. '0_Masses'), it can be passed as string
+            or a 1d array.
+
+        return_weights : bool, optional
+            Whether to also return the projected weights, i.e.,
+            projector.project_variable(weights), by default False.
+
+        Returns
+        -------
+        numpy array
+            The image (2d array) of the weighted mean of the variable.
+            Pixels without any weight are nan.
+
+        numpy array
+            The image of the projected weights (only if return_weights is True).
+        """
+        variable = self._get_variable(variable)
+        weights = self._get_variable(weights)
+
+        # Do the projection
+        weighted_projection, weight_projection = self._cython_project_weighted(
+            self.center, self.widths, variable, weights)
+
+        # Transpose
+        weighted_projection = weighted_projection.T
+        weight_projection = weight_projection.T
+
+        assert weight_projection.shape[1] == self.npix_width, (weight_projection.shape,
+                                                               self.npix_width)
+
+        assert weight_projection.shape[0] == self.npix_height, (weight_projection.shape,
+                                                                self.npix_height)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            image = weighted_projection / weight_projection
+
+        if isinstance(variable, units.PaicosQuantity):
+            image = image * variable.unit_quantity
+
+        if not return_weights:
+            return image
+
+        area_per_pixel = self.area / np.prod(weight_projection.shape)
+
+        if isinstance(weights, units.PaicosQuantity):
+            weight_projection = weight_projection * weights.unit_quantity
+
+        return image, weight_projection / area_per_pixel
+
+    def project_vector(self, variable, weights=None, return_weights=False):
+        """
+        Projects the components of a vector field (e.g. the velocities or
+        the magnetic field) onto a 2D plane.
+
+        The vectors are rotated into the coordinate system of the image,
+        i.e., the three components are along the horizontal (perp_vector1)
+        and vertical (perp_vector2) directions of the image and along
+        the line of sight (normal_vector). The rotation is done on the fly
+        and all three components are projected in a single pass over the cells.
+
+        Parameters
+        ----------
+        variable : str, array
+            The vector field to be projected, it can be passed as string
+            (e.g. '0_Velocities') or an array with shape (N, 3).
+
+        weights : str, array, optional
+            If given (e.g. '0_Masses'), the weighted means of the components
+            are projected (see project_weighted) instead of the components
+            themselves (see project_variable).
+
+        return_weights : bool, optional
+            Whether to also return the projected weights, by default False.
+
+        Returns
+        -------
+        numpy array
+            The images with shape (3, npix_height, npix_width) of the
+            components along perp_vector1, perp_vector2 and normal_vector.
+
+        numpy array
+            The image of the projected weights (only if return_weights is True).
+        """
+        if return_weights and weights is None:
+            raise RuntimeError('return_weights requires weights')
+
+        variable = self._get_variable(variable, vector=True)
+        if weights is not None:
+            weights = self._get_variable(weights)
+
+        # Do the projection
+        projections = self._cython_project_vector(self.center, self.widths, variable,
+                                                  weights)
+
+        # Transpose
+        projections = np.transpose(projections, (0, 2, 1))
+
+        assert projections.shape[2] == self.npix_width, (projections.shape,
+                                                         self.npix_width)
+
+        assert projections.shape[1] == self.npix_height, (projections.shape,
+                                                          self.npix_height)
+
+        area_per_pixel = self.area / np.prod(projections.shape[1:])
+
+        if weights is None:
+            images = projections
+            if isinstance(variable, units.PaicosQuantity):
+                images = images * variable.unit_quantity
+            return images / area_per_pixel
+
+        weight_projection = projections[3]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            images = projections[:3] / weight_projection[None, :, :]
+
+        if isinstance(variable, units.PaicosQuantity):
+            images = images * variable.unit_quantity
+
+        if not return_weights:
+            return images
+
+        if isinstance(weights, units.PaicosQuantity):
+            weight_projection = weight_projection * weights.unit_quantity
+
+        return images, weight_projection / area_per_pixel
+
+    def project_moments(self, variable, weights, return_weights=False):
+        """
+        Projects the weighted mean and the weighted standard deviation
+        (dispersion) of a given variable along the line of sight onto
+        a 2D plane, e.g. the mass-weighted line-of-sight velocity
+        dispersion.
+
+        The moments are accumulated in a single pass over the cells using
+        Welford's algorithm (and merged between threads using the algorithm
+        by Chan et al.), which avoids the catastrophic cancellation in
+        sqrt(<v**2> - <v>**2) computed from separate projections.
+
+        Parameters
+        ----------
+        variable : str, array
+            The variable, it can be passed as string or a 1d array. A vector
+            field with shape (N, 3) (e.g. '0_Velocities') can also be passed,
+            in which case its component along the line of sight
+            (normal_vector) is used.
+
+        weights : str, array
+            The (non-negative) weights (e.g. '0_Masses'), it can be passed
+            as string or a 1d array.
+
+        return_weights : bool, optional
+            Whether to also return the projected weights, by default False.
+
+        Returns
+        -------
+        numpy array
+            The image (2d array) of the weighted mean of the variable.
+            Pixels without any weight are nan.
+
+        numpy array
+            The image (2d array) of the weighted standard deviation.
+
+        numpy array
+            The image of the projected weights (only if return_weights is True).
+        """
+        if isinstance(variable, str):
+            err_msg = 'projector uses a different parttype'
+            assert int(variable[0]) == self.parttype, err_msg
+            variable = self.snap[variable]
+        if len(variable.shape) == 2:
+            variable = self._get_variable(variable, vector=True)
+            variable = np.sum(variable * self.orientation.normal_vector[None, :], axis=1)
+        else:
+            variable = self._get_variable(variable)
+        weights = self._get_variable(weights)
+
+        # Do the projection
+        moments = self._cython_project_moments(self.center, self.widths, variable,
+                                               weights)
+
+        # Transpose
+        moments = np.transpose(moments, (0, 2, 1))
+
+        assert moments.shape[2] == self.npix_width, (moments.shape, self.npix_width)
+
+        assert moments.shape[1] == self.npix_height, (moments.shape, self.npix_height)
+
+        weight_projection, mean, m2 = moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(weight_projection > 0, mean, np.nan)
+            # M2 can be slightly negative due to round-off errors
+            dispersion = np.sqrt(np.maximum(m2, 0) / weight_projection)
+
+        if isinstance(variable, units.PaicosQuantity):
+            mean = mean * variable.unit_quantity
+            dispersion = dispersion * variable.unit_quantity
+
+        if not return_weights:
+            return mean, dispersion
+
+        area_per_pixel = self.area / np.prod(weight_projection.shape)
+
+        if isinstance(weights, units.PaicosQuantity):
+            weight_projection = weight_projection * weights.unit_quantity
+
+        return mean, dispersion, weight_projection / area_per_pixel
+
+    def iter_progressive(self, variable, n_first=1000000, refine_factor=4):
+        """
+        Projects a given variable onto a 2D plane progressively, i.e.,
+        first using a small random subsample of the cells and then using
+        successively larger subsamples, ending with all the cells.
+
+        This allows showing an approximate image quickly when exploring
+        large simulations interactively. The subsamples are drawn from the
+        random ordering of the cells stored on the snapshot (see
+        Snapshot.get_random_order), such that they are the same every time
+        and each subsample contains the previous one. When a fraction f of
+        the cells is used, the variable is multiplied by 1/f (conserving
+        e.g. the total mass) and the smoothing lengths are multiplied
+        by (1/f)^(1/3) (each cell represents the volume of 1/f cells).
+        The last image is identical to the one returned by project_variable.
+
+        Parameters
+        ----------
+        variable : str, array
+            The variable to be projected, it can be passed as string
+            or a 1d array.
+
+        n_first : int, optional
+            The (approximate) number of cells used for the first image,
+            by default 1000000.
+
+        refine_factor : float, optional
+            The factor by which the number of cells increases between
+            two successive images, by default 4. The total cost of all
+            the images is then at most 4/3 times the cost of the last one.
+
+        Yields
+        ------
+        fraction : float
+            The fraction of the cells used for the image.
+
+        image : numpy array
+            The image (2d array) of the projected variable.
+
+        Examples
+        ----------
+
+        An example::
+
+            projector = pa.NestedProjector(snap, center, widths, 'z',
+                                           make_snap_with_selection=False)
+
+            for fraction, image in projector.iter_progressive('0_Masses'):
+                print(f'Rendered with {100 * fraction:.1f}% of the cells')
+                # ... show the image
+
+        """
+        if refine_factor <= 1:
+            raise RuntimeError('refine_factor must be larger than 1')
+
+        variable = self._get_variable(variable)
+
+        unit_quantity = None
+        if isinstance(variable, units.PaicosQuantity):
+            unit_quantity = variable.unit_quantity
+
+        area_per_pixel = self.area / (self.npix_width * self.npix_height)
+
+        # Keys of the cells in the random ordering of the snapshot
+        keys = self.snap.get_random_order(self.parttype)
+        if not self.make_snap_with_selection:
+            keys = keys[self._index_ids]
+
+        n_cells = keys.shape[0]
+        fraction = n_first / max(n_cells, 1)
+        if fraction > 0.5:
+            fraction = 1.0
+
+        while True:
+            if fraction < 1.0:
+                subsample = np.flatnonzero(keys < fraction)
+                scale = n_cells / max(subsample.shape[0], 1)
+                projection = self._cython_project_particles(
+                    self.center, self.widths, self.pos[subsample],
+                    self.hsml[subsample] * np.cbrt(scale),
+                    variable[subsample] * scale)
+                used_fraction = subsample.shape[0] / n_cells
+            else:
+                projection = self._cython_project(self.center, self.widths, variable)
+                used_fraction = 1.0
+
+            projection = projection.T
+
+            if unit_quantity is not None:
+                projection = projection * unit_quantity
+
+            yield used_fraction, projection / area_per_pixel
+
+            if fraction >= 1.0:
+                break
+
+            # Subsamples with more than half of the cells cost about as
+            # much as the full projection
+            fraction = fraction * refine_factor
+            if fraction > 0.5:
+                fraction = 1.0
+
+    def _get_tile_factors(self):
+        """
+        The pixel size of the grid onto which each cell is projected in units
+        of the pixel size of the image (always 1 for the Projector),
+        see iter_tiles.
+        """
+        return np.ones(self.hsml.shape[0])
+
+    def _render_window(self, x, y, h, norms, variable, ix0, iy0, npix, nx_image,
+                       ny_image):
+        """
+        Project the particles at (x, y) with smoothing lengths h (in units of
+        pixels of an image with nx_image x ny_image pixels) onto the square
+        window with npix x npix pixels with lower left pixel (ix0, iy0).
+        Particles extending beyond the window are clipped to it.
+        """
+        if settings.openMP_has_issues:
+            from ..cython.sph_projectors import project_image_window as project
+        else:
+            from ..cython.sph_projectors import project_image_window_omp as project
+
+        image = project(x, y, variable, h, norms, ix0, iy0, npix, npix,
+                        nx_image, ny_image, settings.numthreads_reduction)
+
+        return image.T
+
+    def _project_tile(self, index, x, y, h, norms, variable, origin, npix):
+        """
+        Project the particles in index onto the tile with npix x npix pixels
+        and lower left pixel origin = (iy0, ix0), see iter_tiles.
+        """
+        return self._render_window(x[index], y[index], h[index], norms[index],
+                                   variable[index], origin[1], origin[0], npix,
+                                   self.npix_width, self.npix_height)
+
+    def iter_tiles(self, variable, tile_size=2048, tiles=None):
+        """
+        Projects a given variable onto a 2D plane, one square tile at a time.
+
+        This allows creating images that are too large to be held in memory.
+        Each tile is rendered using only the cells whose smoothing length
+        overlaps the tile, and the cells extending beyond the tile are
+        clipped to it, such that the memory use is set by the tile size.
+        The tiles add up to the image found with project_variable.
+
+        Parameters
+        ----------
+        variable : str, array
+            The variable to be projected, it can be passed as string
+            or a 1d array.
+
+        tile_size : int, optional
+            The number of pixels in each direction of a tile, by default 2048.
+
+        tiles : iterable, optional
+            The tiles to render, given as (ty, tx), where the tile (ty, tx)
+            starts at pixel (ty * tile_size, tx * tile_size) of the image.
+            By default (None), all the tiles are rendered.
+
+        Yields
+        ------
+        index : tuple of slices
+            The location of the tile in the full image, i.e.,
+            image[index] = tile.
+
+        tile : numpy array
+            The image (2d array) of the projected variable in the tile.
+        """
+        if settings.openMP_has_issues:
+            from ..cython.sph_projectors import get_kernel_norms as get_norms
+        else:
+            from ..cython.sph_projectors import get_kernel_norms_omp as get_norms
+
+        variable = self._get_variable(variable)
+
+        area_per_pixel = self.area / (self.npix_width * self.npix_height)
+
+        unit_quantity = None
+        if isinstance(variable, units.PaicosQuantity):
+            unit_quantity = variable.unit_quantity
+
+        if settings.use_units:
+            pos = self.pos.value
+            hsml = self.hsml.value
+            variable = variable.value
+            center = self.center.value
+            width = self.width.value
+            height = self.height.value
+        else:
+            pos = np.array(self.pos)
+            hsml = np.array(self.hsml)
+            center = np.array(self.center)
+            width = self.width
+            height = self.height
+        variable = np.array(variable, dtype=np.float64)
+
+        npix_width = self.npix_width
+        npix_height = self.npix_height
+
+        perp_vector1 = self.orientation.perp_vector1
+        perp_vector2 = self.orientation.perp_vector2
+
+        # Coordinates in the image plane in units of the pixels of the
+        # image (lower left corner of the image at the origin), as in
+        # the cython code used by project_variable
+        x = (np.dot(pos - center, perp_vector1) + width / 2) * npix_width / width
+        y = (np.dot(pos - center, perp_vector2) + height / 2) * npix_height / height
+        h = hsml * npix_width / width
+
+        # Kernel normalizations (on the grid onto which each cell is projected)
+        factors = self._get_tile_factors()
+        norms = get_norms(x / factors, y / factors, h / factors,
+                          settings.numthreads_reduction)
+
+        # The extent of the smoothing kernel (which is at least a pixel
+        # of the grid onto which the cell is projected) plus a pixel
+        extent = np.maximum(h, factors) + 1.0
+
+        if tiles is not None:
+            tiles = {tuple(tile) for tile in tiles}
+
+        self._tile_cache = {}
+        try:
+            for y0 in range(0, npix_height, tile_size):
+                ty = y0 // tile_size
+                if tiles is not None and not any(tile[0] == ty for tile in tiles):
+                    continue
+                row = np.flatnonzero((y + extent > y0) * (y - extent < y0 + tile_size))
+                for x0 in range(0, npix_width, tile_size):
+                    if tiles is not None and (ty, x0 // tile_size) not in tiles:
+                        continue
+                    index = row[(x[row] + extent[row] > x0)
+                                * (x[row] - extent[row] < x0 + tile_size)]
+
+                    tile = self._project_tile(index, x, y, h, norms, variable,
+                                              (y0, x0), tile_size)
+
+                    ny = min(tile_size, npix_height - y0)
+                    nx = min(tile_size, npix_width - x0)
+                    tile = tile[:ny, :nx]
+
+                    if unit_quantity is not None:
+                        tile = tile * unit_quantity
+
+                    yield (slice(y0, y0 + ny), slice(x0, x0 + nx)), tile / area_per_pixel
+        finally:
+            # Also when the generator is abandoned
+            del self._tile_cache
+
+    def project_variable_tiled(self, variable, image_file, name=None, tile_size=2048):
+        """
+        Projects a given variable onto a 2D plane and saves the image to
+        an hdf5 file, one tile at a time (see iter_tiles). The memory usage
+        is set by the tile size rather than by the size of the full image.
+
+        Parameters
+        ----------
+        variable : str, array
+            The variable to be projected, it can be passed as string
+            or a 1d array.
+
+        image_file : ArepoImage
+            The image file in which to save the image (as a chunked data set).
+
+        name : str, optional
+            The name of the image in the hdf5 file. Required if variable
+            is not a string.
+
+        tile_size : int, optional
+            The number of pixels in each direction of a tile, by default 2048.
+        """
+        if name is None:
+            if not isinstance(variable, str):
+                raise RuntimeError('A name is required for non-string variables')
+            name = variable
+
+        shape = (self.npix_height, self.npix_width)
+        image_file.save_image_tiles(name, shape, self.iter_tiles(variable, tile_size),
+                                    tile_size)
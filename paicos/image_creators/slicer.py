@@ -16,7 +16,8 @@ class Slicer(ImageCreator):
     """
 
     def __init__(self, snap, center, widths, direction,
-                 npix=512, parttype=0, make_snap_with_selection=False):
+                 npix=512, parttype=0, make_snap_with_selection=False,
+                 use_snap_tree=False):
         """
         Initialize the Slicer object.
 
@@ -52,6 +53,16 @@ class Slicer(ImageCreator):
             a boolean indicating if a new snapshot object should be made with
             the selected region, defaults to False
 
+        use_snap_tree : bool
+            If True, the nearest Voronoi cells are found by querying a tree
+            which is constructed once for all the cells of the parttype
+            and cached on the snapshot (see Snapshot.get_tree). This avoids
+            constructing a new tree every time the center, widths,
+            resolution or orientation of the slicer is changed, e.g.,
+            when making movies. Defaults to False, in which case a
+            smaller tree is constructed from the cells close to
+            the image plane.
+
         """
 
         if make_snap_with_selection:
@@ -59,6 +70,8 @@ class Slicer(ImageCreator):
 
         super().__init__(snap, center, widths, direction, npix=npix, parttype=parttype)
 
+        self.use_snap_tree = use_snap_tree
+
         for ii, direc in enumerate(['x', 'y', 'z']):
             if self.direction == direc:
                 assert self.widths[ii] == 0.
@@ -71,6 +84,48 @@ class Slicer(ImageCreator):
 
         self.do_unit_consistency_check()
 
+        parttype = self.parttype
+        snap = self.snap
+
+        if self.use_snap_tree:
+            # Query the tree of the full snapshot (constructed only once)
+            tree = snap.get_tree(parttype)
+        else:
+            tree = self._get_tree_for_thin_layer()
+
+        # Now construct the image grid
+        w, h = self._get_width_and_height_arrays()
+
+        center = self.center
+        ones = np.ones(w.shape[0])
+        if self.direction == 'x':
+            image_points = np.vstack([ones * center[0], w, h]).T
+        elif self.direction == 'y':
+            image_points = np.vstack([h, ones * center[1], w]).T
+        elif self.direction == 'z':
+            image_points = np.vstack([w, h, ones * center[2]]).T
+        elif self.direction == 'orientation':
+            orientation = self.orientation
+            image_points = np.vstack([w, h, ones * center[2]]).T - self.center
+            image_points = np.matmul(orientation.rotation_matrix, image_points.T).T \
+                + self.center
+        else:
+            raise RuntimeError(f"Problem with direction={self.direction} input")
+
+        # Query the tree to obtain closest Voronoi cell indices
+        d, i = tree.query(image_points, workers=settings.numthreads)
+
+        if self.use_snap_tree:
+            self.index = self._unflatten(i)
+        else:
+            self.index = self._unflatten(self.index_in_slice_region[i])
+        self.distance_to_nearest_cell = self._unflatten(d)
+
+    def _get_tree_for_thin_layer(self):
+        """
+        Select the cells in a narrow region around the image plane and
+        construct a tree from their positions.
+        """
         parttype = self.parttype
         snap = self.snap
         center = self.center
@@ -106,32 +161,7 @@ class Slicer(ImageCreator):
 
         # Construct a tree
         self.pos = snap[f"{parttype}_Coordinates"][self.slice]
-        tree = KDTree(self.pos)
-
-        # Now construct the image grid
-        w, h = self._get_width_and_height_arrays()
-
-        center = self.center
-        ones = np.ones(w.shape[0])
-        if self.direction == 'x':
-            image_points = np.vstack([ones * center[0], w, h]).T
-        elif self.direction == 'y':
-            image_points = np.vstack([h, ones * center[1], w]).T
-        elif self.direction == 'z':
-            image_points = np.vstack([w, h, ones * center[2]]).T
-        elif self.direction == 'orientation':
-            orientation = self.orientation
-            image_points = np.vstack([w, h, ones * center[2]]).T - self.center
-            image_points = np.matmul(orientation.rotation_matrix, image_points.T).T \
-                + self.center
-        else:
-            raise RuntimeError(f"Problem with direction={self.direction} input")
-
-        # Query the tree to obtain closest Voronoi cell indices
-        d, i = tree.query(image_points, workers=settings.numthreads)
-
-        self.index = self._unflatten(self.index_in_slice_region[i])
-        self.distance_to_nearest_cell = self._unflatten(d)
+        return KDTree(self.pos)
 
     def _get_width_and_height_arrays(self):
         """
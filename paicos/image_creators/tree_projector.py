@@ -16,7 +16,8 @@ class TreeProjector(ImageCreator):
 
     def __init__(self, snap, center, widths, direction,
                  npix=512, npix_depth=None, parttype=0, make_snap_with_selection=False,
-                 tol=1, verbose=False):
+                 tol=1, verbose=False, use_snap_tree=False, low_memory=False,
+                 depth_slab=32, use_compact_index=False):
 
         """
         Initialize the Slicer object.
@@ -59,6 +60,39 @@ class TreeProjector(ImageCreator):
             a boolean indicating if a new snapshot object should be made with
             the selected region, defaults to False.
 
+        use_snap_tree : bool
+            If True, the nearest Voronoi cells are found by querying a tree
+            which is constructed once for all the cells of the parttype
+            and cached on the snapshot (see Snapshot.get_tree). This avoids
+            constructing a new tree every time the center, widths,
+            resolution or orientation of the projector is changed.
+            Defaults to False, in which case a tree is constructed from
+            the cells inside the projection region.
+
+        low_memory : bool
+            By default (low_memory=False), the indices of the Voronoi cells
+            closest to all the sample points are stored in an integer array,
+            self.index, with shape (npix_height, npix_width, npix_depth).
+            This array can become very large for high resolution images.
+            Setting low_memory=True avoids storing it. Instead, the tree is
+            queried in slabs of depth_slab layers every time a projection
+            is made and only the running image sums are stored. Use the
+            project_variables method to project several variables in the
+            same pass through the depth.
+
+        depth_slab : int, optional
+            Only used when low_memory=True. The number of layers in the
+            depth direction which are processed together, by default 32.
+            The full index (low_memory=False) is always constructed one
+            layer at a time to keep the temporary memory use small.
+
+        use_compact_index : bool
+            Only used when low_memory=True. If True, a compact index is
+            stored, containing only the unique cells along each line of
+            sight and the number of depth samples inside each of them. This
+            allows to project additional variables without querying the
+            tree again. Defaults to False.
+
         """
 
         if make_snap_with_selection:
@@ -69,6 +103,10 @@ class TreeProjector(ImageCreator):
         self.npix_depth = npix_depth
         self.tol = tol
         self.verbose = verbose
+        self.use_snap_tree = use_snap_tree
+        self.low_memory = low_memory
+        self.depth_slab = depth_slab
+        self.use_compact_index = use_compact_index
 
         self._do_region_selection()
 
@@ -120,59 +158,142 @@ class TreeProjector(ImageCreator):
 
             self.npix_depth = npix_depth
 
-        self.index_in_box_region = np.arange(snap[f"{self.parttype}_Coordinates"].shape[0]
-                                             )[self.box_selection]
+        if self.use_snap_tree:
+            # Query the tree of the full snapshot (constructed only once)
+            tree = snap.get_tree(parttype)
+        else:
+            self.index_in_box_region = np.arange(snap[f"{self.parttype}_Coordinates"].shape[0]
+                                                 )[self.box_selection]
 
-        # Construct a tree
-        self.pos = snap[f"{parttype}_Coordinates"][self.box_selection]
-        tree = KDTree(self.pos)
-        if self.verbose:
-            print('Tree construction [DONE]')
+            # Construct a tree
+            self.pos = snap[f"{parttype}_Coordinates"][self.box_selection]
+            tree = KDTree(self.pos)
+            if self.verbose:
+                print('Tree construction [DONE]')
+
+        self._tree = tree
 
-        # Now construct the image grid
+        self.delta_depth = self.depth / self.npix_depth
+        self._depth_vector = np.arange(self.npix_depth) * self.delta_depth \
+            + self.delta_depth / 2 - self.depth / 2
+
+        if min_thickness < self.delta_depth / self.tol:
+            print(f'Warning: Minimum cell size {min_thickness} is '
+                  + f'less than {self.tol} of delta_depth '
+                  + f'{self.delta_depth}. You should probably increase '
+                  + f'npix_depth from its current value of {self.npix_depth}. '
+                  + 'Image convergence is expected for npix_depth='
+                  + f'{int(self.depth/min_thickness)}.')
+
+        if self.low_memory:
+            # Only the tree is kept, the projections are then
+            # calculated by streaming through the depth in slabs
+            self.index = None
+            self.compact_index = None
+            if self.use_compact_index:
+                self.compact_index = self._get_compact_index()
+        else:
+            # Full index
+            self.index = np.empty((self.npix_height, self.npix_width, self.npix_depth),
+                                  dtype=np.int64)
+
+            for ii, slab_index in self._iterate_depth_slabs(depth_slab=1):
+                self.index[:, :, ii] = self._unflatten(slab_index)
+
+    def _iterate_depth_slabs(self, depth_slab=None):
+        """
+        Generator which loops through the depth of the projection region
+        in slabs of (at most) depth_slab layers (self.depth_slab if None).
+
+        For each slab, it yields the index of the first layer in the slab
+        and an integer array with shape (npix_height × npix_width, n_slab),
+        which contains the indices (in the snapshot) of the Voronoi cells
+        closest to each of the sample points in the slab.
+        """
         w, h = self._get_width_and_height_arrays()
 
         center = self.center
-        ones = np.ones(w.shape[0])
+        depth_vector = self._depth_vector
+        if settings.use_units:
+            w = w.value
+            h = h.value
+            center = center.value
+            depth_vector = depth_vector.value
+
+        n_pix = w.shape[0]
+        ones = np.ones(n_pix)
+
+        if depth_slab is None:
+            depth_slab = self.depth_slab
+
+        for i_start in range(0, self.npix_depth, depth_slab):
+            deps = depth_vector[i_start:i_start + depth_slab]
+            n_slab = deps.shape[0]
+
+            # Sample points for all layers in slab (layer by layer)
+            image_points = np.empty((n_slab, n_pix, 3))
+            for jj, dep in enumerate(deps):
+                if self.direction == 'x':
+                    image_points[jj] = np.vstack([ones * (center[0] + dep), w, h]).T
+                elif self.direction == 'y':
+                    image_points[jj] = np.vstack([h, ones * (center[1] + dep), w]).T
+                elif self.direction == 'z':
+                    image_points[jj] = np.vstack([w, h, ones * (center[2] + dep)]).T
+                elif self.direction == 'orientation':
+                    orientation = self.orientation
+                    points = np.vstack([w, h, ones * (center[2] + dep)]).T - center
+                    image_points[jj] = np.matmul(orientation.rotation_matrix, points.T).T \
+                        + center
+                else:
+                    raise RuntimeError(f"Problem with direction={self.direction} input")
 
-        # Full index
-        self.index = np.empty((self.npix_height, self.npix_width, self.npix_depth),
-                              dtype=np.int64)
+            # Query the tree to obtain closest Voronoi cell indices
+            d, i = self._tree.query(image_points.reshape((n_slab * n_pix, 3)),
+                                    workers=settings.numthreads)
 
-        self.delta_depth = self.depth / self.npix_depth
-        depth_vector = np.arange(self.npix_depth) * self.delta_depth \
-            + self.delta_depth / 2 - self.depth / 2
+            if not self.use_snap_tree:
+                i = self.index_in_box_region[i]
 
-        for ii, dep in enumerate(depth_vector):
-            if self.direction == 'x':
-                image_points = np.vstack([ones * (center[0] + dep), w, h]).T
-            elif self.direction == 'y':
-                image_points = np.vstack([h, ones * (center[1] + dep), w]).T
-            elif self.direction == 'z':
-                image_points = np.vstack([w, h, ones * (center[2] + dep)]).T
-            elif self.direction == 'orientation':
-                orientation = self.orientation
-                image_points = np.vstack([w, h, ones * (center[2] + dep)]).T - self.center
-                image_points = np.matmul(orientation.rotation_matrix, image_points.T).T \
-                    + self.center
-            else:
-                raise RuntimeError(f"Problem with direction={self.direction} input")
+            self.distance_to_nearest_cell = self._unflatten(d[-n_pix:])
 
-            # Query the tree to obtain closest Voronoi cell indices
-            d, i = tree.query(image_points, workers=settings.numthreads)
+            yield i_start, i.reshape((n_slab, n_pix)).T
 
-            slice_index = self._unflatten(self.index_in_box_region[i])
-            self.distance_to_nearest_cell = self._unflatten(d)
+    def _get_compact_index(self):
+        """
+        Calculate a compact version of the index, i.e., for each pixel
+        the list of unique Voronoi cells along its line of sight and
+        the number of depth samples that land in each of them.
 
-            if min_thickness < self.delta_depth / self.tol:
-                print(f'Warning: Minimum cell size {min_thickness} is '
-                      + f'less than {self.tol} of delta_depth '
-                      + f'{self.delta_depth}. You should probably increase '
-                      + f'npix_depth from its current value of {self.npix_depth}. '
-                      + 'Image convergence is expected for npix_depth='
-                      + f'{int(self.depth/min_thickness)}.')
+        Returns a dictionary with three 1D arrays ('pixel', 'cell', 'count')
+        of equal length.
+        """
+        n_pix = self.npix_height * self.npix_width
+
+        slab_keys_list = []
+        slab_counts_list = []
+
+        for _, slab_index in self._iterate_depth_slabs():
+            pixels = np.repeat(np.arange(n_pix, dtype=np.int64), slab_index.shape[1])
+            slab_keys = slab_index.flatten() * n_pix + pixels
+            slab_keys, slab_counts = np.unique(slab_keys, return_counts=True)
+            slab_keys_list.append(slab_keys)
+            slab_counts_list.append(slab_counts)
+
+        # Merge the results from the slabs (cells spanning several slabs
+        # appear in more than one of them)
+        keys, inverse = np.unique(np.concatenate(slab_keys_list), return_inverse=True)
+        counts = np.bincount(inverse.flatten(),
+                             weights=np.concatenate(slab_counts_list),
+                             minlength=keys.shape[0]).astype(np.int64)
+
+        compact_index = {'pixel': keys % n_pix,
+                         'cell': keys // n_pix,
+                         'count': counts}
+        if self.verbose:
+            print(f'Compact index has {keys.shape[0]} entries, '
+                  + f'full index would have {n_pix * self.npix_depth}')
 
-            self.index[:, :, ii] = slice_index
+        return compact_index
 
     def _get_width_and_height_arrays(self):
         """
@@ -212,7 +333,7 @@ class TreeProjector(ImageCreator):
         """
         return arr.flatten().reshape((self.npix_height, self.npix_width))
 
-    def project_variable(self, variable, additive=True, extrinsic=None):
+    def project_variable(self, variable, additive=True, extrinsic=None, reduce='sum'):
         """
         Project gas variable based on the Voronoi cells closest to each
         line of sight.
@@ -248,6 +369,14 @@ class TreeProjector(ImageCreator):
             or not (e.g. Temperature, density).
             This parameter was previously named 'extrinsic'.
 
+        reduce : str
+            How the variable is reduced along the line of sight. By default
+            ('sum') the variable is integrated as described above. With 'max'
+            (or 'min') the projection is the maximum (or minimum) of the
+            variable among the Voronoi cells along the line of sight, e.g.
+            for finding shocks or hot spots. The additive parameter is then
+            not used.
+
         Returns:
 
             projection : 2d arr
@@ -288,6 +417,12 @@ class TreeProjector(ImageCreator):
                           + " The support for 'extrinsic' will be removed eventually.")
             additive = extrinsic
 
+        if reduce not in ['sum', 'max', 'min']:
+            raise RuntimeError(f"reduce='{reduce}' is not one of 'sum', 'max' or 'min'")
+
+        if self.low_memory:
+            return self.project_variables([variable], additive=additive, reduce=reduce)[0]
+
         parttype = self.parttype
 
         if isinstance(variable, str):
@@ -299,6 +434,22 @@ class TreeProjector(ImageCreator):
 
         assert len(variable.shape) == 1, 'only scalars can be projected'
 
+        if reduce != 'sum':
+            # Reduce the index in slabs (avoids creating an array with
+            # the variable for all the sample points)
+            reduce_func = np.max if reduce == 'max' else np.min
+            projection = None
+            for i_start in range(0, self.npix_depth, self.depth_slab):
+                slab = reduce_func(variable[self.index[:, :, i_start:i_start + self.depth_slab]],
+                                   axis=2)
+                if projection is None:
+                    projection = slab
+                elif reduce == 'max':
+                    projection = np.maximum(projection, slab)
+                else:
+                    projection = np.minimum(projection, slab)
+            return projection
+
         if additive:
             avail_list = (list(self.snap.keys()) + self.snap._auto_list)
             if f'{parttype}_Volume' in avail_list:
@@ -325,3 +476,155 @@ class TreeProjector(ImageCreator):
             """
 
         return projection
+
+    def project_variables(self, variables, additive=True, reduce='sum'):
+        """
+        Project several variables in a single pass through the depth
+        of the projection region.
+
+        This is mainly useful when the TreeProjector has been initialized
+        with low_memory=True, in which case the tree is queried once for
+        all the variables. Otherwise, this method simply calls
+        project_variable for each of the variables.
+
+        Parameters
+        ----------
+        variables : list
+            A list of variables (strings or 1d arrays) to be projected.
+
+        additive : bool, list
+            Whether the variables are additive, see project_variable.
+            Either a single boolean used for all the variables or a
+            list of booleans with the same length as variables.
+
+        reduce : str
+            How the variables are reduced along the line of sight,
+            'sum' (default), 'max' or 'min', see project_variable.
+
+        Returns:
+
+            projections : list
+                A list of 2d arrays with the projected variables.
+
+        Examples
+        ----------
+
+        An example::
+
+            tree_projector = pa.TreeProjector(snap, center, widths, 'z',
+                                              low_memory=True)
+
+            M, V, T = tree_projector.project_variables(
+                ['0_Masses', '0_Volume', '0_Temperatures'],
+                additive=[True, True, False])
+
+        """
+        # This calls _do_region_selection if resolution, Orientation,
+        # widths or center changed
+        self._check_if_properties_changed()
+
+        if isinstance(additive, bool):
+            additive = [additive] * len(variables)
+
+        assert len(additive) == len(variables)
+
+        if not self.low_memory:
+            return [self.project_variable(variable, additive=add, reduce=reduce)
+                    for variable, add in zip(variables, additive)]
+
+        if reduce not in ['sum', 'max', 'min']:
+            raise RuntimeError(f"reduce='{reduce}' is not one of 'sum', 'max' or 'min'")
+
+        parttype = self.parttype
+
+        # The quantities to integrate along the line of sight
+        integrands = []
+        for variable, add in zip(variables, additive):
+            if isinstance(variable, str):
+                assert int(variable[0]) == parttype, 'projector uses a different parttype'
+                variable = self.snap[variable]
+            else:
+                if not isinstance(variable, np.ndarray):
+                    raise RuntimeError('Unexpected type for variable')
+
+            assert len(variable.shape) == 1, 'only scalars can be projected'
+
+            if add and reduce == 'sum':
+                avail_list = (list(self.snap.keys()) + self.snap._auto_list)
+                if f'{parttype}_Volume' in avail_list:
+                    integrands.append(variable / self.snap[f'{parttype}_Volume'])
+                else:
+                    err_msg = (f"The volume field for parttype {parttype} is required when"
+                               + "using additive=True")
+                    raise RuntimeError(err_msg)
+            else:
+                integrands.append(variable)
+
+        if reduce != 'sum':
+            return self._reduce_along_depth(integrands, reduce)
+
+        sums = self._reduce_along_depth(integrands)
+
+        projections = []
+        for summed, add in zip(sums, additive):
+            projection = summed * self.delta_depth
+            if not add:
+                projection = projection / self.depth
+            projections.append(projection)
+
+        return projections
+
+    def _reduce_along_depth(self, integrands, reduce='sum'):
+        """
+        Sum (or find the maximum or minimum, for reduce='max' or 'min')
+        a list of cell-based variables over all sample points along the
+        line of sight of each pixel, either using the compact index
+        or by querying the tree in slabs.
+        """
+        n_pix = self.npix_height * self.npix_width
+
+        values = []
+        unit_quantities = []
+        for integrand in integrands:
+            if hasattr(integrand, 'unit'):
+                values.append(integrand.value)
+                unit_quantities.append(integrand.unit_quantity)
+            else:
+                values.append(np.asarray(integrand))
+                unit_quantities.append(None)
+
+        if reduce != 'sum':
+            find_max = reduce == 'max'
+            sums = [np.full(n_pix, -np.inf if find_max else np.inf) for _ in values]
+            if self.compact_index is not None:
+                ufunc = np.maximum if find_max else np.minimum
+                pixel = self.compact_index['pixel']
+                cell = self.compact_index['cell']
+                for summed, value in zip(sums, values):
+                    ufunc.at(summed, pixel, value[cell])
+            else:
+                reduce_func = np.max if find_max else np.min
+                ufunc = np.maximum if find_max else np.minimum
+                for _, slab_index in self._iterate_depth_slabs():
+                    for summed, value in zip(sums, values):
+                        ufunc(summed, reduce_func(value[slab_index], axis=1), out=summed)
+        elif self.compact_index is not None:
+            pixel = self.compact_index['pixel']
+            cell = self.compact_index['cell']
+            count = self.compact_index['count']
+            sums = [np.bincount(pixel, weights=value[cell] * count, minlength=n_pix)
+                    for value in values]
+        else:
+            sums = [np.zeros(n_pix) for _ in values]
+            for _, slab_index in self._iterate_depth_slabs():
+                for summed, value in zip(sums, values):
+                    summed += np.sum(value[slab_index], axis=1)
+
+        results = []
+        for summed, unit_quantity in zip(sums, unit_quantities):
+            summed = self._unflatten(summed)
+            if unit_quantity is not None:
+                summed = summed * unit_quantity
+            results.append(summed)
+
+        return results
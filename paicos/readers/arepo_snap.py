@@ -5,10 +5,12 @@ import numbers
 import warnings
 import numpy as np
 import h5py
+from scipy.spatial import KDTree
 from .arepo_catalog import Catalog
 from .paicos_readers import PaicosReader
 from ..writers.paicos_writer import PaicosWriter
 from .. import settings
+from .. import util
 from ..derived_variables import derived_variables
 
 
@@ -107,6 +109,12 @@ class Snapshot(PaicosReader):
         if not hasattr(self, "dic_selection_index"):
             self.dic_selection_index = {}
 
+        # Spatial trees, one per parttype, see get_tree
+        self._trees = {}
+
+        # Random orderings of the cells, one per parttype, see get_random_order
+        self._random_orders = {}
+
         self.nfiles = self.Header["NumFilesPerSnapshot"]
         self.npart = self.Header["NumPart_Total"]
         self.nspecies = self.npart.size
@@ -755,6 +763,90 @@ class Snapshot(PaicosReader):
             del self[p_key]
         if p_key in self.P_attrs:
             del self.P_attrs[p_key]
+        if blockname == 'Coordinates' and parttype in self._trees:
+            del self._trees[parttype]
+
+    def get_tree(self, parttype=0):
+        """
+        Returns a KDTree (scipy.spatial.KDTree) constructed from all the
+        coordinates of a given parttype.
+
+        The tree is constructed on the first call and then stored on the
+        snapshot object, such that image creators (e.g. a Slicer or
+        TreeProjector with use_snap_tree=True) can keep querying the same
+        tree while their center, widths, resolution or orientation change.
+        The stored tree is discarded and reconstructed if the coordinates
+        of the parttype are replaced or removed (in-place modifications
+        of the coordinate array are not detected).
+
+        Parameters
+        ----------
+            parttype : int
+                The particle type, default is gas (PartType 0).
+
+        Returns
+        -------
+            tree : scipy.spatial.KDTree
+                A tree in the (unitless) coordinates of the snapshot.
+                Indices returned by tree.query refer to the full
+                coordinate array, snap[f'{parttype}_Coordinates'].
+
+        """
+        pos = self[f'{parttype}_Coordinates']
+
+        if parttype in self._trees:
+            tree_pos, tree = self._trees[parttype]
+            if tree_pos is pos:
+                return tree
+
+        if hasattr(pos, 'unit'):
+            tree = KDTree(pos.value)
+        else:
+            tree = KDTree(pos)
+
+        self._trees[parttype] = (pos, tree)
+        return tree
+
+    def get_random_order(self, parttype=0):
+        """
+        Returns a random key for each cell (of a given parttype), uniformly
+        distributed in [0, 1), which defines a random ordering of the cells.
+
+        The key of a cell is a hash of its ParticleID (or of its index in
+        the full snapshot if the ParticleIDs are not available), see
+        util.get_random_numbers_from_ids, i.e., it is the same every time
+        the snapshot is loaded, and the same for the cells of a snapshot
+        created with the select method. The cells with key < f thus form a
+        random subsample of (on average) a fraction f of the cells, which
+        is consistent between selections and grows with f
+        (see Projector.iter_progressive).
+
+        The keys are calculated on the first call (only for the cells of
+        the snapshot object) and then stored on the snapshot object.
+
+        Parameters
+        ----------
+            parttype : int
+                The particle type, default is gas (PartType 0).
+
+        Returns
+        -------
+            keys : numpy array
+                Float array with the keys of the cells.
+
+        """
+        if parttype not in self._random_orders:
+            avail_list = list(self.keys()) + self._auto_list
+            if f'{parttype}_ParticleIDs' in avail_list:
+                ids = self[f'{parttype}_ParticleIDs']
+            elif parttype in self.dic_selection_index:
+                ids = self.dic_selection_index[parttype]
+            else:
+                ids = np.arange(int(self.npart[parttype]))
+            self._random_orders[parttype] = util.get_random_numbers_from_ids(
+                np.asarray(ids), seed=parttype)
+
+        return self._random_orders[parttype]
 
     def select(self, selection_index, parttype=None):
         """
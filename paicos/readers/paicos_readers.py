@@ -780,3 +780,33 @@ class Histogram2DReader(PaicosReader):
         self.hist2d = self['hist2d']
         self.centers_x = self['centers_x']
         self.centers_y = self['centers_y']
+
+
+class HistogramNDReader(PaicosReader):
+    """
+    This is a subclass of the PaicosReader.
+
+    It reads the additional information stored by a HistogramND instance
+    and makes them accessible as attributes, i.e., ndim, normalize,
+    logscale, histnd, edges and centers (lists with one array per axis).
+    """
+
+    def __init__(self, basedir='.', snapnum=None, basename='nd_histogram'):
+        """
+        See documentation for the PaicosReader.
+
+        Returns a dictionary with additional attributes.
+        """
+
+        # The PaicosReader class takes care of most of the loading
+        super().__init__(basedir, snapnum, basename=basename,
+                         load_all=True)
+
+        with h5py.File(self.filename, 'r') as hdf5file:
+            self.ndim = int(hdf5file['hist_info'].attrs['ndim'])
+            self.normalize = hdf5file['hist_info'].attrs['normalize']
+            self.logscale = [bool(log) for log in hdf5file['hist_info'].attrs['logscale']]
+
+        self.histnd = self['histnd']
+        self.edges = [self[f'edges_{idim}'] for idim in range(self.ndim)]
+        self.centers = [self[f'centers_{idim}'] for idim in range(self.ndim)]
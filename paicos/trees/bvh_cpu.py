@@ -1,7 +1,11 @@
+import os
 import numba
 import math
 import numpy as np
-from .bvh_tree import leading_zeros_cython as count_leading_zeros
+from llvmlite import ir
+from numba.core import cgutils, types
+from numba.core.extending import intrinsic
+from .. import settings
 
 # Hardcoded for uint64 coordinates (don't change without also changing morton
 # code functions)
@@ -17,6 +21,49 @@ def leading_zeros_python(key64bit):
     return format(key64bit, '064b').find('1')
 
 
+@intrinsic
+def count_leading_zeros(typingctx, key64bit):
+    """
+    Count leading zeros of a 64 bit integer using the LLVM ctlz
+    intrinsic (the CPU equivalent of cuda.libdevice.clzll).
+    Returns 64 for key64bit = 0.
+    """
+    if not isinstance(key64bit, types.Integer) or key64bit.bitwidth != 64:
+        return None
+
+    sig = types.int64(key64bit)
+
+    def codegen(context, builder, signature, args):
+        return builder.ctlz(args[0], ir.Constant(ir.IntType(1), 0))
+
+    return sig, codegen
+
+
+@intrinsic
+def atomic_increment(typingctx, array, index):
+    """
+    Atomically increment array[index] by one and return the old value.
+    The CPU equivalent of cuda.atomic.add(array, index, 1), used for
+    the flags in propagate_bounds_upwards.
+    """
+    if not isinstance(array, types.Array) or array.ndim != 1 \
+            or array.dtype != types.int64 or not isinstance(index, types.Integer):
+        return None
+
+    sig = types.int64(array, index)
+
+    def codegen(context, builder, signature, args):
+        array_type, index_type = signature.args
+        array_struct = context.make_array(array_type)(context, builder, args[0])
+        ind = context.cast(builder, args[1], index_type, types.intp)
+        ptr = cgutils.get_item_pointer(context, builder, array_type, array_struct,
+                                       [ind])
+        one = context.get_constant(types.int64, 1)
+        return builder.atomic_rmw('add', ptr, one, 'seq_cst')
+
+    return sig, codegen
+
+
 @numba.jit(nopython=True)
 def part1by2_64(n):
     n &= 0x1fffff
@@ -56,15 +103,15 @@ def decode64(key):
     return numba.float64(x), numba.float64(y), numba.float64(z)
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, parallel=True)
 def get_morton_keys64(pos):
     morton_keys = np.empty(pos.shape[0], dtype=np.uint64)
-    for ip in range(pos.shape[0]):
+    for ip in numba.prange(pos.shape[0]):  # pylint: disable=not-an-iterable
         morton_keys[ip] = encode64(pos[ip, 0], pos[ip, 1], pos[ip, 2])
     return morton_keys
 
 
-# @numba.jit(nopython=True, inline='always')
+@numba.jit(nopython=True, inline='always')
 def findSplit(sortedMortonCodes, first, last):
     # Identical Morton codes => split the range in the middle.
 
@@ -99,7 +146,7 @@ def findSplit(sortedMortonCodes, first, last):
     return split
 
 
-# @numba.jit(nopython=True)
+@numba.jit(nopython=True, parallel=True)
 def generateHierarchy(sortedMortonCodes, tree_children, tree_parents):
     """
     Generate tree using the sorted Morton code.
@@ -112,7 +159,7 @@ def generateHierarchy(sortedMortonCodes, tree_children, tree_parents):
     num_internal_nodes = n_codes - 1
 
     # Launch thread for each internal node
-    for idx in range(num_internal_nodes):
+    for idx in numba.prange(num_internal_nodes):  # pylint: disable=not-an-iterable
 
         # Find out which range of objects the node corresponds to.
         # (This is where the magic happens!)
@@ -144,7 +191,7 @@ def generateHierarchy(sortedMortonCodes, tree_children, tree_parents):
         tree_parents[childB] = idx
 
 
-# @numba.jit(nopython=True, inline='always')
+@numba.jit(nopython=True, inline='always')
 def determineRange(sortedMortonCodes, n_codes, idx):
     """
     The determine range function needed by the generateHierarchy function.
@@ -153,7 +200,7 @@ def determineRange(sortedMortonCodes, n_codes, idx):
     """
     d = 1
     minPrefixLength = -1
-    firstIndex = idx
+    firstIndex = numba.int64(idx)
     max_last = n_codes
 
     if (firstIndex > 0):
@@ -205,6 +252,7 @@ def determineRange(sortedMortonCodes, n_codes, idx):
     return first, last
 
 
+@numba.jit(nopython=True)
 def find_bounding_volume_as_sfc_keys(center, hsml):
     min_val_x = numba.uint64(max(center[0] - hsml, 0))
     min_val_y = numba.uint64(max(center[1] - hsml, 0))
@@ -217,12 +265,13 @@ def find_bounding_volume_as_sfc_keys(center, hsml):
     return sfc_key_min, sfc_key_max
 
 
+@numba.jit(nopython=True, parallel=True)
 def set_leaf_bounding_volumes(tree_bounds, points, half_size, conversion_factor):
     num_internal_nodes = half_size.shape[0] - 1
     num_leafs = half_size.shape[0]
     f = conversion_factor
     to_int = numba.uint64
-    for ip in range(num_leafs):
+    for ip in numba.prange(num_leafs):  # pylint: disable=not-an-iterable
         center = points[ip, :]
         x_min = to_int(max((center[0] - f * half_size[ip]), 0))
         y_min = to_int(max((center[1] - f * half_size[ip]), 0))
@@ -241,39 +290,41 @@ def set_leaf_bounding_volumes(tree_bounds, points, half_size, conversion_factor)
         tree_bounds[ip + num_internal_nodes, 2, 1] = z_max
 
 
+@numba.jit(nopython=True, parallel=True)
 def propagate_bounds_upwards(tree_bounds, tree_parents, tree_children):
+    """
+    Calculate the bounding volumes of the internal nodes from the
+    bounding volumes of the leafs.
+
+    A thread is launched for each leaf and walks up the tree. The first
+    thread to arrive at a node stops (the other child of the node is not
+    necessarily done yet) while the second thread sets the bounds of the
+    node and continues upwards. The arrival order is determined using
+    an atomic flag for each internal node, see
+    https://developer.nvidia.com/blog/thinking-parallel-part-iii-tree-construction-gpu/
+    """
     num_internal_nodes = tree_children.shape[0]
     num_leafs = num_internal_nodes + 1
 
-    next_parents = []
-    for ip in range(num_leafs):
-        next_parents.append(tree_parents[ip + num_internal_nodes])
-    next_parents = np.unique(next_parents)
-
-    box = np.zeros((3, 2), dtype=np.uint64)
-    while len(next_parents) > 0:
-        current_parents = np.array(next_parents)
-        next_parents = []
-        for ii in range(current_parents.shape[0]):
-            node_id = current_parents[ii]
-            next_parent = tree_parents[node_id]
-            if next_parent != -1:
-                next_parents.append(tree_parents[node_id])
+    flags = np.zeros(num_internal_nodes, dtype=np.int64)
+
+    for ip in numba.prange(num_leafs):  # pylint: disable=not-an-iterable
+        node_id = tree_parents[ip + num_internal_nodes]
+
+        while node_id != -1:  # indicates hitting root
+            # First thread to arrive stops here
+            if atomic_increment(flags, node_id) == 0:
+                break
+
             childA = tree_children[node_id, 0]
             childB = tree_children[node_id, 1]
-            boundsA = tree_bounds[childA, :, :]
-            boundsB = tree_bounds[childB, :, :]
-            box[0, 0] = np.min([boundsB[0, 0], boundsA[0, 0]])
-            box[1, 0] = np.min([boundsB[1, 0], boundsA[1, 0]])
-            box[2, 0] = np.min([boundsB[2, 0], boundsA[2, 0]])
-            box[0, 1] = np.max([boundsB[0, 1], boundsA[0, 1]])
-            box[1, 1] = np.max([boundsB[1, 1], boundsA[1, 1]])
-            box[2, 1] = np.max([boundsB[2, 1], boundsA[2, 1]])
+            for ii in range(3):
+                tree_bounds[node_id, ii, 0] = min(tree_bounds[childA, ii, 0],
+                                                  tree_bounds[childB, ii, 0])
+                tree_bounds[node_id, ii, 1] = max(tree_bounds[childA, ii, 1],
+                                                  tree_bounds[childB, ii, 1])
 
-            tree_bounds[node_id, :, :] = box[:, :]
-        next_parents = np.unique(next_parents)
-        # if len(next_parents) < 10:
-        #     print(node_id, len(next_parents), next_parents)
+            node_id = tree_parents[node_id]
 
 
 @numba.jit(nopython=True)
@@ -305,126 +356,363 @@ def is_point_in_box(point, box):
 
 
 @numba.jit(nopython=True)
-def find_nearest_neighbors(points, tree_parents, tree_children, tree_bounds,
-                           query_points, dists, ids, start_id=0):
-    n_queries = query_points.shape[0]
-    for ip in range(n_queries):
-        num_internal_nodes = numba.int64(tree_children.shape[0])
-
-        # Select a query_point from the list of queries
-        query_point = query_points[ip]
-
-        if start_id != 0:
-            this_query_start_id = int(start_id)
-            # print(this_query_start_id, start_id)
-            is_leaf = start_id >= num_internal_nodes
-            in_box = is_point_in_box(
-                query_point, tree_bounds[this_query_start_id])
-            while not in_box or is_leaf:
-                # print(this_query_start_id, start_id)
-                this_query_start_id = tree_parents[this_query_start_id]
-                # print('dfdf')
-                in_box = is_point_in_box(
-                    query_point, tree_bounds[this_query_start_id])
-                # print('22222')
-                is_leaf = this_query_start_id >= num_internal_nodes
-                # print('33333', is_leaf, in_box)
-                # print(this_query_start_id, start_id)
-                if this_query_start_id == -1:
-                    # print('went all the way up...')
-                    this_query_start_id = 0
+def distance_squared(point, other_point):
+    return ((point[0] - other_point[0])**2
+            + (point[1] - other_point[1])**2
+            + (point[2] - other_point[2])**2)
+
+
+@numba.jit(nopython=True)
+def distance_to_box_squared(point, box):
+    """
+    Squared distance from a point to an axis-aligned box
+    (zero if the point is inside the box).
+    """
+    dist2 = 0.0
+    for ii in range(3):
+        if point[ii] < box[ii, 0]:
+            dist2 += (box[ii, 0] - point[ii])**2
+        elif point[ii] > box[ii, 1]:
+            dist2 += (point[ii] - box[ii, 1])**2
+    return dist2
+
+
+@numba.jit(nopython=True)
+def grow_queue(queue, size):
+    """
+    Returns the queue (an int64 work array used as the stack of a tree
+    traversal) if it can hold size entries, and otherwise a copy of it
+    with twice that size. This guards the traversals against deep trees,
+    e.g. with many points sharing the same Morton key.
+    """
+    if size <= queue.shape[0]:
+        return queue
+    new_queue = np.empty(2 * size, dtype=queue.dtype)
+    new_queue[:queue.shape[0]] = queue
+    return new_queue
+
+
+@numba.jit(nopython=True)
+def nearest_neighbor_cpu(points, tree_parents, tree_children, tree_bounds,
+                         query_point, num_internal_nodes, queue, start_id=0,
+                         guess=-1):
+    """
+    Find the nearest neighbor of a single query point.
+
+    The tree is traversed depth-first, visiting the nearest child first,
+    and nodes whose bounding box is further away than the current best
+    candidate are skipped.
+
+    The queue is an int64 work array (e.g. np.empty(256, dtype=np.int64))
+    which is passed in by the caller so that it can be reused between
+    queries.
+
+    A guess (a data id, e.g. the neighbor found in a previous, nearby
+    query) is used as the initial candidate. This does not change the
+    result but a good guess allows skipping most of the tree.
+
+    A non-zero start_id (a node or leaf id) starts the traversal
+    at the first parent of start_id whose bounding box contains the
+    query point. Note that this only searches part of the tree,
+    so it is an approximation.
+    """
+
+    this_query_start_id = 0
+    if start_id != 0:
+        node_id = start_id
+        while node_id != -1:
+            if node_id < num_internal_nodes:
+                if is_point_in_box(query_point, tree_bounds[node_id]):
+                    this_query_start_id = node_id
                     break
-        else:
-            this_query_start_id = 0
+            node_id = tree_parents[node_id]
 
-        # print('did we go here?')
-        # print('this_query_start_id', this_query_start_id, start_id)
-        # We traverse the nodes and leafs using a while loop and a queue.
+    # Initialize min_dist2 (squared distance), and min_index
+    min_dist2 = np.inf
+    min_index = -1
 
-        # Local memory on each tread (32 should be fine?)
-        queue = np.zeros(256, dtype=np.int64)
-        # Initialize queue_index an start at node 0
-        queue_index = 0
-        queue[queue_index] = this_query_start_id
+    if guess >= 0:
+        min_dist2 = distance_squared(query_point, points[guess])
+        min_index = guess
 
-        # Initialize min_dist, and min_index
-        min_dist = (2**L - 1.0)
-        min_index = -1
+    # We traverse the nodes and leafs using a while loop and a queue.
+    # Initialize queue_index an start at node this_query_start_id
+    queue_index = 0
+    queue[queue_index] = this_query_start_id
 
-        while queue_index >= 0:
+    while queue_index >= 0:
 
-            node_id = queue[queue_index]
+        node_id = queue[queue_index]
+        queue_index -= 1
 
-            childA = tree_children[node_id, 0]
-            childB = tree_children[node_id, 1]
+        childA = tree_children[node_id, 0]
+        childB = tree_children[node_id, 1]
 
-            is_leafA = childA >= num_internal_nodes
-            is_leafB = childB >= num_internal_nodes
-
-            point_in_A = is_point_in_box(query_point, tree_bounds[childA])
-            point_in_B = is_point_in_box(query_point, tree_bounds[childB])
-
-            # Do explicit check if in a leaf
-            # print(f'node_id: {node_id}\t childA: {childA}\t childB: {childB}\t')
-            # if node_id == 6:
-            #     print('node_id, point_in_A, point_in_B, is_leaf,
-            # is_leafB', node_id, point_in_A, point_in_B, is_leafA, is_leafB)
-            #     print(query_point)
-            #     print(tree_bounds[childA])
-            #     print(tree_bounds[childB])
-            # raise RuntimeError("d")
-            if point_in_A and is_leafA:
-                data_id = childA - num_internal_nodes
-                dist = distance(query_point[0],
-                                query_point[1],
-                                query_point[2],
-                                points[data_id, 0],
-                                points[data_id, 1],
-                                points[data_id, 2])
-
-                # if node_id == 6:
-                #     print(f'dist: {dist}, min_dist: {min_dist}')
-                #     print(dist, min_dist, data_id)
-                #     print(points[data_id], query_point)
-                # raise RuntimeError("d")
-                if dist < min_dist:
-                    min_dist = dist
-                    min_index = data_id
+        # Do explicit check if children are leafs
+        for child in (childA, childB):
+            if child >= num_internal_nodes:
+                data_id = child - num_internal_nodes
+                dist2 = distance_squared(query_point, points[data_id])
 
-            if point_in_B and is_leafB:
-                data_id = childB - num_internal_nodes
-                dist = distance(query_point[0],
-                                query_point[1],
-                                query_point[2],
-                                points[data_id, 0],
-                                points[data_id, 1],
-                                points[data_id, 2])
-
-                if dist < min_dist:
-                    min_dist = dist
+                if dist2 < min_dist2:
+                    min_dist2 = dist2
                     min_index = data_id
 
-            # Whether to traverse
-            traverseA = point_in_A and not is_leafA
-            traverseB = point_in_B and not is_leafB
+        if childA < num_internal_nodes:
+            distA = distance_to_box_squared(query_point, tree_bounds[childA])
+        else:
+            distA = min_dist2
+        if childB < num_internal_nodes:
+            distB = distance_to_box_squared(query_point, tree_bounds[childB])
+        else:
+            distB = min_dist2
+
+        # Whether to traverse
+        traverseA = distA < min_dist2
+        traverseB = distB < min_dist2
+
+        # Put the nearest child on top of the queue
+        queue = grow_queue(queue, queue_index + 3)
+        if traverseA and traverseB and distA < distB:
+            queue[queue_index + 1] = childB
+            queue[queue_index + 2] = childA
+            queue_index += 2
+        elif traverseA and traverseB:
+            queue[queue_index + 1] = childA
+            queue[queue_index + 2] = childB
+            queue_index += 2
+        elif traverseA:
+            queue_index += 1
+            queue[queue_index] = childA
+        elif traverseB:
+            queue_index += 1
+            queue[queue_index] = childB
+
+    return math.sqrt(min_dist2), min_index
+
+
+@numba.jit(nopython=True, parallel=True)
+def find_nearest_neighbors(points, tree_parents, tree_children, tree_bounds,
+                           query_points, dists, ids, start_id=0, chunk_size=256):
+    """
+    Find the nearest neighbors of a batch of query points.
 
-            if (not traverseA) and (not traverseB):
-                queue_index -= 1
-            else:
-                if traverseA:
-                    queue[queue_index] = childA
-                else:
-                    queue[queue_index] = childB
-                if traverseA and traverseB:
-                    queue_index += 1
-                    queue[queue_index] = childB
-
-        # Outside main while loop
-        dists[ip] = min_dist
-        ids[ip] = min_index  # + num_internal_nodes + 1
+    The queries are split into chunks which are processed in parallel.
+    Within a chunk, the neighbor of the previous query is used as the
+    initial guess for the next one, so the query points should ideally
+    be sorted (e.g. by their Morton keys) such that consecutive
+    query points are close to each other.
+    """
+    n_queries = query_points.shape[0]
+    num_internal_nodes = numba.int64(tree_children.shape[0])
+
+    n_chunks = (n_queries + chunk_size - 1) // chunk_size
+
+    for ichunk in numba.prange(n_chunks):  # pylint: disable=not-an-iterable
+
+        # Thread local memory for the traversal
+        queue = np.empty(256, dtype=np.int64)
+
+        min_index = -1
+        for ip in range(ichunk * chunk_size, min((ichunk + 1) * chunk_size, n_queries)):
+            # Select a query_point from the list of queries
+            query_point = query_points[ip]
+
+            min_dist, min_index = nearest_neighbor_cpu(points, tree_parents, tree_children,
+                                                       tree_bounds, query_point,
+                                                       num_internal_nodes, queue,
+                                                       start_id, min_index)
+            dists[ip] = min_dist
+            ids[ip] = min_index
     return dists, ids
 
 
+@numba.jit(nopython=True)
+def knn_cpu(points, tree_children, tree_bounds, query_point, num_internal_nodes,
+            queue, heap_dist2, heap_ids):
+    """
+    Find the k nearest neighbors of a single query point, where k is
+    the length of the work arrays heap_dist2 and heap_ids.
+
+    The current candidates are kept in a bounded max-heap
+    (largest squared distance at heap_dist2[0]). The tree is traversed
+    nearest child first and pruned using the distance to the k'th
+    nearest candidate. On return,
+    the heap has been sorted by increasing distance. If the tree has
+    fewer than k points, the remaining entries have infinite distance
+    and id -1.
+    """
+    k = heap_dist2.shape[0]
+    heap_dist2[:] = np.inf
+    heap_ids[:] = -1
+
+    queue_index = 0
+    queue[queue_index] = 0
+
+    while queue_index >= 0:
+
+        node_id = queue[queue_index]
+        queue_index -= 1
+
+        childA = tree_children[node_id, 0]
+        childB = tree_children[node_id, 1]
+
+        for child in (childA, childB):
+            if child >= num_internal_nodes:
+                data_id = child - num_internal_nodes
+                dist2 = distance_squared(query_point, points[data_id])
+
+                if dist2 < heap_dist2[0]:
+                    # Replace the root of the heap and sift down
+                    ii = 0
+                    while True:
+                        left = 2 * ii + 1
+                        if left >= k:
+                            break
+                        largest = left
+                        if left + 1 < k and heap_dist2[left + 1] > heap_dist2[left]:
+                            largest = left + 1
+                        if heap_dist2[largest] <= dist2:
+                            break
+                        heap_dist2[ii] = heap_dist2[largest]
+                        heap_ids[ii] = heap_ids[largest]
+                        ii = largest
+                    heap_dist2[ii] = dist2
+                    heap_ids[ii] = data_id
+
+        if childA < num_internal_nodes:
+            distA = distance_to_box_squared(query_point, tree_bounds[childA])
+        else:
+            distA = np.inf
+        if childB < num_internal_nodes:
+            distB = distance_to_box_squared(query_point, tree_bounds[childB])
+        else:
+            distB = np.inf
+
+        # Whether to traverse
+        traverseA = distA < heap_dist2[0]
+        traverseB = distB < heap_dist2[0]
+
+        # Put the nearest child on top of the queue
+        queue = grow_queue(queue, queue_index + 3)
+        if traverseA and traverseB and distA < distB:
+            queue[queue_index + 1] = childB
+            queue[queue_index + 2] = childA
+            queue_index += 2
+        elif traverseA and traverseB:
+            queue[queue_index + 1] = childA
+            queue[queue_index + 2] = childB
+            queue_index += 2
+        elif traverseA:
+            queue_index += 1
+            queue[queue_index] = childA
+        elif traverseB:
+            queue_index += 1
+            queue[queue_index] = childB
+
+    # Sort by increasing distance
+    order = np.argsort(heap_dist2)
+    heap_dist2[:] = heap_dist2[order]
+    heap_ids[:] = heap_ids[order]
+
+
+@numba.jit(nopython=True, parallel=True)
+def find_k_nearest_neighbors(points, tree_children, tree_bounds, query_points,
+                             dists, ids, chunk_size=256):
+    """
+    Find the k nearest neighbors of a batch of query points, where
+    k is given by the shape of dists and ids, i.e. (n_queries, k).
+    """
+    n_queries = query_points.shape[0]
+    num_internal_nodes = numba.int64(tree_children.shape[0])
+    k = dists.shape[1]
+
+    n_chunks = (n_queries + chunk_size - 1) // chunk_size
+
+    for ichunk in numba.prange(n_chunks):  # pylint: disable=not-an-iterable
+
+        # Thread local memory for the traversal and the heap
+        queue = np.empty(256, dtype=np.int64)
+        heap_dist2 = np.empty(k, dtype=np.float64)
+        heap_ids = np.empty(k, dtype=np.int64)
+
+        for ip in range(ichunk * chunk_size, min((ichunk + 1) * chunk_size, n_queries)):
+            knn_cpu(points, tree_children, tree_bounds, query_points[ip],
+                    num_internal_nodes, queue, heap_dist2, heap_ids)
+            for jj in range(k):
+                dists[ip, jj] = math.sqrt(heap_dist2[jj])
+                ids[ip, jj] = heap_ids[jj]
+    return dists, ids
+
+
+@numba.jit(nopython=True)
+def ball_query_cpu(points, tree_children, tree_bounds, query_point, radius2,
+                   num_internal_nodes, queue, dists, ids, offset, store):
+    """
+    Find all points within a distance sqrt(radius2) of a single query point
+    and return the number of points found.
+
+    If store is True, the distances and ids of the points are stored
+    in dists and ids starting at index offset.
+    """
+    count = 0
+
+    queue_index = 0
+    queue[queue_index] = 0
+
+    while queue_index >= 0:
+
+        node_id = queue[queue_index]
+        queue_index -= 1
+
+        for ichild in range(2):
+            child = tree_children[node_id, ichild]
+
+            if child >= num_internal_nodes:
+                data_id = child - num_internal_nodes
+                dist2 = distance_squared(query_point, points[data_id])
+
+                if dist2 <= radius2:
+                    if store:
+                        dists[offset + count] = math.sqrt(dist2)
+                        ids[offset + count] = data_id
+                    count += 1
+
+            elif distance_to_box_squared(query_point, tree_bounds[child]) <= radius2:
+                queue_index += 1
+                queue = grow_queue(queue, queue_index + 1)
+                queue[queue_index] = child
+
+    return count
+
+
+@numba.jit(nopython=True, parallel=True)
+def find_points_in_balls(points, tree_children, tree_bounds, query_points, radii,
+                         counts, offsets, dists, ids, store, chunk_size=256):
+    """
+    Find all points within a distance radii[ip] of each query point.
+
+    This is done in two passes: first with store=False to fill
+    the counts, and then (after calculating the offsets from
+    the counts) with store=True to fill dists and ids.
+    """
+    n_queries = query_points.shape[0]
+    num_internal_nodes = numba.int64(tree_children.shape[0])
+
+    n_chunks = (n_queries + chunk_size - 1) // chunk_size
+
+    for ichunk in numba.prange(n_chunks):  # pylint: disable=not-an-iterable
+
+        # Thread local memory for the traversal
+        queue = np.empty(256, dtype=np.int64)
+
+        for ip in range(ichunk * chunk_size, min((ichunk + 1) * chunk_size, n_queries)):
+            counts[ip] = ball_query_cpu(points, tree_children, tree_bounds,
+                                        query_points[ip], radii[ip]**2,
+                                        num_internal_nodes, queue, dists, ids,
+                                        offsets[ip], store)
+
+
 class BinaryTree:
     def __init__(self, positions, sizes):
         """
@@ -463,6 +751,8 @@ class BinaryTree:
         self.num_internal_nodes = self.num_leafs - 1
         self.num_leafs_and_nodes = 2 * self.num_leafs - 1
 
+        numba.set_num_threads(settings.numthreads)
+
         # Allocate arrays
         self.children = -1 * np.ones((self.num_internal_nodes, 2), dtype=int)
         self.parents = -1 * np.ones(self.num_leafs_and_nodes, dtype=int)
@@ -481,6 +771,73 @@ class BinaryTree:
         # by propagating the information upwards in the tree
         propagate_bounds_upwards(self.bounds, self.parents, self.children)
 
+        # Tight bounding volumes of the points (i.e. not including their sizes),
+        # which are used for pruning the tree in the nearest neighbor search
+        self.point_bounds = np.zeros_like(self.bounds)
+        set_leaf_bounding_volumes(self.point_bounds, self._pos,
+                                  np.zeros(self.num_leafs),
+                                  self.conversion_factor)
+        propagate_bounds_upwards(self.point_bounds, self.parents, self.children)
+
+    # The arrays needed for a tree, see save and load
+    _saved_arrays = ['_pos', 'off_sets', 'conversion_factor', 'morton_keys',
+                     'sort_index', 'children', 'parents', 'bounds', 'point_bounds']
+
+    def save(self, path):
+        """
+        Save the tree to the directory path, e.g. in order to reuse a tree
+        for a full snapshot which was constructed once in a preprocessing
+        step. The arrays are stored as .npy files, such that they can be
+        memory-mapped when loading the tree again (see BinaryTree.load).
+
+        Parameters
+        ----------
+        path : str
+            The directory in which to save the tree. It is created
+            if it does not exist.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in self._saved_arrays:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Load a tree which was saved using BinaryTree.save.
+
+        Parameters
+        ----------
+        path : str
+            The directory in which the tree was saved.
+
+        mmap_mode : str, optional
+            Memory-map mode passed on to np.load. The default, 'r',
+            memory-maps the arrays read-only such that only the
+            parts of the tree which are used are read from disk.
+            Use None to read all the arrays into memory.
+
+        Returns
+        -------
+        tree : BinaryTree
+        """
+        for name in cls._saved_arrays:
+            if not os.path.exists(os.path.join(path, name + '.npy')):
+                raise RuntimeError(f'{path} does not contain a saved BinaryTree '
+                                   + f'({name}.npy is missing)')
+
+        tree = cls.__new__(cls)
+        for name in cls._saved_arrays:
+            setattr(tree, name, np.load(os.path.join(path, name + '.npy'),
+                                        mmap_mode=mmap_mode))
+
+        tree.conversion_factor = float(tree.conversion_factor)
+
+        tree.num_leafs = tree.morton_keys.shape[0]
+        tree.num_internal_nodes = tree.num_leafs - 1
+        tree.num_leafs_and_nodes = 2 * tree.num_leafs - 1
+
+        return tree
+
     def _to_tree_coordinates(self, pos):
         return (pos - self.off_sets[None, :]) * self.conversion_factor
 
@@ -491,16 +848,199 @@ class BinaryTree:
         """
         return np.arange(self.sort_index.shape[0])[self.sort_index][ids]
 
-    def nearest_neighbor(self, query_points, start_id=0):
-        if query_points.ndim == 1:
-            n_queries = 1
-        else:
-            n_queries = query_points.shape[0]
+    def nearest_neighbor(self, query_points, workers=None, start_id=0):
+        """
+        Find the nearest neighbors of a set of query points.
+
+        Parameters
+        ----------
+        query_points : numpy array
+            Positions of shape (n_queries, 3) or (3,).
+
+        workers : int, optional
+            Number of threads to use. Defaults to settings.numthreads.
+            If -1 is given all available threads are used.
+
+        start_id : int, optional
+            Start the tree traversal at the first parent of this node
+            whose bounding box contains the query point. This only searches
+            part of the tree, so the result is approximate. By default,
+            the traversal starts at the root of the tree.
+
+        Returns
+        -------
+        dists : numpy array
+            Distances to the nearest neighbors.
+
+        ids : numpy array
+            The indices of the nearest neighbors in the positions
+            used to construct the tree.
+        """
+        query_points, query_sort_index = self._get_sorted_query_points(query_points)
 
+        n_queries = query_points.shape[0]
         ids = np.zeros(n_queries, dtype=np.int64)
         dists = np.zeros(n_queries, dtype=np.float64)
-        find_nearest_neighbors(self._pos, self.parents, self.children, self.bounds,
-                               self._to_tree_coordinates(
-                                   query_points), dists, ids,
+
+        numba.set_num_threads(self._get_num_threads(workers))
+        find_nearest_neighbors(self._pos, self.parents, self.children, self.point_bounds,
+                               query_points, dists, ids,
                                start_id=start_id)
+
+        # Go back to the ordering of the query points
+        dists[query_sort_index] = dists.copy()
+        ids[query_sort_index] = ids.copy()
+
         return dists / self.conversion_factor, self._tree_node_ids_to_data_ids(ids)
+
+    def query_knn(self, query_points, k, workers=None):
+        """
+        Find the k nearest neighbors of a set of query points.
+
+        Parameters
+        ----------
+        query_points : numpy array
+            Positions of shape (n_queries, 3) or (3,).
+
+        k : int
+            The number of neighbors to find.
+
+        workers : int, optional
+            Number of threads to use. Defaults to settings.numthreads.
+            If -1 is given all available threads are used.
+
+        Returns
+        -------
+        dists : numpy array
+            Distances to the neighbors, shape (n_queries, k), sorted
+            by increasing distance.
+
+        ids : numpy array
+            The indices of the neighbors in the positions used to construct
+            the tree, shape (n_queries, k). If the tree has fewer than k
+            points, missing neighbors have infinite distance and
+            the index self.num_leafs (as in scipy's KDTree).
+        """
+        query_points, query_sort_index = self._get_sorted_query_points(query_points)
+
+        n_queries = query_points.shape[0]
+        ids = np.zeros((n_queries, k), dtype=np.int64)
+        dists = np.zeros((n_queries, k), dtype=np.float64)
+
+        numba.set_num_threads(self._get_num_threads(workers))
+        find_k_nearest_neighbors(self._pos, self.children, self.point_bounds,
+                                 query_points, dists, ids)
+
+        # Go back to the ordering of the query points
+        dists[query_sort_index] = dists.copy()
+        ids[query_sort_index] = ids.copy()
+
+        missing = ids == -1
+        ids = self._tree_node_ids_to_data_ids(np.where(missing, 0, ids))
+        ids[missing] = self.num_leafs
+
+        return dists / self.conversion_factor, ids
+
+    def query_ball(self, query_points, r, workers=None):
+        """
+        Find all points within a distance r of a set of query points.
+
+        The neighbor lists are returned in a compressed (CSR) format, i.e.,
+        the neighbors of query point i are::
+
+            ids[offsets[i]:offsets[i + 1]]
+
+        at distances::
+
+            dists[offsets[i]:offsets[i + 1]]
+
+        The order of the neighbors within each list is arbitrary.
+
+        Parameters
+        ----------
+        query_points : numpy array
+            Positions of shape (n_queries, 3) or (3,).
+
+        r : float or numpy array
+            The search radius, either a single value or
+            one value per query point.
+
+        workers : int, optional
+            Number of threads to use. Defaults to settings.numthreads.
+            If -1 is given all available threads are used.
+
+        Returns
+        -------
+        offsets : numpy array
+            Offsets into dists and ids, shape (n_queries + 1,).
+
+        dists : numpy array
+            Distances to the neighbors.
+
+        ids : numpy array
+            The indices of the neighbors in the positions used to construct
+            the tree.
+        """
+        query_points, query_sort_index = self._get_sorted_query_points(query_points)
+
+        n_queries = query_points.shape[0]
+        radii = np.broadcast_to(np.asarray(r, dtype=np.float64), (n_queries,))
+        radii = np.ascontiguousarray(radii[query_sort_index]) * self.conversion_factor
+
+        numba.set_num_threads(self._get_num_threads(workers))
+
+        # First pass: count the neighbors
+        counts = np.zeros(n_queries, dtype=np.int64)
+        sorted_offsets = np.zeros(n_queries, dtype=np.int64)
+        dists = np.zeros(0, dtype=np.float64)
+        ids = np.zeros(0, dtype=np.int64)
+        find_points_in_balls(self._pos, self.children, self.point_bounds,
+                             query_points, radii, counts, sorted_offsets,
+                             dists, ids, False)
+
+        # Offsets in the ordering of the query points
+        offsets = np.zeros(n_queries + 1, dtype=np.int64)
+        offsets[1:][query_sort_index] = counts
+        offsets = np.cumsum(offsets)
+        sorted_offsets[:] = offsets[:-1][query_sort_index]
+
+        # Second pass: store the neighbors
+        dists = np.zeros(offsets[-1], dtype=np.float64)
+        ids = np.zeros(offsets[-1], dtype=np.int64)
+        find_points_in_balls(self._pos, self.children, self.point_bounds,
+                             query_points, radii, counts, sorted_offsets,
+                             dists, ids, True)
+
+        return offsets, dists / self.conversion_factor, self._tree_node_ids_to_data_ids(ids)
+
+    def _get_sorted_query_points(self, query_points):
+        """
+        Convert query points to tree coordinates and sort them by their
+        Morton keys, such that consecutive queries are close to each other.
+        Returns the sorted query points and the sort index.
+        """
+        query_points = self._to_tree_coordinates(np.atleast_2d(query_points))
+
+        query_sort_index = np.argsort(self._get_morton_keys(query_points))
+        query_points = np.ascontiguousarray(query_points[query_sort_index])
+
+        return query_points, query_sort_index
+
+    def _get_morton_keys(self, tree_coordinates):
+        """
+        Morton keys of positions given in tree coordinates. Positions
+        outside the tree are clipped to the tree boundaries.
+        """
+        pos_uint = np.clip(tree_coordinates, 0, 2**L - 1).astype(np.uint64)
+        return get_morton_keys64(pos_uint)
+
+    @staticmethod
+    def _get_num_threads(workers):
+        """
+        The number of threads to use for a given 'workers' argument.
+        """
+        if workers is None:
+            return settings.numthreads
+        if workers == -1:
+            return settings.max_threads
+        return min(workers, settings.max_threads)
@@ -15,6 +15,7 @@ from .cython.get_index_of_region import get_cube_plus_thin_layer
 from .cython.get_index_of_region import get_radial_range_plus_thin_layer
 from .cython.get_index_of_region import get_rotated_cube
 from .cython.get_index_of_region import get_rotated_cube_plus_thin_layer
+from .cython.get_index_of_region import get_ids_in_regions
 from .cython.openmp_info import simple_reduction, get_openmp_settings
 
 # These will be set by the user using the add_user_unit function
@@ -360,6 +361,193 @@ def get_index_of_rotated_cubic_region_plus_thin_layer(pos, center, widths, thick
     return index
 
 
+def _get_ids_of_regions(pos, params, region_type):
+    """
+    Get the (sorted, int64) indices of the positions inside each of the
+    regions described by params (see cython.get_index_of_region) as a
+    list of arrays, using a single pass over the positions.
+    """
+    params = np.ascontiguousarray(params, dtype=np.float64)
+    if params.shape[0] == 0:
+        return []
+    offsets, ids = get_ids_in_regions(pos, params, region_type, settings.numthreads)
+    return [ids[offsets[k]:offsets[k + 1]] for k in range(params.shape[0])]
+
+
+def _get_box_params(centers, widths, orientation=None):
+    """
+    The parameters of one or more boxes for get_ids_in_regions.
+    """
+    centers = np.array(centers, dtype=np.float64).reshape(-1, 3)
+    widths = np.broadcast_to(np.array(widths, dtype=np.float64), centers.shape)
+    if orientation is None:
+        return np.hstack([centers, widths])
+
+    unit_vectors = orientation.cartesian_unit_vectors
+    unit_vectors = np.hstack([unit_vectors['x'], unit_vectors['y'], unit_vectors['z']])
+    unit_vectors = np.broadcast_to(unit_vectors, (centers.shape[0], 9))
+    return np.hstack([centers, widths, unit_vectors])
+
+
+@remove_astro_units
+def get_ids_of_cubic_region(pos, center, widths, box):
+    """
+    Get the indices of the positions, pos, which are inside a cubic region.
+
+    This gives the same result as np.flatnonzero(get_index_of_cubic_region(...))
+    but the indices are found directly (in parallel), without creating a
+    boolean array with the same length as the position array.
+
+    Parameters
+    ----------
+    pos : array
+         position array with dimensions = (n, 3)
+    center : array with length 3
+             The center of the box (x, y, z).
+    widths : array with length 3
+             The widths of the box.
+    box : float
+         The box size of the simulation (e.g. snap.box).
+
+    Returns
+    -------
+    int64 array with the sorted indices
+    """
+    return _get_ids_of_regions(pos, _get_box_params(center, widths), 0)[0]
+
+
+@remove_astro_units
+def get_ids_of_rotated_cubic_region(pos, center, widths, box, orientation):
+    """
+    Get the indices of the positions, pos, which are inside a rotated
+    cubic region, i.e., the same as
+    np.flatnonzero(get_index_of_rotated_cubic_region(...)).
+
+    Parameters
+    ----------
+    pos : array
+         position array with dimensions = (n, 3)
+    center : array with length 3
+             The center of the box (x, y, z).
+    widths : array with length 3
+             The widths of the box.
+    box : float
+         The box size of the simulation (e.g. snap.box).
+    orientation : Orientation
+                  The orientation of the box.
+
+    Returns
+    -------
+    int64 array with the sorted indices
+    """
+    return _get_ids_of_regions(pos, _get_box_params(center, widths, orientation), 1)[0]
+
+
+@remove_astro_units
+def get_ids_of_radial_range(pos, center, r_min, r_max):
+    """
+    Get the indices of the positions, pos, which are inside the spherical
+    shell with inner radius r_min and outer radius r_max, centered at center,
+    i.e., the same as np.flatnonzero(get_index_of_radial_range(...)).
+    """
+    return get_ids_of_radial_ranges(pos, center, r_min, r_max)[0]
+
+
+@remove_astro_units
+def get_ids_of_cubic_regions(pos, centers, widths, box, orientation=None):
+    """
+    Get the indices of the positions, pos, which are inside each of a number
+    of (possibly overlapping) cubic regions, in a single pass over the positions.
+
+    This is much faster than calling get_index_of_cubic_region for each
+    region when the number of regions is moderate (e.g. tens of halos).
+
+    Parameters
+    ----------
+    pos : array
+         position array with dimensions = (n, 3)
+    centers : array
+              The centers of the boxes with dimensions = (K, 3).
+    widths : array
+             The widths of the boxes, either with dimensions = (K, 3)
+             or length 3 (same widths for all boxes).
+    box : float
+         The box size of the simulation (e.g. snap.box).
+    orientation : Orientation, optional
+                  The orientation of the boxes (default: aligned with
+                  the coordinate axes).
+
+    Returns
+    -------
+    list of K int64 arrays with the sorted indices in each region
+    """
+    params = _get_box_params(centers, widths, orientation)
+    return _get_ids_of_regions(pos, params, 0 if orientation is None else 1)
+
+
+@remove_astro_units
+def get_ids_of_radial_ranges(pos, centers, r_min, r_max):
+    """
+    Get the indices of the positions, pos, which are inside each of a number
+    of spherical shells (or spheres, for r_min=0), in a single pass over
+    the positions.
+
+    Parameters
+    ----------
+    pos : array
+         position array with dimensions = (n, 3)
+    centers : array
+              The centers of the shells with dimensions = (K, 3).
+    r_min : float or array with length K
+            The inner radii.
+    r_max : float or array with length K
+            The outer radii.
+
+    Returns
+    -------
+    list of K int64 arrays with the sorted indices in each region
+    """
+    centers = np.array(centers, dtype=np.float64).reshape(-1, 3)
+    n_regions = centers.shape[0]
+    r_min = np.broadcast_to(np.array(r_min, dtype=np.float64), n_regions)
+    r_max = np.broadcast_to(np.array(r_max, dtype=np.float64), n_regions)
+    params = np.hstack([centers, (r_min**2)[:, None], (r_max**2)[:, None]])
+    return _get_ids_of_regions(pos, params, 2)
+
+
+def get_random_numbers_from_ids(ids, seed=0):
+    """
+    Get a pseudo-random number, uniformly distributed in [0, 1), for each
+    of the (integer) ids, e.g. the ParticleIDs of the cells.
+
+    The numbers are computed with the splitmix64 hash of each id, i.e., the
+    number of a given id does not depend on the other ids (and no array
+    with the length of the full snapshot is needed for a selection).
+
+    Parameters
+    ----------
+    ids : array
+          Integer array with the ids.
+    seed : int
+           Different seeds give independent numbers (default: 0).
+
+    Returns
+    -------
+    float64 array with the same shape as ids
+    """
+    golden = 0x9E3779B97F4A7C15
+    x = np.array(ids, dtype=np.uint64)
+    x += np.uint64((golden * (seed + 1)) % 2**64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+
+    # The 53 most significant bits give a double in [0, 1)
+    return (x >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
 def _check_if_omp_has_issues(verbose=True):
     """
     Check if the parallelization via OpenMP works.
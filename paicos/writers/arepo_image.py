@@ -95,6 +95,43 @@ class ArepoImage(PaicosWriter):
         """
         self.write_data(name, data)
 
+    def save_image_tiles(self, name, shape, tiles, tile_size):
+        """
+        This method saves a 2D image to the hdf5 file tile by tile, such
+        that the full image never has to be held in memory.
+
+        Parameters:
+
+            name (str): Name of the image.
+
+            shape (tuple): The shape of the full image.
+
+            tiles (iterable): Yields (index, tile) where index is a tuple
+                              of slices giving the location of the tile
+                              in the full image, see e.g. Projector.iter_tiles.
+
+            tile_size (int): The size of the chunks of the hdf5 data set.
+        """
+        if self.mode == 'w':
+            filename = self.tmp_filename
+        else:
+            filename = self.filename
+
+        with h5py.File(filename, 'r+') as file:
+            if self.mode == 'a' and name in file:
+                msg = ('ArepoImage is in amend mode but {} is already '
+                       + 'in the hdf5 file {}')
+                raise RuntimeError(msg.format(name, file.filename))
+
+            chunks = (min(tile_size, shape[0]), min(tile_size, shape[1]))
+            dataset = file.create_dataset(name, shape=shape, dtype=np.float64,
+                                          chunks=chunks)
+            for index, tile in tiles:
+                if hasattr(tile, 'unit'):
+                    dataset.attrs['unit'] = tile.unit.to_string()
+                    tile = tile.value
+                dataset[index] = tile
+
     def _perform_extra_consistency_checks(self):
         """
         Perform extra consistency checks on the HDF5 file to ensure the
@@ -0,0 +1,287 @@
+"""
+This defines a class for creating multiresolution image pyramids
+(e.g. for deep-zoom web viewers) and saving them as tiled hdf5 files.
+"""
+import os
+import hashlib
+import h5py
+import numpy as np
+from .arepo_image import ArepoImage
+from .. import settings
+from .. import units
+
+
+def downsample_image(image):
+    """
+    Downsample an image by a factor of two in each direction, by
+    averaging blocks of 2x2 pixels.
+
+    For images of per-area quantities (e.g. the projected surface densities
+    returned by the Projector) this conserves the total flux, i.e., the
+    integral of the image over the image area. If a dimension is odd, the
+    last row (or column) of the coarse image is the average of the
+    remaining pixels.
+    """
+    ny, nx = image.shape
+    padded = np.full((ny + ny % 2, nx + nx % 2), np.nan)
+    padded[:ny, :nx] = image
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    return np.nanmean(blocks, axis=(1, 3))
+
+
+class ImagePyramid:
+    """
+    A class for building an image pyramid, i.e., an image at a series of
+    resolutions, from a Projector (or NestedProjector).
+
+    The finest level is rendered tile by tile with the projector (see
+    Projector.iter_tiles) and the coarser levels are obtained by
+    downsampling (see downsample_image).
+    All levels are stored in a single hdf5 file (created with ArepoImage),
+    as chunked data sets with one chunk per tile, such that the memory
+    usage is set by the tile size and not by the size of the full image.
+
+    Each tile is stored with a hash of the parameters used to create it.
+    When build is called again (e.g. after an interrupted run or after
+    increasing the number of pixels), tiles that are unchanged are skipped.
+    """
+
+    def __init__(self, projector, basedir, basename="image_pyramid", tile_size=256):
+        """
+        Initialize an image pyramid.
+
+        Parameters
+        ----------
+
+            projector : Projector or NestedProjector
+                The projector defines the region (center, widths and
+                orientation) and the resolution (npix) of the finest level.
+
+            basedir : file path
+                The folder where the hdf5 file should be saved.
+
+            basename : string
+                The base name for the hdf5 file, which will be in
+                the format ``basename_{:03d}.hdf5``.
+                (default: "image_pyramid").
+
+            tile_size : int
+                The number of pixels in each direction of a tile.
+                The number of pixels of the projector in both directions
+                must be a multiple of the tile size (default: 256).
+                The NestedProjector requires a power of two.
+        """
+
+        self.projector = projector
+        self.tile_size = tile_size
+
+        self.npix_width = projector.npix_width
+        self.npix_height = projector.npix_height
+
+        if self.npix_width % tile_size != 0 or self.npix_height % tile_size != 0:
+            err_msg = ('The number of pixels of the projector, '
+                       + f'({self.npix_width}, {self.npix_height}), '
+                       + f'must be a multiple of the tile size ({tile_size})')
+            raise RuntimeError(err_msg)
+
+        # Image sizes of the levels (level 0 is the finest)
+        self.shapes = [(self.npix_height, self.npix_width)]
+        while max(self.shapes[-1]) > tile_size:
+            ny, nx = self.shapes[-1]
+            self.shapes.append(((ny + 1) // 2, (nx + 1) // 2))
+        self.num_levels = len(self.shapes)
+
+        # Create the hdf5 file (or check consistency with an existing one)
+        if basedir[-1] != '/':
+            basedir += '/'
+        filename = basedir + f'{basename}_{projector.snap.snapnum:03d}.hdf5'
+        if os.path.exists(filename):
+            image_file = ArepoImage(projector, basedir, basename=basename, mode='a')
+        else:
+            image_file = ArepoImage(projector, basedir, basename=basename, mode='w')
+            image_file.finalize()
+
+        self.filename = image_file.filename
+
+        # Number of tiles rendered (or downsampled) in the last call to build
+        self.tiles_rendered = 0
+
+    def num_tiles(self, level):
+        """
+        The number of tiles (vertical, horizontal) at a given level.
+        """
+        ny, nx = self.shapes[level]
+        return (ny + self.tile_size - 1) // self.tile_size, \
+            (nx + self.tile_size - 1) // self.tile_size
+
+    def build(self, variable, name=None):
+        """
+        Build the image pyramid for a variable.
+
+        Parameters
+        ----------
+
+            variable : str or array
+                The variable to project, passed on to the project_variable
+                method of the projector.
+
+            name : str
+                Name of the group in the hdf5 file in which the pyramid is
+                stored. Required if variable is not a string.
+        """
+        if name is None:
+            if not isinstance(variable, str):
+                raise RuntimeError('A name is required for non-string variables')
+            name = variable
+
+        if isinstance(variable, str):
+            variable_hash = variable
+        else:
+            variable_hash = hashlib.md5(np.ascontiguousarray(variable)).hexdigest()
+
+        self.tiles_rendered = 0
+
+        with h5py.File(self.filename, 'r+') as f:
+            group = f.require_group(name)
+            group.attrs['tile_size'] = self.tile_size
+            group.attrs['num_levels'] = self.num_levels
+
+            self._build_finest_level(group, variable, variable_hash)
+
+            for level in range(1, self.num_levels):
+                self._build_coarse_level(group, level)
+
+    def _get_level_datasets(self, group, level, unit=None):
+        """
+        Get (or create) the data set for the image and the tile hashes
+        at a given level.
+        """
+        shape = self.shapes[level]
+        chunks = (min(self.tile_size, shape[0]), min(self.tile_size, shape[1]))
+        data_name = f'level_{level}'
+        hash_name = f'level_{level}_tile_hashes'
+
+        if data_name in group and group[data_name].shape != shape:
+            # The resolution has changed, start over for this level
+            del group[data_name]
+            del group[hash_name]
+
+        if data_name not in group:
+            group.create_dataset(data_name, shape=shape, dtype=np.float64,
+                                 chunks=chunks, fillvalue=np.nan)
+            group.create_dataset(hash_name, shape=self.num_tiles(level), dtype='S32')
+
+        if unit is not None:
+            group[data_name].attrs['unit'] = unit
+
+        return group[data_name], group[hash_name]
+
+    def _build_finest_level(self, group, variable, variable_hash):
+        """
+        Render the tiles of the finest level with the projector, skipping
+        the tiles whose stored hash is unchanged.
+        """
+        projector = self.projector
+        tile_size = self.tile_size
+
+        data, hashes = self._get_level_datasets(group, 0)
+
+        # Find the tiles which need to be rendered
+        tile_hashes = {}
+        n_ty, n_tx = self.num_tiles(0)
+        for ty in range(n_ty):
+            for tx in range(n_tx):
+                tile_hash = self._get_hash(type(projector).__name__, variable_hash,
+                                           projector.center, projector.widths,
+                                           projector.npix, tile_size, ty, tx,
+                                           projector.orientation.normal_vector,
+                                           projector.orientation.perp_vector1,
+                                           self._snap_info())
+                if hashes[ty, tx] != tile_hash.encode():
+                    tile_hashes[ty, tx] = tile_hash
+
+        if len(tile_hashes) == 0:
+            return
+
+        for index, image in projector.iter_tiles(variable, tile_size,
+                                                 tiles=tile_hashes.keys()):
+            if isinstance(image, units.PaicosQuantity):
+                data.attrs['unit'] = image.unit.to_string()
+                image = image.value
+
+            data[index] = image
+            hashes[index[0].start // tile_size, index[1].start // tile_size] = \
+                tile_hashes[index[0].start // tile_size, index[1].start // tile_size]
+            self.tiles_rendered += 1
+
+    def _build_coarse_level(self, group, level):
+        """
+        Build the tiles at a level by downsampling the level below.
+        """
+        tile_size = self.tile_size
+        fine_data = group[f'level_{level - 1}']
+        fine_hashes = group[f'level_{level - 1}_tile_hashes']
+        unit = fine_data.attrs.get('unit', None)
+        data, hashes = self._get_level_datasets(group, level, unit)
+
+        n_ty, n_tx = self.num_tiles(level)
+        for ty in range(n_ty):
+            for tx in range(n_tx):
+                tile_hash = self._get_hash(fine_hashes[2 * ty:2 * ty + 2, 2 * tx:2 * tx + 2])
+                if hashes[ty, tx] == tile_hash.encode():
+                    continue
+
+                fine_image = fine_data[2 * ty * tile_size:2 * (ty + 1) * tile_size,
+                                       2 * tx * tile_size:2 * (tx + 1) * tile_size]
+                image = downsample_image(fine_image)
+                data[ty * tile_size:ty * tile_size + image.shape[0],
+                     tx * tile_size:tx * tile_size + image.shape[1]] = image
+                hashes[ty, tx] = tile_hash
+                self.tiles_rendered += 1
+
+    def _snap_info(self):
+        """
+        Information identifying the snapshot.
+        """
+        snap = self.projector.snap
+        return snap.filename, snap.Header['Time']
+
+    @staticmethod
+    def _get_hash(*args):
+        """
+        Hash of the parameters that determine a tile.
+        """
+        hash_input = ''
+        for arg in args:
+            if hasattr(arg, 'value'):
+                arg = arg.value
+            hash_input += repr(np.array(arg).tolist())
+        return hashlib.md5(hash_input.encode()).hexdigest()
+
+    def get_tile(self, name, level, ty, tx):
+        """
+        Read the tile (ty, tx) at a given level from the hdf5 file,
+        with units if they are enabled.
+        """
+        tile_size = self.tile_size
+        with h5py.File(self.filename, 'r') as f:
+            dataset = f[name][f'level_{level}']
+            tile = dataset[ty * tile_size:(ty + 1) * tile_size,
+                           tx * tile_size:(tx + 1) * tile_size]
+            if settings.use_units and 'unit' in dataset.attrs:
+                tile = tile * self.projector.snap.uq(dataset.attrs['unit'])
+        return tile
+
+    def get_level(self, name, level):
+        """
+        Read the full image at a given level from the hdf5 file.
+        Note that this reads the entire image into memory.
+        """
+        n_ty, n_tx = self.num_tiles(level)
+        rows = []
+        for ty in range(n_ty):
+            rows.append([self.get_tile(name, level, ty, tx) for tx in range(n_tx)])
+        if isinstance(rows[0][0], units.PaicosQuantity):
+            uq = rows[0][0].unit_quantity
+            return np.block([[tile.value for tile in row] for row in rows]) * uq
+        return np.block(rows)
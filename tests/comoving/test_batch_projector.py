@@ -0,0 +1,69 @@
+
+def test_batch_projector():
+    import paicos as pa
+    import numpy as np
+    import h5py
+
+    for use_units in [True, False]:
+        pa.use_units(use_units)
+
+        snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                           load_catalog=False)
+
+        # Stamps centered on some of the densest cells (instead of halos)
+        index = np.argsort(np.array(snap['0_Density']))[::-1][:2000:100]
+        centers = snap['0_Coordinates'][index]
+        rng = np.random.default_rng(seed=3)
+        widths = rng.uniform(500, 3000, size=index.shape[0])
+        if use_units:
+            widths = widths * centers.uq
+
+        orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[1, -1, 0])
+        for direction in ['x', 'z', orientation]:
+            batch_projector = pa.BatchProjector(snap, centers, widths, direction,
+                                                npix=64)
+            images = batch_projector.project_variable('0_Masses')
+            assert images.shape == (20, 64, 64)
+
+            for istamp in [0, 7, 19]:
+                projector = pa.Projector(snap, centers[istamp],
+                                         np.ones(3) * widths[istamp], direction,
+                                         npix=64, make_snap_with_selection=False)
+                image = projector.project_variable('0_Masses')
+                stamp = images[istamp]
+                if use_units:
+                    assert stamp.unit == image.unit
+                    stamp = stamp.value
+                    image = image.value
+                np.testing.assert_allclose(stamp, image, rtol=1e-10,
+                                           atol=1e-10 * np.max(image))
+
+        # Only the cells near small stamps are used
+        small_widths = widths[:2] / 20
+        batch_projector = pa.BatchProjector(snap, centers[:2], small_widths, 'z', npix=16)
+        assert batch_projector.pos.shape[0] < snap['0_Coordinates'].shape[0] // 2
+        projector = pa.Projector(snap, centers[1], np.ones(3) * small_widths[1], 'z',
+                                 npix=16, make_snap_with_selection=False)
+        image = projector.project_variable('0_Masses')
+        stamp = batch_projector.project_variable('0_Masses')[1]
+        if use_units:
+            stamp = stamp.value
+            image = image.value
+        np.testing.assert_allclose(stamp, image, rtol=1e-10, atol=1e-10 * np.max(image))
+
+        batch_projector = pa.BatchProjector(snap, centers, widths, orientation, npix=64)
+        filename = batch_projector.save(['0_Masses', '0_Volume'],
+                                        pa.data_dir + 'test_data/',
+                                        basename='test_stamps', ids=index)
+        with h5py.File(filename, 'r') as f:
+            np.testing.assert_array_equal(f['stamp_info/ids'][...], index)
+            assert f['0_Masses'].shape == (20, 64, 64)
+            assert f['0_Masses'].chunks == (1, 64, 64)
+            saved = f['0_Masses'][...]
+        if use_units:
+            images = images.value
+        np.testing.assert_array_equal(saved, images)
+
+
+if __name__ == '__main__':
+    test_batch_projector()
@@ -41,8 +41,127 @@ def test_binary_tree():
     kd_dist2, kd_ids2 = kd_tree.query(pos2)
 
     np.testing.assert_array_equal(kd_ids2, bvh_ids2)
+    np.testing.assert_allclose(kd_dist2, bvh_dist2, rtol=1e-10)
+
+    # Serial query and single query point
+    bvh_dist3, bvh_ids3 = bvh_tree.nearest_neighbor(pos2, workers=1)
+    np.testing.assert_array_equal(bvh_ids2, bvh_ids3)
+
+    bvh_dist4, bvh_ids4 = bvh_tree.nearest_neighbor(pos2[5])
+    assert bvh_ids4[0] == kd_ids2[5]
+
+    # Query points outside the tree
+    pos5 = center[None, :] + 2 * (np.random.rand(100, 3) - 0.5) * widths[None, :]
+    bvh_dist5, bvh_ids5 = bvh_tree.nearest_neighbor(pos5)
+    kd_dist5, kd_ids5 = kd_tree.query(pos5)
+    np.testing.assert_array_equal(kd_ids5, bvh_ids5)
     pa.use_units(True)
 
 
+def test_binary_tree_construction():
+    """
+    Check that each internal node has two children, that each
+    node (except the root) has a parent and that the bounding box
+    of each node contains the bounding boxes of its children.
+    """
+    import numpy as np
+    from paicos.trees.bvh_cpu import BinaryTree
+
+    rng = np.random.default_rng(seed=4)
+    pos = rng.random((20000, 3))
+    # Add some duplicate positions
+    pos[:100] = pos[100:200]
+    sizes = 0.01 * rng.random(20000)
+
+    tree = BinaryTree(pos, sizes)
+
+    assert np.all(tree.children >= 0)
+    assert tree.parents[0] == -1
+    assert np.all(tree.parents[1:] >= 0)
+
+    for ichild in range(2):
+        child = tree.children[:, ichild]
+        assert np.all(tree.parents[child] == np.arange(tree.num_internal_nodes))
+        assert np.all(tree.bounds[:, :, 0][child] >= tree.bounds[:-tree.num_leafs, :, 0])
+        assert np.all(tree.bounds[:, :, 1][child] <= tree.bounds[:-tree.num_leafs, :, 1])
+
+    # The root contains all the leafs
+    assert np.all(tree.bounds[0, :, 0] == np.min(tree.bounds[:, :, 0], axis=0))
+    assert np.all(tree.bounds[0, :, 1] == np.max(tree.bounds[:, :, 1], axis=0))
+
+    # The traversal stack is grown when it is too small
+    from paicos.trees.bvh_cpu import nearest_neighbor_cpu
+    dists, ids = tree.nearest_neighbor(pos[:50])
+    query_points = tree._to_tree_coordinates(pos[:50])
+    for ii in range(50):
+        dist, index = nearest_neighbor_cpu(tree._pos, tree.parents, tree.children,
+                                           tree.bounds, query_points[ii],
+                                           tree.num_internal_nodes,
+                                           np.empty(1, dtype=np.int64))
+        assert tree._tree_node_ids_to_data_ids(index) == ids[ii]
+
+
+def test_binary_tree_knn_and_ball_queries():
+    """
+    Compare k nearest neighbor and radius queries with scipy.
+    """
+    import numpy as np
+    from scipy.spatial import KDTree
+    from paicos.trees.bvh_cpu import BinaryTree
+
+    rng = np.random.default_rng(seed=5)
+    pos = rng.random((5000, 3))
+    sizes = 0.01 * np.ones(5000)
+
+    tree = BinaryTree(pos, sizes)
+    kd_tree = KDTree(pos)
+
+    query_points = rng.random((1000, 3))
+
+    # k nearest neighbors
+    dists, ids = tree.query_knn(query_points, 8)
+    kd_dists, kd_ids = kd_tree.query(query_points, 8)
+    np.testing.assert_array_equal(ids, kd_ids)
+    np.testing.assert_allclose(dists, kd_dists, rtol=1e-10)
+
+    # Fewer points in the tree than neighbors asked for
+    small_tree = BinaryTree(pos[:5], sizes[:5])
+    dists, ids = small_tree.query_knn(query_points[:10], 8)
+    kd_dists, kd_ids = KDTree(pos[:5]).query(query_points[:10], 8)
+    np.testing.assert_array_equal(ids, kd_ids)
+    assert np.all(np.isinf(dists[:, 5:]))
+
+    # Radius queries with a single radius and one radius per query point
+    for r in [0.05, 0.1 * rng.random(1000)]:
+        offsets, dists, ids = tree.query_ball(query_points, r)
+        kd_ids = kd_tree.query_ball_point(query_points, r)
+        assert offsets.shape[0] == query_points.shape[0] + 1
+        for ii in range(query_points.shape[0]):
+            neighbors = ids[offsets[ii]:offsets[ii + 1]]
+            np.testing.assert_array_equal(np.sort(neighbors), np.sort(kd_ids[ii]))
+            np.testing.assert_allclose(
+                dists[offsets[ii]:offsets[ii + 1]],
+                np.linalg.norm(pos[neighbors] - query_points[ii], axis=1), rtol=1e-10)
+
+    # The traversal stack is grown when it is too small
+    from paicos.trees.bvh_cpu import knn_cpu, ball_query_cpu
+    _, knn_ids = tree.query_knn(query_points[:20], 8)
+    offsets, _, _ = tree.query_ball(query_points[:20], 0.05)
+    tree_points = tree._to_tree_coordinates(query_points[:20])
+    radius2 = (0.05 * tree.conversion_factor)**2
+    heap_dist2 = np.empty(8)
+    heap_ids = np.empty(8, dtype=np.int64)
+    for ii in range(20):
+        knn_cpu(tree._pos, tree.children, tree.bounds, tree_points[ii],
+                tree.num_internal_nodes, np.empty(1, dtype=np.int64), heap_dist2, heap_ids)
+        np.testing.assert_array_equal(tree._tree_node_ids_to_data_ids(heap_ids), knn_ids[ii])
+        count = ball_query_cpu(tree._pos, tree.children, tree.bounds, tree_points[ii],
+                               radius2, tree.num_internal_nodes, np.empty(1, dtype=np.int64),
+                               np.empty(0), np.empty(0, dtype=np.int64), 0, False)
+        assert count == offsets[ii + 1] - offsets[ii]
+
+
 if __name__ == '__main__':
     test_binary_tree()
+    test_binary_tree_construction()
+    test_binary_tree_knn_and_ball_queries()
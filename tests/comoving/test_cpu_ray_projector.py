@@ -0,0 +1,71 @@
+import pytest
+
+
+def test_cpu_ray_projector(show=False):
+    """
+    We compare the CPU ray projector with the TreeProjector.
+    """
+    import paicos as pa
+    import numpy as np
+
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = np.array([398968.4, 211682.6, 629969.9]) * snap.length
+    widths = np.array([2000, 2000, 2000]) * snap.length
+
+    orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[0, 0, 1])
+
+    for direction in ['x', 'z', orientation]:
+        cpu_projector = pa.CpuRayProjector(snap, center, widths, direction,
+                                           npix=64, tol=0.25)
+        tree_projector = pa.TreeProjector(snap, center, widths, direction,
+                                          npix=64, tol=0.25)
+
+        cpu_dens = cpu_projector.project_variable('0_Density')
+        tree_dens = tree_projector.project_variable('0_Density', additive=False)
+
+        assert cpu_dens.unit == tree_dens.unit
+
+        # Seven percent tolerance as in the GPU test (different algorithms)
+        rel_diff = np.abs(cpu_dens - tree_dens) / tree_dens
+        assert np.max(rel_diff.value) < 0.07, np.max(rel_diff.value)
+
+        # Moving the center updates the image (the tree is kept)
+        cpu_projector.center = center + widths / 10
+        tree_projector.center = center + widths / 10
+        cpu_dens = cpu_projector.project_variable('0_Density')
+        tree_dens = tree_projector.project_variable('0_Density', additive=False)
+        rel_diff = np.abs(cpu_dens - tree_dens) / tree_dens
+        assert np.max(rel_diff.value) < 0.07, np.max(rel_diff.value)
+
+        if show:
+            import matplotlib.pyplot as plt
+            fig, axes = plt.subplots(ncols=2)
+            axes[0].imshow(np.log10(cpu_dens.value))
+            axes[1].imshow(np.log10(tree_dens.value))
+            plt.show()
+
+    with pytest.raises(RuntimeError):
+        cpu_projector.project_variable('0_Density', additive=True)
+
+    # Save the tree and reuse it (memory-mapped) in a new projector
+    tree_path = pa.data_dir + 'test_data/reduced_snap_247_tree_0'
+    cpu_projector.tree.save(tree_path)
+
+    projector_with_saved_tree = pa.CpuRayProjector(snap, center + widths / 10, widths, orientation,
+                                                   npix=64, tol=0.25, tree=tree_path)
+    cpu_dens_saved_tree = projector_with_saved_tree.project_variable('0_Density')
+    np.testing.assert_array_equal(cpu_dens.value, cpu_dens_saved_tree.value)
+
+    # The tree has to match the snapshot
+    snap_selection = snap.select(snap['0_Density'] > np.median(snap['0_Density']),
+                                 parttype=0)
+    with pytest.raises(RuntimeError):
+        pa.CpuRayProjector(snap_selection, center, widths, orientation,
+                           npix=64, tree=tree_path)
+
+
+if __name__ == '__main__':
+    test_cpu_ray_projector(True)
@@ -0,0 +1,84 @@
+import pytest
+
+
+def test_cpu_volume_renderer(show=False):
+    """
+    We check the compositing of the CPU volume renderer in limits
+    where the result is known.
+    """
+    import paicos as pa
+    import numpy as np
+
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = np.array([398968.4, 211682.6, 629969.9]) * snap.length
+    widths = np.array([2000, 2000, 2000]) * snap.length
+
+    rho = snap['0_Density']
+    vmin = np.min(rho)
+    vmax = np.max(rho)
+
+    orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[0, 0, 1])
+
+    for direction in ['x', orientation]:
+        renderer = pa.CpuVolumeRenderer(snap, center, widths, direction,
+                                        npix=64, tol=0.25, min_transmittance=0)
+
+        # A constant opacity of 1 absorbs 1 - 1/e over the depth
+        tf = pa.TransferFunction(vmin, vmax, opacity=1.0)
+        image = renderer.render('0_Density', tf)
+        assert image.shape == (64, 64, 4)
+        np.testing.assert_allclose(image[:, :, 3], 1 - np.exp(-1), rtol=1e-12)
+
+        # The result does not depend on the tiling
+        renderer.tile_size = 5
+        np.testing.assert_array_equal(renderer.render('0_Density', tf), image)
+        renderer.tile_size = 16
+
+        # Transparent medium
+        tf = pa.TransferFunction(vmin, vmax, opacity=0.0)
+        image = renderer.render('0_Density', tf, background=[1, 1, 1])
+        assert image.shape == (64, 64, 3)
+        np.testing.assert_array_equal(image, 1.0)
+
+        # In the optically thin limit the opacity is the line-of-sight
+        # integral of the extinction coefficient, i.e., for an extinction
+        # coefficient proportional to the density, it is proportional
+        # to the mean density found by the CpuRayProjector
+        eps = 1e-6
+        tf = pa.TransferFunction(0 * vmax, vmax, opacity=lambda u: eps * u,
+                                 log=False, n_table=2**20)
+        image = renderer.render('0_Density', tf)
+        cpu_projector = pa.CpuRayProjector(snap, center, widths, direction,
+                                           npix=64, tol=0.25)
+        cpu_dens = cpu_projector.project_variable('0_Density')
+        np.testing.assert_allclose(image[:, :, 3], eps * (cpu_dens / vmax).value,
+                                   rtol=1e-3)
+
+        # Early ray termination changes an opaque image by less than
+        # the transmittance at which the rays are terminated
+        tf = pa.TransferFunction(vmin, vmax, opacity=lambda u: 100 * u)
+        image = renderer.render('0_Density', tf)
+        renderer.min_transmittance = 1e-3
+        image_terminated = renderer.render('0_Density', tf)
+        renderer.min_transmittance = 0
+        assert np.max(np.abs(image_terminated - image)) < 1e-3
+
+        if show:
+            import matplotlib.pyplot as plt
+            plt.imshow(image_terminated, origin='lower',
+                       extent=renderer.centered_extent.value)
+            plt.show()
+
+    with pytest.raises(RuntimeError):
+        pa.TransferFunction(0 * vmin, vmax)
+
+    # Limits with units require a variable with units
+    with pytest.raises(RuntimeError):
+        renderer.render(rho.value, pa.TransferFunction(vmin, vmax))
+
+
+if __name__ == '__main__':
+    test_cpu_volume_renderer(True)
@@ -0,0 +1,63 @@
+
+def test_histogram2D_idigit():
+    """
+    We check the stored bin indices of the Histogram2D against numpy
+    and that they can be reused for other weights.
+    """
+    import numpy as np
+    import paicos as pa
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = [398968.4, 211682.6, 629969.9] * snap.length
+
+    r = np.sqrt(np.sum((snap['0_Coordinates'] - center[None, :])**2., axis=1))
+    rho = snap['0_Density']
+    M = snap['0_Masses']
+    V = snap['0_Volume']
+
+    for logscale in [True, False]:
+        r_rho = pa.Histogram2D(snap, r, rho, weights=M, bins_x=50, bins_y=40,
+                               normalize=False, logscale=logscale)
+        assert r_rho.idigit.dtype == np.int32
+
+        # Brute force bin indices (data on the outer edges are excluded)
+        x = r.value
+        y = rho.value
+        lower_x, upper_x = r_rho.lower_x.value, r_rho.upper_x.value
+        lower_y, upper_y = r_rho.lower_y.value, r_rho.upper_y.value
+        inside = (x > lower_x) * (x < upper_x) * (y > lower_y) * (y < upper_y)
+        if logscale:
+            x, y = np.log10(x), np.log10(y)
+            lower_x, upper_x = np.log10(lower_x), np.log10(upper_x)
+            lower_y, upper_y = np.log10(lower_y), np.log10(upper_y)
+        ix = ((x - lower_x) * (50 / (upper_x - lower_x))).astype(int)
+        iy = ((y - lower_y) * (40 / (upper_y - lower_y))).astype(int)
+        inside *= (ix >= 0) * (ix < 50) * (iy >= 0) * (iy < 40)
+        idigit = np.where(inside, ix * 40 + iy + 1, 0)
+        np.testing.assert_array_equal(r_rho.idigit, idigit)
+
+        ref = np.bincount(idigit, weights=M.value, minlength=50 * 40 + 1)[1:]
+        np.testing.assert_allclose(r_rho.hist2d.value, ref.reshape((50, 40)).T,
+                                   rtol=1e-12)
+
+        # Reuse the bin indices for another weight
+        hist_V = r_rho.hist('0_Volume')
+        ref = pa.Histogram2D(snap, r, rho, weights=V, bins_x=50, bins_y=40,
+                             normalize=False, logscale=logscale)
+        assert hist_V.unit == ref.hist2d.unit
+        np.testing.assert_allclose(hist_V.value, ref.hist2d.value, rtol=1e-12)
+
+        # The cython kernel without stored bin indices gives the same result
+        from paicos.cython.histogram import get_hist2d_from_weights_omp
+        hist2d = get_hist2d_from_weights_omp(
+            r.value, rho.value, M.value,
+            r_rho.lower_x.value, r_rho.upper_x.value, 50,
+            r_rho.lower_y.value, r_rho.upper_y.value, 40,
+            logscale, numthreads=pa.settings.numthreads_reduction)
+        np.testing.assert_allclose(r_rho.hist2d.value, hist2d.T, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    test_histogram2D_idigit()
@@ -0,0 +1,64 @@
+
+def test_histogramND():
+    """
+    We compare the N-dimensional histograms with numpy and Histogram2D,
+    and check that they can be saved and loaded.
+    """
+    import numpy as np
+    import paicos as pa
+    from astropy import units as u
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = [398968.4, 211682.6, 629969.9] * snap.length
+
+    r = np.sqrt(np.sum((snap['0_Coordinates'] - center[None, :])**2., axis=1))
+    rho = snap['0_Density']
+    M = snap['0_Masses']
+    V = snap['0_Volume']
+
+    # 3D histogram with a linear axis and two log axes
+    bins = [[0 * r.unit_quantity, 0.5 * r.max(), 20], 30, [V.min(), V.max(), 10]]
+    r_rho_V = pa.HistogramND(snap, [r, rho, '0_Volume'], weights=M, bins=bins,
+                             normalize=False, logscale=[False, True, True])
+    assert r_rho_V.histnd.shape == (20, 30, 10)
+    assert r_rho_V.histnd.unit == M.unit
+
+    # Same as numpy (which includes data on the edges)
+    ref, _ = np.histogramdd([r.value, rho.value, V.value], weights=M.value,
+                            bins=[edges.value for edges in r_rho_V.edges])
+    np.testing.assert_allclose(r_rho_V.histnd.value[:, 1:-1, 1:-1],
+                               ref[:, 1:-1, 1:-1], rtol=1e-12)
+
+    # The tiled accumulation (with bounded memory) gives the same result
+    r_rho_V.max_thread_memory = 0
+    hists = r_rho_V.hist_many({'M': M, 'V': V})
+    np.testing.assert_allclose(hists['M'].value, r_rho_V.histnd.value, rtol=1e-12)
+    assert hists['V'].unit == V.unit
+
+    # Normalized 2D histograms agree with Histogram2D
+    r_rho = pa.HistogramND(snap, [r, rho], weights=M, bins=[40, 30])
+    ref = pa.Histogram2D(snap, r, rho, weights=M, bins_x=40, bins_y=30,
+                         normalize=False)
+    np.testing.assert_array_equal(r_rho.idigit, ref.idigit)
+    assert r_rho.histnd.unit == u.Unit('dex')**(-2)
+    np.testing.assert_allclose(np.sum(r_rho.volume_per_bin * r_rho.histnd).value, 1.0)
+    np.testing.assert_allclose(r_rho.histnd.value / np.sum(r_rho.histnd.value),
+                               ref.hist2d.value.T / np.sum(ref.hist2d.value), rtol=1e-12)
+
+    # Save and load
+    r_rho_V.save(basedir=pa.data_dir + 'test_data', basename='r_rho_V_hist')
+    loaded = pa.HistogramNDReader(pa.data_dir + 'test_data', 247,
+                                  basename='r_rho_V_hist')
+    assert loaded.ndim == 3
+    assert loaded.logscale == [False, True, True]
+    assert loaded.histnd.unit == r_rho_V.histnd.unit
+    np.testing.assert_array_equal(loaded.histnd.value, r_rho_V.histnd.value)
+    for idim in range(3):
+        np.testing.assert_array_equal(loaded.centers[idim].value,
+                                      r_rho_V.centers[idim].value)
+
+
+if __name__ == '__main__':
+    test_histogramND()
@@ -0,0 +1,58 @@
+
+def test_histogram_1D():
+    """
+    We compare the 1D histogram with numpy.
+    """
+    import numpy as np
+    import paicos as pa
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = [398968.4, 211682.6, 629969.9] * snap.length
+
+    r = np.sqrt(np.sum((snap['0_Coordinates'] - center[None, :])**2., axis=1))
+    M = snap['0_Masses']
+
+    for logscale in [False, True]:
+        bins = [r.min(), 0.5 * r.max(), 64]
+        if not logscale:
+            bins[0] = 0 * r.unit_quantity
+
+        hists = []
+        numthreads = pa.settings.numthreads
+        numthreads_reduction = pa.settings.numthreads_reduction
+        try:
+            for n in [1, 4]:
+                pa.numthreads(n)
+                h_r = pa.Histogram(r, bins, logscale=logscale)
+                np.testing.assert_array_equal(h_r.idigit, np.digitize(r.value, h_r.edges.value))
+                assert h_r.idigit.dtype == np.int32
+
+                hist = h_r.hist(M)
+                assert hist.unit == M.unit
+                hists.append(hist.value)
+        finally:
+            pa.settings.numthreads = numthreads
+            pa.settings.numthreads_reduction = numthreads_reduction
+
+        # Same result as numpy (the last bin of numpy includes the upper edge)
+        ref, _ = np.histogram(r.value, bins=h_r.edges.value, weights=M.value)
+        np.testing.assert_allclose(hists[0][:-1], ref[:-1], rtol=1e-12)
+        np.testing.assert_allclose(hists[0], hists[1], rtol=1e-12)
+        assert pa.settings.numthreads == numthreads
+
+        # The cython kernel also accepts the int64 output of np.digitize
+        from paicos.cython.histogram import get_hist_from_weights_and_idigit
+        hist = get_hist_from_weights_and_idigit(h_r.edges.shape[0], M.value,
+                                                np.digitize(r.value, h_r.edges.value))
+        np.testing.assert_allclose(hist, hists[0], rtol=1e-12)
+
+        # Bins in a different (but compatible) unit
+        h_kpc = pa.Histogram(r, [bins[0].to('kpc'), bins[1].to('kpc'), 64],
+                             logscale=logscale)
+        assert np.sum(h_kpc.idigit != h_r.idigit) <= 2
+
+
+if __name__ == '__main__':
+    test_histogram_1D()
@@ -0,0 +1,83 @@
+
+def test_histogram_accumulators():
+    """
+    We check that histograms accumulated in chunks (and merged, saved
+    and loaded) agree with the histograms computed in a single call.
+    """
+    import numpy as np
+    import paicos as pa
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = [398968.4, 211682.6, 629969.9] * snap.length
+
+    r = np.sqrt(np.sum((snap['0_Coordinates'] - center[None, :])**2., axis=1))
+    rho = snap['0_Density']
+    M = snap['0_Masses']
+    V = snap['0_Volume']
+
+    chunks = np.array_split(np.arange(r.shape[0]), 5)
+
+    # 1D histograms
+    bins = [r.min(), 0.5 * r.max(), 64]
+    h_r = pa.Histogram(r, bins, logscale=True)
+
+    acc = pa.HistogramAccumulator(bins, logscale=True)
+    acc_count = pa.HistogramAccumulator(bins, logscale=True)
+    for ii, chunk in enumerate(chunks):
+        # Data in other (compatible) units are converted
+        V_chunk = V[chunk] if ii == 0 else V[chunk].to('kpc3')
+        acc.update(r[chunk], {'M': M[chunk], 'V': V_chunk})
+        acc_count.update(r[chunk])
+
+    hists = acc.finalize()
+    for key, weights in zip(['M', 'V'], [M, V]):
+        hist = h_r.hist(weights)
+        assert hists[key].unit == hist.unit
+        np.testing.assert_allclose(hists[key].value, hist.value, rtol=1e-12)
+    np.testing.assert_array_equal(acc_count.finalize(), np.bincount(h_r.idigit, minlength=66)[1:65])
+
+    # Mismatching weights are not accepted
+    try:
+        acc.update(r, M)
+        raise AssertionError('Expected a RuntimeError')
+    except RuntimeError:
+        pass
+
+    # 2D histograms
+    bins_x = [r.min(), r.max(), 40]
+    bins_y = [rho.min(), rho.max(), 30]
+    r_rho = pa.Histogram2D(snap, r, rho, weights=M, bins_x=bins_x,
+                           bins_y=bins_y, normalize=False, logscale=True)
+
+    acc_1 = pa.Histogram2DAccumulator(bins_x, bins_y)
+    acc_2 = pa.Histogram2DAccumulator(bins_x, bins_y)
+    for ii, chunk in enumerate(chunks):
+        acc = acc_1 if ii < 2 else acc_2
+        acc.update(r[chunk], rho[chunk], M[chunk])
+
+    acc_1.merge(acc_2)
+    np.testing.assert_allclose(acc_1.finalize().value, r_rho.hist2d.value, rtol=1e-12)
+    assert acc_1.finalize().unit == M.unit
+    np.testing.assert_array_equal(acc_1.edges_x.value, r_rho.edges_x.value)
+
+    # Save and load the partial results
+    writer = pa.PaicosWriter(snap, pa.data_dir + 'test_data', basename='accumulators')
+    acc_2.save(writer, group='r_rho')
+    writer.finalize()
+
+    acc_3 = pa.Histogram2DAccumulator.load(writer.filename, group='r_rho')
+    np.testing.assert_array_equal(acc_3.count, acc_2.count)
+    assert acc_3.finalize().unit == acc_2.finalize().unit
+    np.testing.assert_array_equal(acc_3.finalize().value, acc_2.finalize().value)
+
+    acc_4 = pa.Histogram2DAccumulator(bins_x, bins_y)
+    acc_4.update(r[chunks[0]], rho[chunks[0]], M[chunks[0]])
+    acc_4.update(r[chunks[1]], rho[chunks[1]], M[chunks[1]])
+    acc_4.merge(acc_3)
+    np.testing.assert_allclose(acc_4.finalize().value, r_rho.hist2d.value, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    test_histogram_accumulators()
@@ -0,0 +1,58 @@
+
+def test_histogram_hist_many():
+    """
+    We check that the histograms computed for several weights at once
+    agree with the histograms computed one at a time.
+    """
+    import numpy as np
+    import paicos as pa
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = [398968.4, 211682.6, 629969.9] * snap.length
+
+    r = np.sqrt(np.sum((snap['0_Coordinates'] - center[None, :])**2., axis=1))
+    rho = snap['0_Density']
+    M = snap['0_Masses']
+    V = snap['0_Volume']
+
+    # 1D histograms
+    h_r = pa.Histogram(r, [r.min(), r.max(), 50], logscale=True)
+    hists = h_r.hist_many({'M': M, 'V': V, 'MV': M * V})
+    for key, weights in zip(['M', 'V', 'MV'], [M, V, M * V]):
+        hist = h_r.hist(weights)
+        assert hists[key].unit == hist.unit
+        np.testing.assert_allclose(hists[key].value, hist.value, rtol=1e-12)
+
+    hist_list = h_r.hist_many([M.value, V])
+    np.testing.assert_allclose(hist_list[0], hists['M'].value, rtol=1e-12)
+    assert not hasattr(hist_list[0], 'unit')
+    assert hist_list[1].unit == V.unit
+
+    # 2D histograms (with bins containing all the data)
+    bins_x = [0.5 * r.min(), 2 * r.max(), 40]
+    bins_y = [0.5 * rho.min(), 2 * rho.max(), 30]
+    for normalize in [False, True]:
+        r_rho = pa.Histogram2D(snap, r, rho, weights='0_Masses', bins_x=bins_x,
+                               bins_y=bins_y, normalize=normalize, logscale=True)
+        hists = r_rho.hist_many({'M': '0_Masses', 'V': V, 'count': None})
+
+        assert hists['M'].unit == r_rho.hist2d.unit
+        np.testing.assert_allclose(hists['M'].value, r_rho.hist2d.value, rtol=1e-12)
+
+        for key, weights in zip(['V', 'count'], [V, None]):
+            ref = pa.Histogram2D(snap, r, rho, weights=weights, bins_x=bins_x,
+                                 bins_y=bins_y, normalize=normalize, logscale=True)
+            assert hists[key].unit == ref.hist2d.unit
+            np.testing.assert_allclose(hists[key].value, ref.hist2d.value, rtol=1e-12)
+
+    ref, _, _ = np.histogram2d(r.value, rho.value, weights=V.value,
+                               bins=[r_rho.edges_x.value, r_rho.edges_y.value])
+    r_rho = pa.Histogram2D(snap, r, rho, weights=V, bins_x=bins_x,
+                           bins_y=bins_y, normalize=False, logscale=True)
+    np.testing.assert_allclose(r_rho.hist_many([V])[0].value, ref.T, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    test_histogram_hist_many()
@@ -0,0 +1,67 @@
+
+def test_ids_of_region():
+    import paicos as pa
+    import numpy as np
+    from paicos import util
+
+    pa.use_units(True)
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    pos = snap['0_Coordinates']
+    center = np.array([398968.4, 211682.6, 629969.9]) * pos.uq
+    widths = np.array([4000, 3000, 5000]) * pos.uq
+    orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[1, -1, 0])
+
+    # Single regions, compared with the boolean selection functions
+    index = util.get_index_of_cubic_region(pos, center, widths, snap.box)
+    ids = util.get_ids_of_cubic_region(pos, center, widths, snap.box)
+    assert ids.dtype == np.int64
+    np.testing.assert_array_equal(np.flatnonzero(index), ids)
+
+    index = util.get_index_of_rotated_cubic_region(pos, center, widths, snap.box,
+                                                   orientation)
+    ids = util.get_ids_of_rotated_cubic_region(pos, center, widths, snap.box,
+                                               orientation)
+    np.testing.assert_array_equal(np.flatnonzero(index), ids)
+
+    r_min, r_max = widths[0] / 4, widths[0]
+    index = util.get_index_of_radial_range(pos, center, r_min, r_max)
+    ids = util.get_ids_of_radial_range(pos, center, r_min, r_max)
+    np.testing.assert_array_equal(np.flatnonzero(index), ids)
+
+    # Several (overlapping) regions in a single pass
+    rng = np.random.default_rng(42)
+    centers = center + rng.uniform(-1, 1, size=(7, 3)) * widths
+    all_widths = rng.uniform(0.5, 1.5, size=(7, 3)) * widths
+    radii = rng.uniform(0.5, 1.5, size=7) * r_max
+
+    for direction in [None, orientation]:
+        ids_list = util.get_ids_of_cubic_regions(pos, centers, all_widths, snap.box,
+                                                 orientation=direction)
+        assert len(ids_list) == 7
+        for k in range(7):
+            if direction is None:
+                index = util.get_index_of_cubic_region(pos, centers[k], all_widths[k],
+                                                       snap.box)
+            else:
+                index = util.get_index_of_rotated_cubic_region(pos, centers[k],
+                                                               all_widths[k], snap.box,
+                                                               orientation)
+            np.testing.assert_array_equal(np.flatnonzero(index), ids_list[k])
+
+    ids_list = util.get_ids_of_radial_ranges(pos, centers, 0. * radii, radii)
+    for k in range(7):
+        index = util.get_index_of_radial_range(pos, centers[k], 0. * r_max, radii[k])
+        np.testing.assert_array_equal(np.flatnonzero(index), ids_list[k])
+
+    # The result does not depend on the number of threads
+    numthreads = pa.settings.numthreads
+    pa.settings.numthreads = 3
+    ids_list_3 = util.get_ids_of_radial_ranges(pos, centers, 0. * radii, radii)
+    pa.settings.numthreads = numthreads
+    for k in range(7):
+        np.testing.assert_array_equal(ids_list[k], ids_list_3[k])
+
+
+if __name__ == '__main__':
+    test_ids_of_region()
@@ -0,0 +1,81 @@
+
+def test_image_pyramid():
+    import paicos as pa
+    import numpy as np
+    import os
+
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = np.array([398968.4, 211682.6, 629969.9]) * snap['0_Coordinates'].uq
+    widths = np.array([2000, 2000, 2000]) * snap['0_Coordinates'].uq
+
+    projector = pa.Projector(snap, center, widths, 'z', npix=128,
+                             make_snap_with_selection=False)
+
+    # Full image for comparison
+    full_image = projector.project_variable('0_Masses')
+
+    basedir = pa.data_dir + 'test_data/'
+    basename = 'test_image_pyramid'
+    filename = basedir + basename + '_247.hdf5'
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    pyramid = pa.ImagePyramid(projector, basedir, basename=basename, tile_size=32)
+    pyramid.build('0_Masses')
+
+    assert pyramid.num_levels == 3
+    assert pyramid.shapes == [(128, 128), (64, 64), (32, 32)]
+    # 16 + 4 + 1 tiles
+    assert pyramid.tiles_rendered == 21
+
+    # The projector is left unchanged
+    np.testing.assert_array_equal(projector.center.value, center.value)
+    np.testing.assert_array_equal(projector.widths.value, widths.value)
+    assert projector.npix == 128
+
+    level_0 = pyramid.get_level('0_Masses', 0)
+    assert level_0.unit == full_image.unit
+    np.testing.assert_allclose(level_0.value, full_image.value, rtol=1e-10,
+                               atol=1e-10 * np.max(full_image.value))
+
+    # Downsampling conserves the total mass
+    level_1 = pyramid.get_level('0_Masses', 1)
+    level_2 = pyramid.get_level('0_Masses', 2)
+    np.testing.assert_allclose(4 * np.sum(level_1.value), np.sum(level_0.value))
+    np.testing.assert_allclose(16 * np.sum(level_2.value), np.sum(level_0.value))
+
+    tile = pyramid.get_tile('0_Masses', 0, 1, 2)
+    np.testing.assert_array_equal(tile.value, level_0.value[32:64, 64:96])
+
+    # Nothing is rendered again for an existing pyramid
+    pyramid = pa.ImagePyramid(projector, basedir, basename=basename, tile_size=32)
+    pyramid.build('0_Masses')
+    assert pyramid.tiles_rendered == 0
+
+    # Only a finest-level tile with a missing hash is rendered again
+    import h5py
+    with h5py.File(filename, 'r+') as f:
+        f['0_Masses/level_0_tile_hashes'][2, 1] = b''
+    pyramid.build('0_Masses')
+    assert pyramid.tiles_rendered == 1
+    np.testing.assert_array_equal(pyramid.get_level('0_Masses', 0).value, level_0.value)
+
+    # Only tiles of a new variable are rendered
+    pyramid.build(snap['0_Masses'] * 2, name='2_times_masses')
+    assert pyramid.tiles_rendered == 21
+    np.testing.assert_allclose(pyramid.get_level('2_times_masses', 0).value,
+                               2 * level_0.value)
+
+    # The number of pixels must be a multiple of the tile size
+    try:
+        pa.ImagePyramid(projector, basedir, basename=basename, tile_size=48)
+        raise AssertionError('Expected a RuntimeError')
+    except RuntimeError:
+        pass
+
+
+if __name__ == '__main__':
+    test_image_pyramid()
@@ -0,0 +1,79 @@
+
+def test_movie_renderer():
+    import paicos as pa
+    import numpy as np
+    import os
+
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    uq = snap['0_Coordinates'].uq
+
+    center = np.array([398968.4, 211682.6, 629969.9])
+
+    # A camera path that zooms in while rotating the view
+    orientation = pa.Orientation(normal_vector=[0, 0, 1], perp_vector1=[1, 0, 0])
+    orientations = [orientation.copy]
+    orientation.rotate_around_perp_vector1(degrees=60)
+    orientations.append(orientation.copy)
+
+    centers = np.array([center, center + 200]) * uq
+    widths = np.array([[4000, 4000, 2000], [2000, 2000, 1000]]) * uq
+
+    renderer = pa.MovieRenderer(snap, centers, widths, orientations, npix=64,
+                                n_frames=5)
+    assert renderer.n_frames == 5
+
+    # The keyframes are the first and last frame
+    np.testing.assert_allclose(renderer.centers[-1], centers[-1].value)
+    np.testing.assert_allclose(renderer.widths[2], [np.sqrt(8) * 1000,
+                                                    np.sqrt(8) * 1000,
+                                                    np.sqrt(2) * 1000])
+    np.testing.assert_allclose(renderer.orientations[-1].normal_vector,
+                               orientations[-1].normal_vector, atol=1e-14)
+
+    basedir = pa.data_dir + 'test_data/'
+    filename = basedir + 'test_movie_247.hdf5'
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    renderer.render('0_Masses', basedir, basename='test_movie')
+    assert renderer.frames_rendered == 5
+
+    # Compare with the projector
+    for iframe in [0, 2, 4]:
+        projector = pa.Projector(snap, renderer.centers[iframe] * uq,
+                                 renderer.widths[iframe] * uq,
+                                 renderer.orientations[iframe], npix=64,
+                                 make_snap_with_selection=False)
+        image = projector.project_variable('0_Masses')
+        frame = renderer.get_frame('0_Masses', iframe)
+        assert frame.unit == image.unit
+        np.testing.assert_allclose(frame.value, image.value, rtol=1e-10,
+                                   atol=1e-10 * np.max(image.value))
+
+    # Nothing is rendered again when resuming
+    renderer.render('0_Masses', basedir, basename='test_movie')
+    assert renderer.frames_rendered == 0
+
+    # Render a new variable with two processes
+    renderer.render({'2_times_masses': 2 * snap['0_Masses']}, basedir,
+                    basename='test_movie', numprocesses=2)
+    assert renderer.frames_rendered == 5
+    for iframe in range(5):
+        np.testing.assert_allclose(renderer.get_frame('2_times_masses', iframe).value,
+                                   2 * renderer.get_frame('0_Masses', iframe).value)
+
+    # Resuming with a different camera path is not allowed
+    renderer = pa.MovieRenderer(snap, centers, widths, orientations, npix=64,
+                                n_frames=4)
+    try:
+        renderer.render('0_Masses', basedir, basename='test_movie')
+        raise AssertionError('Expected a RuntimeError')
+    except RuntimeError:
+        pass
+
+
+if __name__ == '__main__':
+    test_movie_renderer()
@@ -0,0 +1,44 @@
+
+def test_multi_view_projector():
+    import paicos as pa
+    import numpy as np
+
+    for use_units in [True, False]:
+        pa.use_units(use_units)
+
+        snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                           load_catalog=False)
+        center = np.array([398968.4, 211682.6, 629969.9])
+        widths = np.array([2000, 2000, 2000])
+        if use_units:
+            center = center * snap['0_Coordinates'].uq
+            widths = widths * snap['0_Coordinates'].uq
+
+        # x, y and z plus a fan of inclinations
+        directions = ['x', 'y', 'z']
+        orientation = pa.Orientation(normal_vector=[0, 0, 1], perp_vector1=[1, 0, 0])
+        for _ in range(3):
+            orientation.rotate_around_perp_vector1(degrees=30)
+            directions.append(orientation.copy)
+
+        multi_view_projector = pa.MultiViewProjector(snap, center, widths, directions,
+                                                     npix=128)
+        images = multi_view_projector.project_variable('0_Masses')
+        assert images.shape == (6, 128, 128)
+
+        for ii, direction in enumerate(directions):
+            projector = pa.Projector(snap, center, widths, direction, npix=128,
+                                     make_snap_with_selection=False)
+            image = projector.project_variable('0_Masses')
+            if use_units:
+                assert images.unit == image.unit
+                image = image.value
+                view = images[ii].value
+            else:
+                view = images[ii]
+            np.testing.assert_allclose(view, image, rtol=1e-10,
+                                       atol=1e-10 * np.max(image))
+
+
+if __name__ == '__main__':
+    test_multi_view_projector()
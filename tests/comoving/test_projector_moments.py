@@ -0,0 +1,54 @@
+
+def test_projector_moments():
+    import paicos as pa
+    import numpy as np
+
+    for use_units in [True, False]:
+        pa.use_units(use_units)
+
+        snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                           load_catalog=False)
+        center = np.array([398968.4, 211682.6, 629969.9])
+        widths = np.array([4000, 4000, 4000])
+        if use_units:
+            center = center * snap['0_Coordinates'].uq
+            widths = widths * snap['0_Coordinates'].uq
+
+        orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[1, -1, 0])
+
+        # A variable with a large mean compared to its dispersion
+        variable = 1e6 * snap['0_Density'][0] + snap['0_Density']
+
+        for Projector in [pa.Projector, pa.NestedProjector]:
+            for direction in ['x', orientation]:
+                projector = Projector(snap, center, widths, direction, npix=128)
+
+                mean, dispersion, weights = projector.project_moments(
+                    variable, '0_Masses', return_weights=True)
+
+                # Compare with separate projections (of the variable minus
+                # its mean in order to avoid catastrophic cancellation)
+                offset = 1e6 * snap['0_Density'][0]
+                masses = projector.project_variable('0_Masses')
+                mean_ref = projector.project_weighted(variable - offset, '0_Masses')
+                square_ref = projector.project_weighted((variable - offset)**2, '0_Masses')
+                dispersion_ref = np.sqrt(np.maximum(square_ref - mean_ref**2, 0 * square_ref))
+                mean_ref = mean_ref + offset
+
+                if use_units:
+                    assert mean.unit == variable.unit
+                    assert dispersion.unit == variable.unit
+                    mean, dispersion, weights = mean.value, dispersion.value, weights.value
+                    mean_ref, dispersion_ref = mean_ref.value, dispersion_ref.value
+                    masses = masses.value
+
+                np.testing.assert_allclose(weights, masses, rtol=1e-12)
+                np.testing.assert_array_equal(np.isnan(mean), np.isnan(mean_ref))
+                np.testing.assert_allclose(mean, mean_ref, rtol=1e-12)
+                np.testing.assert_allclose(dispersion, dispersion_ref, rtol=1e-6,
+                                           atol=1e-6 * np.nanmax(dispersion_ref))
+                assert np.nanmax(dispersion) > 0
+
+
+if __name__ == '__main__':
+    test_projector_moments()
@@ -0,0 +1,71 @@
+
+def test_projector_progressive(show=False):
+    """
+    We check that the progressive projection converges to the
+    projection with all the cells.
+    """
+    import paicos as pa
+    import numpy as np
+
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = np.array([398968.4, 211682.6, 629969.9]) * snap.length
+    widths = np.array([4000, 4000, 4000]) * snap.length
+
+    # The random ordering is stored and consistent with selections
+    keys = snap.get_random_order(0)
+    assert keys is snap.get_random_order(0)
+    assert keys.shape == (snap.npart[0],)
+    assert np.all((keys >= 0) & (keys < 1))
+    assert np.unique(keys).shape == keys.shape
+    for fraction in [0.01, 0.1, 0.5]:
+        assert abs(np.mean(keys < fraction) - fraction) < 0.01
+    index = snap['0_Density'] > np.median(snap['0_Density'])
+    np.testing.assert_array_equal(snap.select(index, parttype=0).get_random_order(0),
+                                  keys[index])
+    np.testing.assert_array_equal(pa.util.get_random_numbers_from_ids(np.arange(10)[index[:10]]),
+                                  keys[:10][index[:10]])
+
+    for Projector in [pa.Projector, pa.NestedProjector]:
+        for make_snap_with_selection in [True, False]:
+            projector = Projector(snap, center, widths, 'z', npix=128,
+                                  make_snap_with_selection=make_snap_with_selection)
+
+            n_cells = projector.pos.shape[0]
+            full_image = projector.project_variable('0_Masses')
+            area_per_pixel = projector.area_per_pixel
+
+            fractions = []
+            errors = []
+            for fraction, image in projector.iter_progressive('0_Masses',
+                                                              n_first=n_cells // 64):
+                assert image.unit == full_image.unit
+                fractions.append(fraction)
+                errors.append(np.mean(np.abs(image - full_image)) / np.mean(full_image))
+
+                # The mass is (approximately) conserved
+                mass_ratio = np.sum(image) / np.sum(full_image)
+                assert abs(mass_ratio - 1) < 0.1, (fraction, mass_ratio)
+
+                if show:
+                    import matplotlib.pyplot as plt
+                    plt.imshow(np.log10((image * area_per_pixel).value))
+                    plt.title(f'{100 * fraction:.1f}% of the cells')
+                    plt.show()
+
+            # Increasing fractions, the last image uses all the cells
+            assert len(fractions) == 4
+            assert np.all(np.diff(fractions) > 0)
+            assert fractions[0] < 0.05
+            assert fractions[-1] == 1.0
+            np.testing.assert_array_equal(image.value, full_image.value)
+
+            # The images converge
+            assert errors[-1] == 0
+            assert np.all(np.diff(errors) < 0), errors
+
+
+if __name__ == '__main__':
+    test_projector_progressive(True)
@@ -0,0 +1,84 @@
+
+def test_projector_reduce():
+    """
+    Test the reduce='max' and reduce='min' modes of the projectors.
+    """
+    import paicos as pa
+    import numpy as np
+
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = np.array([398968.4, 211682.6, 629969.9]) * snap.length
+    widths = np.array([2000, 2000, 2000]) * snap.length
+
+    # SPH projectors, compared with a brute force calculation
+    projector = pa.Projector(snap, center, widths, 'z', npix=64)
+    dens_max = projector.project_variable('0_Density', reduce='max')
+    dens_min = projector.project_variable('0_Density', reduce='min')
+    assert dens_max.unit == snap['0_Density'].unit
+
+    pos = projector.pos.value
+    density = snap['0_Density'][projector.index].value
+    pixel_size = projector.width.value / 64
+    x = (pos[:, 0] - (center[0] - widths[0] / 2).value) / pixel_size
+    y = (pos[:, 1] - (center[1] - widths[1] / 2).value) / pixel_size
+    h = np.maximum(projector.hsml.value / pixel_size, 1)
+    pixels = np.arange(64) + 0.5
+    brute_max = np.full((64, 64), -np.inf)
+    brute_min = np.full((64, 64), np.inf)
+    for ip in range(pos.shape[0]):
+        # Pixel centers inside the kernel (and inside the box of pixels
+        # looped over in the cython code)
+        r2 = (x[ip] - pixels[None, :])**2 + (y[ip] - pixels[:, None])**2
+        ih = int(h[ip]) + 1
+        in_box_x = np.abs(np.arange(64) - int(x[ip]) + 0.5) < ih
+        in_box_y = np.abs(np.arange(64) - int(y[ip]) + 0.5) < ih
+        inside = (r2 < h[ip]**2) * in_box_x[None, :] * in_box_y[:, None]
+        brute_max[inside] = np.maximum(brute_max[inside], density[ip])
+        brute_min[inside] = np.minimum(brute_min[inside], density[ip])
+    brute_max[np.isinf(brute_max)] = np.nan
+    brute_min[np.isinf(brute_min)] = np.nan
+
+    np.testing.assert_array_equal(dens_max.value, brute_max)
+    np.testing.assert_array_equal(dens_min.value, brute_min)
+
+    orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[0, 0, 1])
+    for Projector in [pa.Projector, pa.NestedProjector]:
+        projector = Projector(snap, center, widths, orientation, npix=64)
+        dens_max = projector.project_variable('0_Density', reduce='max')
+        dens_min = projector.project_variable('0_Density', reduce='min')
+        dens_mean = projector.project_weighted('0_Density', '0_Masses')
+        finite = np.isfinite(dens_mean.value)
+        assert np.all(dens_max[finite] >= dens_mean[finite] * (1 - 1e-12))
+        assert np.all(dens_min[finite] <= dens_mean[finite] * (1 + 1e-12))
+
+    # Tree-based projectors
+    for direction in ['x', orientation]:
+        full = pa.TreeProjector(snap, center, widths, direction, npix=32)
+        streamed = pa.TreeProjector(snap, center, widths, direction, npix=32,
+                                    low_memory=True, depth_slab=7)
+        compact = pa.TreeProjector(snap, center, widths, direction, npix=32,
+                                   low_memory=True, use_compact_index=True)
+        variable = snap['0_Density']
+        for reduce, func in [('max', np.max), ('min', np.min)]:
+            expected = func(variable[full.index], axis=2)
+            for tree_projector in [full, streamed, compact]:
+                result = tree_projector.project_variable('0_Density', reduce=reduce)
+                assert result.unit == variable.unit
+                np.testing.assert_array_equal(result.value, expected.value)
+
+        cpu_projector = pa.CpuRayProjector(snap, center, widths, direction,
+                                           npix=32, tol=0.25)
+        dens_mean = cpu_projector.project_variable('0_Density')
+        dens_max = cpu_projector.project_variable('0_Density', reduce='max')
+        dens_min = cpu_projector.project_variable('0_Density', reduce='min')
+        assert dens_max.unit == dens_mean.unit
+        assert np.all(dens_max >= dens_mean * (1 - 1e-12))
+        assert np.all(dens_min <= dens_mean * (1 + 1e-12))
+        assert np.max(dens_max / func(variable[full.index], axis=2)) > 0.99
+
+
+if __name__ == '__main__':
+    test_projector_reduce()
@@ -0,0 +1,50 @@
+
+def test_projector_reselection():
+    import paicos as pa
+    import numpy as np
+
+    for use_units in [True, False]:
+        pa.use_units(use_units)
+
+        snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                           load_catalog=False)
+        center = np.array([398968.4, 211682.6, 629969.9])
+        widths = np.array([4000, 4000, 4000])
+        if use_units:
+            center = center * snap['0_Coordinates'].uq
+            widths = widths * snap['0_Coordinates'].uq
+
+        orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[1, -1, 0])
+
+        for direction in ['z', orientation]:
+            projector = pa.Projector(snap, center, widths, direction, npix=128,
+                                     make_snap_with_selection=False)
+            superset_ids = projector._superset_ids
+
+            def check(projector):
+                image = projector.project_variable('0_Masses')
+                new_projector = pa.Projector(snap, projector.center, projector.widths,
+                                             projector.orientation, npix=128,
+                                             make_snap_with_selection=False)
+                new_image = new_projector.project_variable('0_Masses')
+                if use_units:
+                    image = image.value
+                    new_image = new_image.value
+                np.testing.assert_array_equal(image, new_image)
+                np.testing.assert_array_equal(projector.index, new_projector.index)
+
+            # Zoom in and pan within the superset region
+            projector.zoom(2)
+            check(projector)
+            projector.move_center_along_perp_vector1(projector.width / 2)
+            check(projector)
+            assert projector._superset_ids is superset_ids
+
+            # Moving far away requires a new selection
+            projector.move_center_along_perp_vector2(4 * projector.height)
+            check(projector)
+            assert projector._superset_ids is not superset_ids
+
+
+if __name__ == '__main__':
+    test_projector_reselection()
@@ -0,0 +1,54 @@
+
+def test_projector_vector():
+    import paicos as pa
+    import numpy as np
+
+    for use_units in [True, False]:
+        pa.use_units(use_units)
+
+        snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                           load_catalog=False)
+        center = np.array([398968.4, 211682.6, 629969.9])
+        widths = np.array([4000, 4000, 4000])
+        if use_units:
+            center = center * snap['0_Coordinates'].uq
+            widths = widths * snap['0_Coordinates'].uq
+
+        orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[1, -1, 0])
+
+        for Projector in [pa.Projector, pa.NestedProjector]:
+            for direction in ['y', 'z', orientation]:
+                projector = Projector(snap, center, widths, direction, npix=128)
+                unit_vectors = projector.orientation.cartesian_unit_vectors
+
+                # A vector field (the test data has no velocities)
+                vectors = snap['0_Coordinates'] - center[None, :]
+
+                images = projector.project_vector(vectors)
+                mean_images, masses = projector.project_vector(vectors, '0_Masses',
+                                                               return_weights=True)
+
+                # Compare with projections of the components
+                for ii, key in enumerate(['x', 'y', 'z']):
+                    component = np.sum(vectors * unit_vectors[key][None, :], axis=1)
+                    image = projector.project_variable(component)
+                    mean_image = projector.project_weighted(component, '0_Masses')
+
+                    if use_units:
+                        assert images[ii].unit == image.unit
+                        assert mean_images[ii].unit == mean_image.unit
+                        image, mean_image = image.value, mean_image.value
+
+                    scale = np.max(np.abs(image))
+                    np.testing.assert_allclose(np.array(images[ii]), image, rtol=1e-10,
+                                               atol=1e-12 * scale)
+                    scale = np.nanmax(np.abs(mean_image))
+                    np.testing.assert_allclose(np.array(mean_images[ii]), mean_image,
+                                               rtol=1e-10, atol=1e-12 * scale)
+
+                np.testing.assert_array_equal(np.array(masses),
+                                              np.array(projector.project_variable('0_Masses')))
+
+
+if __name__ == '__main__':
+    test_projector_vector()
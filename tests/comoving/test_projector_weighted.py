@@ -0,0 +1,44 @@
+
+def test_projector_weighted():
+    import paicos as pa
+    import numpy as np
+
+    for use_units in [True, False]:
+        pa.use_units(use_units)
+
+        snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                           load_catalog=False)
+        center = np.array([398968.4, 211682.6, 629969.9])
+        widths = np.array([4000, 4000, 4000])
+        if use_units:
+            center = center * snap['0_Coordinates'].uq
+            widths = widths * snap['0_Coordinates'].uq
+
+        orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[1, -1, 0])
+
+        for Projector in [pa.Projector, pa.NestedProjector]:
+            for direction in ['x', 'z', orientation]:
+                projector = Projector(snap, center, widths, direction, npix=128)
+
+                image, weights = projector.project_weighted('0_Density', '0_Masses',
+                                                            return_weights=True)
+
+                # Compare with the ratio of two projections
+                masses = projector.project_variable('0_Masses')
+                weighted = projector.project_variable(snap['0_Masses'] * snap['0_Density'])
+                if use_units:
+                    assert image.unit == snap['0_Density'].unit
+                    assert weights.unit == masses.unit
+                    image, weights = image.value, weights.value
+                    masses, weighted = masses.value, weighted.value
+
+                np.testing.assert_array_equal(weights, masses)
+                # Pixels without weight are nan (as in project_weighted)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    ref = weighted / masses
+                np.testing.assert_allclose(image, ref, rtol=1e-12)
+                assert np.sum(np.isfinite(image)) > 0
+
+
+if __name__ == '__main__':
+    test_projector_weighted()
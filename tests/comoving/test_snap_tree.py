@@ -0,0 +1,56 @@
+
+
+def test_snap_tree():
+    """
+    Check that image creators using the tree cached on the snapshot
+    give the same results as the ones constructing their own trees.
+    """
+    import paicos as pa
+    import numpy as np
+
+    for use_units in [False, True]:
+        pa.use_units(use_units)
+
+        snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                           load_catalog=False)
+        center = np.array([398968.4, 211682.6, 629969.9])
+        if use_units:
+            center = center * snap.length
+
+        slicer = pa.Slicer(snap, center, [2000, 2000, 0.0], 'z', npix=128)
+        tree_slicer = pa.Slicer(snap, center, [2000, 2000, 0.0], 'z', npix=128,
+                                use_snap_tree=True)
+
+        tree = snap.get_tree(0)
+
+        for _ in range(3):
+            np.testing.assert_array_equal(slicer.slice_variable('0_Density'),
+                                          tree_slicer.slice_variable('0_Density'))
+
+            shift = 100.0
+            if use_units:
+                shift = shift * snap.length
+            slicer.move_center_along_perp_vector1(shift)
+            tree_slicer.move_center_along_perp_vector1(shift)
+
+        # The tree has not been reconstructed
+        assert snap.get_tree(0) is tree
+
+        projector = pa.TreeProjector(snap, center, [1000, 1000, 1000], 'x', npix=64)
+        tree_projector = pa.TreeProjector(snap, center, [1000, 1000, 1000], 'x', npix=64,
+                                          use_snap_tree=True)
+
+        np.testing.assert_array_equal(projector.project_variable('0_Density', additive=False),
+                                      tree_projector.project_variable('0_Density',
+                                                                      additive=False))
+        assert snap.get_tree(0) is tree
+
+        # Replacing the coordinates invalidates the tree
+        snap.remove_data(0, 'Coordinates')
+        assert snap.get_tree(0) is not tree
+
+    pa.use_units(True)
+
+
+if __name__ == '__main__':
+    test_snap_tree()
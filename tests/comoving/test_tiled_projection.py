@@ -0,0 +1,78 @@
+
+def test_tiled_projection():
+    import paicos as pa
+    import numpy as np
+    import h5py
+
+    for use_units in [True, False]:
+        pa.use_units(use_units)
+
+        snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                           load_catalog=False)
+        center = np.array([398968.4, 211682.6, 629969.9])
+        square_widths = np.array([2000, 2000, 2000])
+        # Non-square images (width != height) for all the directions
+        rectangular_widths = np.array([2000, 1500, 1000])
+        if use_units:
+            center = center * snap['0_Coordinates'].uq
+            square_widths = square_widths * snap['0_Coordinates'].uq
+            rectangular_widths = rectangular_widths * snap['0_Coordinates'].uq
+
+        orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[1, -1, 0])
+
+        for direction, widths in [('x', square_widths), ('y', square_widths),
+                                  ('z', square_widths), (orientation, square_widths),
+                                  ('z', rectangular_widths),
+                                  (orientation, rectangular_widths)]:
+            for Projector in [pa.Projector, pa.NestedProjector]:
+                projector = Projector(snap, center, widths, direction, npix=128,
+                                      make_snap_with_selection=False)
+
+                image = projector.project_variable('0_Masses')
+
+                image_file = pa.ArepoImage(projector, pa.data_dir + 'test_data/',
+                                           basename='test_tiled_projection')
+                projector.project_variable_tiled('0_Masses', image_file, tile_size=32)
+                image_file.finalize()
+
+                with h5py.File(image_file.filename, 'r') as f:
+                    tiled_image = f['0_Masses'][...]
+                    assert f['0_Masses'].chunks == (32, 32)
+                    if use_units:
+                        assert f['0_Masses'].attrs['unit'] == image.unit.to_string()
+
+                if use_units:
+                    image = image.value
+
+                assert tiled_image.shape == image.shape
+                np.testing.assert_allclose(tiled_image, image, rtol=1e-10,
+                                           atol=1e-10 * np.max(image))
+
+                # The tile cache is removed when a generator is abandoned
+                tiles = projector.iter_tiles('0_Masses', tile_size=32)
+                next(tiles)
+                tiles.close()
+                assert not hasattr(projector, '_tile_cache')
+
+                if Projector is pa.NestedProjector:
+                    # The nested grids require tile sizes that are powers of two
+                    try:
+                        list(projector.iter_tiles('0_Masses', tile_size=48))
+                        raise AssertionError('Expected a RuntimeError')
+                    except RuntimeError:
+                        pass
+                    continue
+
+                # Tiles that do not fit the image are cropped
+                tiles = list(projector.iter_tiles('0_Masses', tile_size=48))
+                npix_height, npix_width = image.shape
+                assert len(tiles) == int(np.ceil(npix_height / 48)) * 3
+                index, tile = tiles[-1]
+                assert tile.shape == ((npix_height - 1) % 48 + 1, 32)
+                tile = tile.value if use_units else tile
+                np.testing.assert_allclose(tile, image[index], rtol=1e-10,
+                                           atol=1e-10 * np.max(image))
+
+
+if __name__ == '__main__':
+    test_tiled_projection()
@@ -0,0 +1,51 @@
+
+
+def test_tree_projector_low_memory():
+    """
+    Compare TreeProjector projections with and without storing
+    the full index.
+    """
+    import paicos as pa
+    import numpy as np
+
+    pa.use_units(True)
+
+    snap = pa.Snapshot(pa.data_dir, 247, basename='reduced_snap',
+                       load_catalog=False)
+    center = np.array([398968.4, 211682.6, 629969.9]) * snap.length
+    widths = np.array([1000, 1000, 1000]) * snap.length
+
+    orientation = pa.Orientation(normal_vector=[1, 1, 0], perp_vector1=[0, 0, 1])
+
+    for direction in ['x', orientation]:
+        full = pa.TreeProjector(snap, center, widths, direction, npix=64)
+        streamed = pa.TreeProjector(snap, center, widths, direction, npix=64,
+                                    low_memory=True, depth_slab=7)
+        compact = pa.TreeProjector(snap, center, widths, direction, npix=64,
+                                   low_memory=True, use_compact_index=True)
+
+        assert streamed.index is None
+        assert compact.compact_index['cell'].shape[0] < full.index.size
+
+        variables = ['0_Masses', '0_Density']
+        additive = [True, False]
+        full_proj = full.project_variables(variables, additive=additive)
+        streamed_proj = streamed.project_variables(variables, additive=additive)
+        compact_proj = compact.project_variables(variables, additive=additive)
+
+        for ii in range(len(variables)):
+            assert full_proj[ii].unit == streamed_proj[ii].unit
+            assert full_proj[ii].unit == compact_proj[ii].unit
+            np.testing.assert_allclose(full_proj[ii].value, streamed_proj[ii].value,
+                                       rtol=1e-12)
+            np.testing.assert_allclose(full_proj[ii].value, compact_proj[ii].value,
+                                       rtol=1e-12)
+
+        # Single variable interface
+        V = full.project_variable('0_Volume', additive=True)
+        V_streamed = streamed.project_variable('0_Volume', additive=True)
+        np.testing.assert_allclose(V.value, V_streamed.value, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    test_tree_projector_low_memory()